@@ -0,0 +1,136 @@
+import heapq
+import json
+import math
+import os
+import threading
+
+
+# ============================================================
+# NEAREST RENTAL AIRPORT (bundled table + KD-tree)
+# ============================================================
+# airports.json lists airports with car-rental counters. Each airport is
+# stored as a point on the unit sphere (x, y, z) in a 3-d KD-tree, so
+# straight-line distance orders airports exactly like great-circle
+# distance and there is no special case for the antimeridian or poles.
+# A k-nearest query over a few hundred airports visits a handful of nodes
+# and takes tens of microseconds.
+
+AIRPORTS_PATH = os.getenv(
+    "AIRPORTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "airports.json"),
+)
+# Towns further than this from every airport are left unresolved
+NEAREST_AIRPORT_MAX_KM = float(os.getenv("NEAREST_AIRPORT_MAX_KM", "150"))
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _unit(lat, lon):
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+class Airport:
+    __slots__ = ("iata", "name", "lat", "lon")
+
+    def __init__(self, iata, name, lat, lon):
+        self.iata = iata
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+
+    def __repr__(self):
+        return f"Airport({self.iata!r}, {self.name!r})"
+
+
+class AirportIndex:
+    """k-nearest airports to a (lat, lon)"""
+
+    def __init__(self, airports):
+        self.airports = list(airports)
+        points = [(_unit(a.lat, a.lon), a) for a in self.airports]
+        self._root = self._build(points, 0)
+
+    @classmethod
+    def load(cls, path=AIRPORTS_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        fields = data["fields"]
+        order = [fields.index(f) for f in ("iata", "name", "lat", "lon")]
+        return cls(Airport(*[row[i] for i in order]) for row in data["airports"])
+
+    def __len__(self):
+        return len(self.airports)
+
+    # node = (point, airport, axis, left, right)
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        point, airport = points[mid]
+        return (
+            point, airport, axis,
+            self._build(points[:mid], depth + 1),
+            self._build(points[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """-> [(Airport, km), ...] closest first, at most k, within max_km"""
+        if k <= 0 or self._root is None:
+            return []
+
+        target = _unit(lat, lon)
+        limit = _km_to_chord(max_km) ** 2 if max_km is not None else float("inf")
+        best = []  # max-heap of (-squared_chord, tiebreak, airport)
+
+        stack = [(self._root, 0.0)]  # (node, lower bound on its squared distance)
+        while stack:
+            node, floor = stack.pop()
+            if node is None or floor > (limit if len(best) < k else min(limit, -best[0][0])):
+                continue
+            point, airport, axis, left, right = node
+
+            d2 = sum((p - t) ** 2 for p, t in zip(point, target))
+            if d2 <= limit:
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, id(airport), airport))
+                elif d2 < -best[0][0]:
+                    heapq.heapreplace(best, (-d2, id(airport), airport))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # far side first so the near side is popped (and tightens `best`) first
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+
+        return [(a, round(_chord_to_km(math.sqrt(-d2)), 1)) for d2, _, a in sorted(best, reverse=True)]
+
+
+# ============================================================
+# SHARED INSTANCE (loaded on first use)
+# ============================================================
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_index():
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = AirportIndex.load()
+    return _default
+
+
+def nearest(lat, lon, k=1, max_km=NEAREST_AIRPORT_MAX_KM):
+    return get_index().nearest(lat, lon, k=k, max_km=max_km)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+# ============================================================
+# AMADEUS TOKEN MANAGER
+# ============================================================
+class AmadeusTokenManager:
+    """Caches the Amadeus OAuth token and refreshes it before it expires.
+
+    `fetch` is a callable returning (access_token, expires_in_seconds).
+    A background thread renews the token `refresh_margin` seconds before
+    expiry, so request threads normally just read the cached value. When
+    no valid token exists (cold start, after a 401) exactly one caller
+    fetches and every other caller waits for that result.
+    """
+
+    def __init__(self, fetch, refresh_margin=300, retry_delay=10):
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+
+        self._token = None
+        self._expires_at = 0.0
+        self._fetching = False
+        self._error = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # ---------------- public ----------------
+    def get(self):
+        with self._cond:
+            if self._valid():
+                return self._token
+        return self._refresh()
+
+    def peek(self):
+        """Cached token if still valid, else None (never blocks on a fetch)"""
+        with self._cond:
+            return self._token if self._valid() else None
+
+    def invalidate(self, token):
+        """Drop `token` (e.g. after a 401) unless it was already replaced"""
+        with self._cond:
+            if token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+
+    def start(self):
+        """Start the background refresher (idempotent)"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="amadeus-token", daemon=True)
+            self._thread.start()
+
+    # ---------------- internals ----------------
+    def _valid(self):
+        return self._token is not None and time.time() < self._expires_at
+
+    def _refresh(self):
+        """Single-flight fetch: one thread calls the API, the rest wait"""
+        with self._cond:
+            if self._fetching:
+                while self._fetching:
+                    self._cond.wait()
+                if self._valid():
+                    return self._token
+                if self._error is not None:
+                    raise self._error
+            self._fetching = True
+            self._error = None
+
+        token, error = None, None
+        try:
+            token, expires_in = self._fetch()
+        except Exception as e:
+            error = e
+
+        with self._cond:
+            self._fetching = False
+            if error is None and token:
+                self._token = token
+                self._expires_at = time.time() + float(expires_in)
+            else:
+                self._error = error or RuntimeError("Amadeus returned no access_token")
+            self._cond.notify_all()
+            if self._error is not None:
+                raise self._error
+            return self._token
+
+    def _run(self):
+        while True:
+            try:
+                self._refresh()
+            except Exception as e:
+                print("Amadeus token refresh failed:", e)
+                time.sleep(self.retry_delay)
+                continue
+
+            with self._cond:
+                wait = self._expires_at - time.time() - self.refresh_margin
+            time.sleep(max(wait, self.retry_delay))
@@ -1,8 +1,30 @@
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
 
+import airports
+import gazetteer
+import metrics
+import providers
+import query_plan
+from amadeus_auth import AmadeusTokenManager
+from capture import TrafficCapture
+from car_parser import CarResultsParser
+from circuit import ProviderUnavailable
+from deadline import BackgroundSearches, Deadline
+from geocache import GEOCODE_DB_PATH, GeocodeCache, geoapify_fetch
+from imagecache import ImageCache
+from offers import FlightOffer, HotelOffer
+from option_store import OptionStore
+from prefetch import Prefetcher
+from ranking import CAR_WEIGHTS, FLIGHT_WEIGHTS, HOTEL_WEIGHTS, top_k
+from result_cache import SWRCache, TTLCache
+from singleflight import SingleFlight
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -18,8 +40,8 @@ BOOKING_API_HOST = os.getenv("BOOKING_API_HOST")
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 
 CAR_API_HOST = os.getenv("CAR_API_HOST", "priceline-com-provider.p.rapidapi.com").strip()
-CAR_API_URL = f"https://{CAR_API_HOST}/v2/cars/resultsRequest"
-GEO_API_KEY = os.getenv("GEO_API_KEY")
+CAR_API_URL = providers.url("priceline", "/v2/cars/resultsRequest")
+CAR_MAX_RESPONSE_BYTES = int(os.getenv("CAR_MAX_RESPONSE_BYTES", str(4 * 1024 * 1024)))
 
 
 
@@ -27,16 +49,136 @@ GEO_API_KEY = os.getenv("GEO_API_KEY")
 
 
 # ------------------ AMADEUS FLIGHT URLS ---------------------
-TOKEN_URL = "https://test.api.amadeus.com/v1/security/oauth2/token"
-FLIGHT_URL = "https://test.api.amadeus.com/v2/shopping/flight-offers"
+TOKEN_URL = providers.url("amadeus", "/v1/security/oauth2/token")
+FLIGHT_URL = providers.url("amadeus", "/v2/shopping/flight-offers")
+
+
+# ------------------ RESULT CACHES ---------------------------
+# Each cache also keeps the last good result per search for LAST_GOOD_TTL,
+# served (labelled as possibly stale) while that provider's circuit is open
+LAST_GOOD_SIZE = int(os.getenv("LAST_GOOD_SIZE", "2048"))
+LAST_GOOD_TTL = int(os.getenv("LAST_GOOD_TTL", str(24 * 3600)))
+
+
+def last_good_cache():
+    return TTLCache(maxsize=LAST_GOOD_SIZE, ttl=LAST_GOOD_TTL)
+
+
+flight_cache = TTLCache(
+    maxsize=int(os.getenv("FLIGHT_CACHE_SIZE", "512")),
+    ttl=int(os.getenv("FLIGHT_CACHE_TTL", "300")),
+    last_good=last_good_cache(),
+)
+
+hotel_cache = SWRCache(
+    maxsize=int(os.getenv("HOTEL_CACHE_SIZE", "256")),
+    fresh_ttl=int(os.getenv("HOTEL_CACHE_FRESH_TTL", "600")),
+    stale_ttl=int(os.getenv("HOTEL_CACHE_STALE_TTL", "3600")),
+    last_good=last_good_cache(),
+)
+
+# Hotel pages are cached per budget ceiling (query_plan.hotel_filters).
+# This keeps the last page fetched for each search under any budget, so
+# the circuit-open fallback still has something when this budget's own
+# pages were never fetched (the local budget filter still applies).
+hotel_any_budget = last_good_cache()
+
+car_cache = SWRCache(
+    maxsize=int(os.getenv("CAR_CACHE_SIZE", "256")),
+    fresh_ttl=int(os.getenv("CAR_CACHE_FRESH_TTL", "300")),
+    stale_ttl=int(os.getenv("CAR_CACHE_STALE_TTL", "1800")),
+    last_good=last_good_cache(),
+)
+
+# ------------------ SEARCHES (see deadline.py) --------------
+# A search that misses the Dialogflow reply deadline keeps running; the
+# next turn with the same query picks it up instead of starting over.
+searches = BackgroundSearches()
 
+# Concurrent cache misses for the same flight query, hotel page or car
+# search share one upstream call
+inflight = SingleFlight()
 
-cached_token = None
+
+# ------------------ OPTION STORE (see option_store.py) -----
+# Search turns keep their ranked options server-side; the session only
+# carries a handle per vertical
+option_store = OptionStore()
+
+# ------------------ IMAGE PROXY (see imagecache.py) ---------
+# Off unless IMAGE_PROXY_BASE is set; cards then keep the CDN URLs
+images = ImageCache()
+
+# ------------------ PREFETCH (see prefetch.py) --------------
+# Hotel and car searches queued in the background once a flight is picked
+prefetcher = Prefetcher()
+
+# ------------------ TRAFFIC CAPTURE (see capture.py) --------
+# Off unless TRAFFIC_CAPTURE_PATH is set
+traffic = TrafficCapture()
 
 
 # ============================================================
 # HELPERS
 # ============================================================
+# Select turn whose options handle no longer resolves (expired, or stored
+# by another worker without a shared OPTION_STORE_PATH)
+OPTIONS_EXPIRED = "⌛ Those options expired, please search again."
+
+
+def selected_option(params, ref_param, legacy_prefix, n):
+    """n-th (1-based) option of the session's last search, as a to_option() dict, or None.
+
+    Sessions that started before the option store still carry the options
+    as flat "<legacy_prefix>_<n>_<field>" parameters.
+    """
+    options = option_store.get(params.get(ref_param)) or []
+    if 1 <= n <= len(options):
+        return options[n - 1]
+
+    prefix = f"{legacy_prefix}_{n}_"
+    return {k[len(prefix):]: v for k, v in params.items() if k.startswith(prefix)} or None
+
+
+def run_search(part, search, query, deadline=None):
+    """search(**query) under the turn's deadline -> (done, result)"""
+    deadline = deadline or Deadline()
+    key = (part, tuple(sorted(query.items())))
+    return searches.run(key, lambda: search(**query, deadline=deadline), deadline)
+
+
+def fetch_once(part, cache, key, fetch):
+    """Cache miss -> fetch(), shared with concurrent identical misses; usable results are cached"""
+    def run():
+        value = fetch()
+        if value is not None:
+            cache.set(key, value)
+        return value
+
+    return inflight.do((part, key), run)
+
+
+def still_searching(part, icon="⏳"):
+    return f"{icon} Still searching {part}... ask me again in a moment to see them."
+
+
+def searching_reply(part, cached, build_reply):
+    """Search still running at the deadline -> the last good answer, if any, then the still-searching line"""
+    if cached is None:
+        return still_searching(part), {}
+    reply, details = build_reply(cached)
+    return (
+        "🕒 Here are earlier results while a fresh search finishes (they may be out of date):\n\n"
+        f"{reply}\n\n{still_searching(part)}"
+    ), details
+
+
+def possibly_stale(result):
+    """(reply, details) served from the last good cache -> same, with a warning"""
+    reply, details = result
+    return "⚠️ The provider isn't responding right now, so these are earlier results and may be out of date.\n\n" + reply, details
+
+
 def normalize_date(obj):
     """Convert Dialogflow CX date object to YYYY-MM-DD"""
     if isinstance(obj, dict):
@@ -47,31 +189,37 @@ def normalize_date(obj):
     return obj
 
 
-CITY_TO_IATA = {
-    "paris": "PAR", "tokyo": "TYO", "madrid": "MAD", "london": "LON",
-    "dubai": "DXB", "new york": "NYC", "dallas": "DFW", "los angeles": "LAX",
-    "san francisco": "SFO", "toronto": "YYZ", "sydney": "SYD",
-    "delhi": "DEL", "mumbai": "BOM", "york": "NYC"
-}
-
-
 def city_to_iata(city):
-    return CITY_TO_IATA.get(city.lower(), city[:3].upper())
-
+    """City -> IATA code for Amadeus (metro code like NYC where one exists)"""
+    if not city:
+        return None
+    place = gazetteer.lookup(city)
+    if place:
+        return place.metro or place.airport
+    return city[:3].upper()
 
-def get_amadeus_token():
-    global cached_token
-    if cached_token:
-        return cached_token
 
+def fetch_amadeus_token():
+    """POST client credentials -> (access_token, expires_in)"""
     data = {
         "grant_type": "client_credentials",
         "client_id": AMADEUS_API_KEY,
         "client_secret": AMADEUS_API_SECRET
     }
-    res = requests.post(TOKEN_URL, data=data)
-    cached_token = res.json().get("access_token")
-    return cached_token
+    res = providers.post("amadeus", TOKEN_URL, data=data)
+    res.raise_for_status()
+    body = providers.json_body("amadeus", res)
+    return body.get("access_token"), body.get("expires_in", 1799)
+
+
+amadeus_tokens = AmadeusTokenManager(
+    fetch_amadeus_token,
+    refresh_margin=int(os.getenv("AMADEUS_TOKEN_REFRESH_MARGIN", "300")),
+)
+
+
+def get_amadeus_token():
+    return amadeus_tokens.get()
 
 def normalize_time(obj):
     if isinstance(obj, dict):
@@ -88,17 +236,78 @@ def normalize_time(obj):
 
 def offer_has_layover_city(offer, layover_iata):
     """Returns True if any intermediate segment arrives at layover_iata"""
-    try:
-        segments = offer["itineraries"][0]["segments"]
-        for seg in segments[:-1]:  # exclude final arrival
-            if seg["arrival"]["iataCode"] == layover_iata:
-                return True
-    except Exception:
-        return False
-    return False
+    return layover_iata in offer.stops
+
 
+def search_flight_offers(origin, destination, date, cabin, currency="USD", max_results=None, non_stop=False,
+                         deadline=None):
+    """Amadeus flight-offers search, cached on the normalized query.
 
-def handle_flight_options(params):
+    Returns a list of FlightOffer. Layover filtering and formatting happen
+    on the cached list, so retries and repeat routes never hit Amadeus.
+    """
+    key = (origin, destination, date, cabin, currency, max_results, non_stop)
+    offers = flight_cache.get(key)
+    if offers is not None:
+        return offers
+
+    return fetch_once(
+        "flights", flight_cache, key,
+        lambda: fetch_flight_offers(origin, destination, date, cabin, currency, max_results, non_stop, deadline),
+    )
+
+
+def fetch_flight_offers(origin, destination, date, cabin, currency="USD", max_results=None, non_stop=False,
+                        deadline=None):
+    """One Amadeus flight-offers call -> FlightOffer list (non-200 raises HTTPError)"""
+    token = get_amadeus_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    query = flight_search_query(origin, destination, date, cabin, currency, max_results, non_stop)
+
+    res = providers.get("amadeus", FLIGHT_URL, headers=headers, params=query, deadline=deadline)
+
+    # Token revoked/expired early -> fetch a fresh one and retry once
+    if res.status_code == 401:
+        amadeus_tokens.invalidate(token)
+        headers = {"Authorization": f"Bearer {get_amadeus_token()}"}
+        res = providers.get("amadeus", FLIGHT_URL, headers=headers, params=query, deadline=deadline)
+
+    # Error replies have no offers to parse (and may not be JSON)
+    if res.status_code != 200:
+        raise requests.HTTPError(f"Amadeus returned {res.status_code}", response=res)
+
+    return flight_offers_from_payload(providers.json_body("amadeus", res))
+
+
+def cached_flight_offers(origin, destination, date, cabin, currency="USD", max_results=None, non_stop=False):
+    """Last good offers for this search, however old (circuit-open fallback)"""
+    return flight_cache.last_good((origin, destination, date, cabin, currency, max_results, non_stop))
+
+
+def flight_search_query(origin, destination, date, cabin, currency="USD", max_results=None, non_stop=False):
+    query = {
+        "originLocationCode": origin,
+        "destinationLocationCode": destination,
+        "departureDate": date,
+        "adults": 1,
+        "travelClass": cabin,
+        "currencyCode": currency
+    }
+    # Pushed-down limits (query_plan.flight_plan)
+    if max_results:
+        query["max"] = max_results
+    if non_stop:
+        query["nonStop"] = "true"
+    return query
+
+
+def flight_offers_from_payload(data):
+    offers = [FlightOffer.from_amadeus(o) for o in data.get("data", [])]
+    return [o for o in offers if o is not None]
+
+
+def flight_query(params):
+    """Session params -> (search kwargs, None) or (None, reply asking for what's missing)"""
     departure_city = city_to_iata(params.get("departure_city"))
 
     # ⚠️ IMPORTANT: if your CX param is destination-city, use that key instead
@@ -108,30 +317,54 @@ def handle_flight_options(params):
     travel_class = (params.get("flight_class") or "ECONOMY").upper()
 
     if not departure_city or not destination_city or not departure_date:
-        return "I need your departure city, destination city, and travel date.", {}
+        return None, "I need your departure city, destination city, and travel date."
 
-    token = get_amadeus_token()
-    headers = {"Authorization": f"Bearer {token}"}
+    return {
+        "origin": departure_city,
+        "destination": destination_city,
+        "date": departure_date,
+        "cabin": travel_class,
+        **query_plan.flight_plan(params.get("layover_city")),
+    }, None
 
-    query = {
-        "originLocationCode": departure_city,
-        "destinationLocationCode": destination_city,
-        "departureDate": departure_date,
-        "adults": 1,
-        "travelClass": travel_class,
-        "currencyCode": "USD"
-    }
 
-    res = requests.get(FLIGHT_URL, headers=headers, params=query)
-    data = res.json()
+def handle_flight_options(params, deadline=None):
+    query, missing = flight_query(params)
+    if missing:
+        return missing, {}
+
+    try:
+        done, offers = run_search("flights", search_flight_offers, query, deadline)
+    except ProviderUnavailable as e:
+        offers = cached_flight_offers(**query)
+        if offers is None:
+            return f"Flight search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(flight_options_reply(params, offers))
+    except requests.HTTPError as e:
+        return f"Flight search failed ({e.response.status_code}). Try again.", {}
+    except requests.RequestException as e:
+        return f"Flight search failed (network). {e}", {}
+    except Exception as e:
+        return f"Flight search failed. {e}", {}
+    if not done:
+        return searching_reply("flights", cached_flight_offers(**query), lambda offers: flight_options_reply(params, offers))
+
+    return flight_options_reply(params, offers)
+
 
-    offers = data.get("data", [])
+def flight_options_reply(params, offers):
+    """Searched offers -> (reply, {"flight_options_ref": handle})"""
     if not offers:
         return "Sorry, I couldn't find any flights. Try different details? Yes to retry flight search, Start Over to go to main menu or exit", {}
 
     # ✅ FILTER BY LAYOVER IF PROVIDED
     layover_city = params.get("layover_city")
-    if layover_city:
+    if query_plan.wants_direct(layover_city):
+        # Normally a no-op: nonStop=true already went to Amadeus
+        offers = [o for o in offers if not o.stops]
+        if not offers:
+            return "Sorry, I couldn’t find direct flights. Do you want to try a layover city or see all flights?", {}
+    elif layover_city:
         layover_iata = city_to_iata(layover_city)
         offers = [o for o in offers if offer_has_layover_city(o, layover_iata)]
 
@@ -142,59 +375,41 @@ def handle_flight_options(params):
                 {}
             )
 
-    flights = offers[:3]
+    flights = top_k(offers, 3, FLIGHT_WEIGHTS)
 
     reply = "✈️ **Best Flight Options:**\n\n"
-    option_details = {}
 
     for idx, offer in enumerate(flights, start=1):
-        price = offer["price"]["total"]
-        airline = offer.get("validatingAirlineCodes", ["Unknown"])[0]
-
-        try:
-            cabin = offer["travelerPricings"][0]["fareDetailsBySegment"][0]["cabin"]
-        except Exception:
-            cabin = "Unknown"
-
-        seg = offer["itineraries"][0]["segments"][0]
-        dep_time = seg["departure"]["at"]
-        arr_time = seg["arrival"]["at"]
-        segments = offer["itineraries"][0]["segments"]
-        stops = [s["arrival"]["iataCode"] for s in segments[:-1]]
-
+        stops = offer.stops
 
         reply += (
             f"✈️ **Option {idx}**\n"
-            f"Airline: {airline}\n"
-            f"Class: {cabin}\n"
-            f"Price: ${price}\n"
-            f"Departure: {dep_time}\n"
-            f"Arrival: {arr_time}\n\n"
+            f"Airline: {offer.airline}\n"
+            f"Class: {offer.cabin}\n"
+            f"Price: ${offer.price}\n"
+            f"Departure: {offer.departure}\n"
+            f"Arrival: {offer.arrival}\n\n"
             f"Stops: {', '.join(stops) if stops else 'Direct'}\n\n"
         )
 
-        option_details[f"option_{idx}_airline"] = airline
-        option_details[f"option_{idx}_class"] = cabin
-        option_details[f"option_{idx}_price"] = price
-        option_details[f"option_{idx}_departure"] = dep_time
-        option_details[f"option_{idx}_arrival"] = arr_time
-
     reply += "Choose an option: **1, 2, or 3** or retry flight search."
-    return reply, option_details
+    return reply, {"flight_options_ref": option_store.put([o.to_option() for o in flights])}
 
 
 
 
 def handle_select_flight(params):
     selected = int(params.get("selected_flight_id", 1))
-    key = f"option_{selected}"
+    option = selected_option(params, "flight_options_ref", "option", selected)
+    if option is None:
+        return {}, OPTIONS_EXPIRED
 
     mapped = {
-        "selected_flight_airline": params.get(f"{key}_airline"),
-        "selected_flight_class": params.get(f"{key}_class"),
-        "selected_flight_price": params.get(f"{key}_price"),
-        "selected_flight_departure": params.get(f"{key}_departure"),
-        "selected_flight_arrival": params.get(f"{key}_arrival"),
+        "selected_flight_airline": option.get("airline"),
+        "selected_flight_class": option.get("class"),
+        "selected_flight_price": option.get("price"),
+        "selected_flight_departure": option.get("departure"),
+        "selected_flight_arrival": option.get("arrival"),
     }
     
 
@@ -266,127 +481,279 @@ def handle_booking_confirmation(params):
 # ⭐⭐ HOTEL HANDLERS (YOUR EXACT CORRECT VERSION) ⭐⭐
 # ============================================================
 
-def handle_hotel_options(params):
+HOTEL_URL = providers.url("booking", "/properties/list")
 
-    hotel_city = params.get("hotel_city")
-    checkin = normalize_date(params.get("check_in"))
-    checkout = normalize_date(params.get("check_out"))
+# Booking returns 20 properties per offset step
+HOTEL_PAGE_SIZE = 20
+HOTEL_MAX_PAGES = int(os.getenv("HOTEL_MAX_PAGES", "5"))
+HOTEL_PAGE_PARALLELISM = int(os.getenv("HOTEL_PAGE_PARALLELISM", "3"))
+HOTEL_PAGE_DEADLINE = float(os.getenv("HOTEL_PAGE_DEADLINE", "4"))
 
-    budget_obj = params.get("budget")
-    if isinstance(budget_obj, dict) and "amount" in budget_obj:
-        hotel_budget = float(budget_obj["amount"])
-    else:
-        hotel_budget = 9999
+hotel_page_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HOTEL_PAGE_WORKERS", "12")),
+    thread_name_prefix="hotel-page",
+)
 
-    if not hotel_city or not checkin or not checkout:
-        return "I need the hotel city, check-in date, and check-out date.", {}
 
-    dest_id_map = {
-        "paris": "-1456928", "tokyo": "-246227", "london": "-2601889",
-        "dubai": "-782831", "new york": "-2550311",
-        "delhi": "-2106102", "mumbai": "-2101842"
-    }
+def fetch_hotels(dest_id, checkin, checkout, guests="2", rooms="1", offset=0, filters=query_plan.NO_HOTEL_FILTERS,
+                 deadline=None):
+    """One Booking properties/list page -> HotelOffer list in provider order.
+
+    Returns None when the payload has no "result" (error / quota replies).
+    """
+    headers, query = hotel_search_request(dest_id, checkin, checkout, guests, rooms, offset, filters)
+    res = providers.get("booking", HOTEL_URL, headers=headers, params=query, deadline=deadline)
+    hotels = hotels_from_payload(providers.json_body("booking", res))
+    remember_any_budget((dest_id, checkin, checkout, guests, rooms, offset), hotels)
+    return hotels
 
-    dest_id = dest_id_map.get(hotel_city.lower())
-    if not dest_id:
-        return "Sorry, I don't know this city yet for hotels. Try different details. Yes to retry hotel search, Start Over to go to main menu or exit", {}
 
-    url = "https://apidojo-booking-v1.p.rapidapi.com/properties/list"
+def hotel_search_request(dest_id, checkin, checkout, guests="2", rooms="1", offset=0,
+                         filters=query_plan.NO_HOTEL_FILTERS):
+    """-> (headers, query) for one properties/list page.
 
+    `filters` is the (order_by, per-night price ceiling) pushed down by
+    query_plan.hotel_filters().
+    """
     query = {
-        "offset": "0",
+        "offset": str(offset),
         "arrival_date": checkin,
         "departure_date": checkout,
-        "guest_qty": "2",
-        "room_qty": "1",
+        "guest_qty": guests,
+        "room_qty": rooms,
         "dest_ids": dest_id,
         "search_type": "city",
         "locale": "en-us",
         "currency_code": "USD"
     }
 
+    order_by, price_max = filters
+    if order_by:
+        query["order_by"] = order_by
+    if price_max is not None:
+        query["categories_filter"] = f"price::0-{price_max}"
+        query["price_filter_currencycode"] = "USD"
+
     headers = {
         "X-RapidAPI-Key": BOOKING_API_KEY,
         "X-RapidAPI-Host": BOOKING_API_HOST
     }
+    return headers, query
+
+
+def remember_any_budget(key, hotels):
+    if hotels is not None:
+        hotel_any_budget.set(key, hotels)
 
-    res = requests.get(url, headers=headers, params=query)
-    data = res.json()
 
+def hotels_from_payload(data):
     if "result" not in data:
-        return "No hotels found.", {}
+        return None
+
+    return [HotelOffer.from_booking(h) for h in data["result"][:30]]
 
-    results = data["result"][:30]
 
-    hotels = []
-    for h in results:
-        name = h.get("hotel_name")
-        rating = h.get("review_score", 0)
-        price = h.get("min_total_price")
+def affordable_count(hotels, budget):
+    return sum(1 for h in hotels if h.price and h.amount <= budget)
 
-        # ✅ NEW: image url extraction (main key + safe fallbacks)
-        image_url = (
-            h.get("main_photo_url")
-            or h.get("main_photo_url_original")
-            or h.get("max_photo_url")
-            or h.get("hotel_image_url")
+
+def hotel_page(dest_id, checkin, checkout, guests="2", rooms="1", offset=0, filters=query_plan.NO_HOTEL_FILTERS,
+               deadline=None):
+    """Cached hotel page (stale-while-revalidate on the search params).
+
+    Background refreshes run without the turn's deadline.
+    """
+    key = (dest_id, checkin, checkout, guests, rooms, offset, filters)
+    page = hotel_cache.get(
+        key, lambda: fetch_hotels(dest_id, checkin, checkout, guests, rooms, offset, filters)
+    )
+    if page is None:
+        page = fetch_once(
+            "hotels", hotel_cache, key,
+            lambda: fetch_hotels(dest_id, checkin, checkout, guests, rooms, offset, filters, deadline=deadline),
         )
+    return page
 
-        if price and price <= hotel_budget:
-            hotels.append({
-                "name": name,
-                "rating": rating,
-                "price": price,
-                "checkin": checkin,
-                "checkout": checkout,
-                "image": image_url,  # ✅ store it per option
-            })
 
-        if len(hotels) == 3:
+def search_hotels(dest_id, checkin, checkout, budget=None, k=3, guests="2", rooms="1", deadline=None):
+    """Hotel candidates for a city/date, paging further only when needed.
+
+    The first page answers most searches. When it has fewer than `k`
+    hotels under `budget`, later offsets are fetched concurrently (at most
+    HOTEL_PAGE_PARALLELISM in flight) until k affordable hotels are found,
+    the last page is reached or HOTEL_PAGE_DEADLINE (or the turn's reply
+    deadline) passes. Returns the merged candidates in page order, or None
+    if the first page is unusable.
+
+    Booking is asked for price-sorted results under the budget
+    (query_plan.hotel_filters), so the first page is almost always enough.
+    """
+    filters = query_plan.hotel_filters(checkin, checkout, budget)
+    first = hotel_page(dest_id, checkin, checkout, guests, rooms, 0, filters, deadline)
+    if first is None or budget is None:
+        return first
+
+    found = affordable_count(first, budget)
+    if found >= k or len(first) < HOTEL_PAGE_SIZE:
+        return first
+
+    pages = {0: first}
+    pending = {}
+    next_page = 1
+    paging_ends = time.monotonic() + HOTEL_PAGE_DEADLINE
+
+    while found < k:
+        while len(pending) < HOTEL_PAGE_PARALLELISM and next_page < HOTEL_MAX_PAGES:
+            fut = hotel_page_pool.submit(
+                hotel_page, dest_id, checkin, checkout, guests, rooms, next_page * HOTEL_PAGE_SIZE, filters, deadline
+            )
+            pending[fut] = next_page
+            next_page += 1
+
+        remaining = paging_ends - time.monotonic()
+        if deadline is not None:
+            remaining = min(remaining, deadline.remaining())
+        if not pending or remaining <= 0:
+            break
+
+        finished, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not finished:
             break
 
+        for fut in finished:
+            n = pending.pop(fut)
+            try:
+                page = fut.result()
+            except Exception as e:
+                print("Hotel page error:", e)
+                page = None
+
+            if page:
+                pages[n] = page
+                found += affordable_count(page, budget)
+            # Short or empty page -> nothing after it, stop scheduling more
+            if not page or len(page) < HOTEL_PAGE_SIZE:
+                next_page = HOTEL_MAX_PAGES
+
+    # Late pages keep running in the background and still land in the cache
+    for fut in pending:
+        fut.cancel()
+
+    return [h for n in sorted(pages) for h in pages[n]]
+
+
+def cached_hotels(dest_id, checkin, checkout, budget=None, guests="2", rooms="1"):
+    """Last good pages for this search, however old (circuit-open fallback).
+
+    Pages fetched for this budget's price ceiling first; failing that, the
+    last pages fetched under any budget (possibly missing some hotels this
+    budget allows).
+    """
+    filters = query_plan.hotel_filters(checkin, checkout, budget)
+    keys = [(dest_id, checkin, checkout, guests, rooms, n * HOTEL_PAGE_SIZE) for n in range(HOTEL_MAX_PAGES)]
+    for lookup in (lambda key: hotel_cache.last_good((*key, filters)), hotel_any_budget.get):
+        hotels = []
+        for key in keys:
+            page = lookup(key)
+            if not page:
+                break
+            hotels.extend(page)
+        if hotels:
+            return hotels
+    return None
+
+
+def hotel_query(params):
+    """Session params -> (search kwargs, None) or (None, reply explaining what's wrong)"""
+    hotel_city = params.get("hotel_city")
+    checkin = normalize_date(params.get("check_in"))
+    checkout = normalize_date(params.get("check_out"))
+
+    budget_obj = params.get("budget")
+    if isinstance(budget_obj, dict) and "amount" in budget_obj:
+        hotel_budget = float(budget_obj["amount"])
+    else:
+        hotel_budget = 9999
+
+    if not hotel_city or not checkin or not checkout:
+        return None, "I need the hotel city, check-in date, and check-out date."
+
+    place = gazetteer.lookup(hotel_city)
+    dest_id = place.dest_id if place else None
+    if not dest_id:
+        return None, "Sorry, I don't know this city yet for hotels. Try different details. Yes to retry hotel search, Start Over to go to main menu or exit"
+
+    return {"dest_id": dest_id, "checkin": checkin, "checkout": checkout, "budget": hotel_budget}, None
+
+
+def handle_hotel_options(params, deadline=None):
+    query, problem = hotel_query(params)
+    if problem:
+        return problem, {}
+
+    try:
+        done, candidates = run_search("hotels", search_hotels, query, deadline)
+    except ProviderUnavailable as e:
+        candidates = cached_hotels(**query)
+        if candidates is None:
+            return f"Hotel search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(hotel_options_reply(query, candidates))
+    except requests.RequestException as e:
+        return f"Hotel search failed (network). {e}", {}
+    except Exception as e:
+        print("Hotel search failed:", repr(e))
+        return f"Hotel search failed. {e}", {}
+    if not done:
+        return searching_reply("hotels", cached_hotels(**query), lambda hotels: hotel_options_reply(query, hotels))
+
+    return hotel_options_reply(query, candidates)
+
+
+def hotel_options_reply(query, candidates):
+    """Searched candidates -> (reply, {"hotel_options_ref": handle})"""
+    checkin, checkout = query["checkin"], query["checkout"]
+
+    if candidates is None:
+        return "No hotels found.", {}
+
+    affordable = [h for h in candidates if h.price and h.amount <= query["budget"]]
+    hotels = top_k(affordable, 3, HOTEL_WEIGHTS)
+
     if not hotels:
         return "No hotels match your budget. Do you want to retry hotel search, Start Over to go to main menu or exit", {}
 
     reply = "🏨 **Best Hotel Options:**\n\n"
-    mapped = {}
 
     for idx, h in enumerate(hotels, start=1):
         reply += (
             f"⭐ **Option {idx}**\n"
-            f"Hotel: {h['name']}\n"
-            f"Rating: {h['rating']}\n"
-            f"Price: ${h['price']}\n"
-            f"Check-In: {h['checkin']}\n"
-            f"Check-Out: {h['checkout']}\n\n"
+            f"Hotel: {h.name}\n"
+            f"Rating: {h.rating}\n"
+            f"Price: ${h.price}\n"
+            f"Check-In: {checkin}\n"
+            f"Check-Out: {checkout}\n\n"
         )
 
-        mapped[f"hotel_opt_{idx}_name"] = h["name"]
-        mapped[f"hotel_opt_{idx}_rating"] = h["rating"]
-        mapped[f"hotel_opt_{idx}_price"] = h["price"]
-        mapped[f"hotel_opt_{idx}_checkin"] = h["checkin"]
-        mapped[f"hotel_opt_{idx}_checkout"] = h["checkout"]
-
-        # ✅ NEW: store image url per option
-        mapped[f"hotel_opt_{idx}_image"] = h["image"]
-
     reply += "Choose a hotel: **1, 2, or 3** or retry hotel search."
-    return reply, mapped
+    options = [h.to_option(checkin, checkout) for h in hotels]
+    return reply, {"hotel_options_ref": option_store.put(options)}
 
 
 
 
 def handle_select_hotel(params):
     selected = int(params.get("number", 1))
-    key = f"hotel_opt_{selected}"
+    option = selected_option(params, "hotel_options_ref", "hotel_opt", selected)
+    if option is None:
+        return {}, OPTIONS_EXPIRED
 
     mapped = {
-        "selected_hotel_name": params.get(f"{key}_name"),
-        "selected_hotel_rating": params.get(f"{key}_rating"),
-        "selected_hotel_price": params.get(f"{key}_price"),
-        "selected_hotel_checkin": params.get(f"{key}_checkin"),
-        "selected_hotel_checkout": params.get(f"{key}_checkout"),
-        "selected_hotel_image": params.get(f"{key}_image"),
+        "selected_hotel_name": option.get("name"),
+        "selected_hotel_rating": option.get("rating"),
+        "selected_hotel_price": option.get("price"),
+        "selected_hotel_checkin": option.get("checkin"),
+        "selected_hotel_checkout": option.get("checkout"),
+        "selected_hotel_image": option.get("image"),
     }
 
     preview = f"""
@@ -440,70 +807,39 @@ def handle_hotel_booking_confirmation(params):
 
 
 # ============================================================
-# 🛫 STATIC AIRPORT COORDINATE MAPPING (Fix for "No cars found")
+# 🔍 GEOAPIFY LOOKUP (CITY → LAT,LON) - FALLBACK ONLY
 # ============================================================
-
-CAR_CITY_COORDS = {
-    "chicago": "41.9773,-87.8369",      # ORD - Chicago O'Hare
-    "new york": "40.6413,-73.7781",     # JFK
-    "los angeles": "33.9416,-118.4085", # LAX
-    "dallas": "32.8998,-97.0403",       # DFW
-    "houston": "29.9902,-95.3368",      # IAH
-    "miami": "25.7959,-80.2870",        # MIA
-    "orlando": "28.4312,-81.3081",      # MCO
-    "san francisco": "37.6213,-122.3790", # SFO
-    "seattle": "47.4502,-122.3088",     # SEA
-    "atlanta": "33.6407,-84.4277",      # ATL
-}
+# Answers come from the persistent geocode cache (memory → SQLite); only
+# unknown or expired cities reach Geoapify.
+geocoder = GeocodeCache(GEOCODE_DB_PATH, geoapify_fetch)
 
 
-# ============================================================
-# 🔍 GEOAPIFY LOOKUP (CITY → LAT,LON) - FALLBACK ONLY
-# ============================================================
 def geoapify_lookup(city_name):
     if not city_name:
         return None
 
-    url = "https://api.geoapify.com/v1/geocode/search"
-    params = {
-        "text": city_name,
-        "format": "json",
-        "apiKey": GEO_API_KEY
-    }
-
-    try:
-        r = requests.get(url, params=params)
-        data = r.json()
-
-        if "results" not in data or len(data["results"]) == 0:
-            return None
-
-        res = data["results"][0]
-        lat = res["lat"]
-        lon = res["lon"]
-
-        return f"{lat},{lon}"
-
-    except Exception as e:
-        print("Geoapify error:", e)
+    coords = geocoder.lookup(city_name)
+    if not coords:
         return None
 
+    lat, lon = coords
+    return f"{lat},{lon}"
+
 
 # ============================================================
-# 🔧 GET COORDS (Airport First → Geoapify Second)
+# 🔧 GET COORDS (Gazetteer First → Geoapify Second)
 # ============================================================
 def get_coords(city_name):
     if not city_name:
         return None
 
-    city = city_name.lower()
-
-    # 1️⃣ First try airport mapping
-    if city in CAR_CITY_COORDS:
-        return CAR_CITY_COORDS[city]
+    # 1️⃣ First try the bundled gazetteer (airport coords for rental cities)
+    place = gazetteer.lookup(city_name)
+    if place and place.coords:
+        return place.coords
 
     # 2️⃣ Fallback to Geoapify
-    return geoapify_lookup(city)
+    return geoapify_lookup(city_name.lower())
 
 
 # ============================================================
@@ -529,25 +865,37 @@ def extract_dates_from_itemkey(item_key):
 # ============================================================
 # ✅ City → Airport IATA (same idea, used by new API)
 # ============================================================
-RENTAL_IATA_MAP = {
-    "dallas": "DFW",
-    "orlando": "MCO",
-    "new york": "JFK",
-    "los angeles": "LAX",
-    "chicago": "ORD",
-    "miami": "MIA",
-    "san francisco": "SFO",
-    "las vegas": "LAS",
-    "atlanta": "ATL",
-    "seattle": "SEA",
-    "houston": "IAH",
-}
-
 def get_airport_code(city_name: str):
     if not city_name:
         return None
-    city = city_name.lower().strip()
-    return RENTAL_IATA_MAP.get(city)
+    place = gazetteer.lookup(city_name)
+    return place.airport if place else None
+
+
+def nearest_airport_code(city_name):
+    """Town with no mapped airport -> closest rental airport within range"""
+    coords = get_coords(city_name)
+    if not coords:
+        return None
+    lat, lon = (float(x) for x in coords.split(","))
+    hits = airports.nearest(lat, lon, k=1)
+    return hits[0][0].iata if hits else None
+
+
+def resolve_rental_airport(city_name):
+    """Mapped city -> its airport; a typed IATA code as-is; else the nearest airport"""
+    if not city_name:
+        return None
+
+    code = get_airport_code(city_name)
+    if code:
+        return code
+
+    typed = city_name.strip().upper()
+    if len(typed) == 3 and typed.isalpha():
+        return typed
+
+    return nearest_airport_code(city_name)
 
 
 
@@ -580,30 +928,36 @@ def normalize_time(time_obj):
 # 🚗 Car Rental Handler (Fix 1 — FULL FINAL VERSION)
 # ============================================================
 
-def handle_car_rental_options(params):
-    pickup_city = params.get("pick_up_city") or params.get("pick_up_City")
-    dropoff_city = params.get("drop_off_city") or pickup_city  # allow same dropoff
+def fetch_cars(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time, deadline=None):
+    """One Priceline resultsRequest call -> CarOffer list in provider order.
 
-    # 1) Convert city -> airport code (required by this API)
-    pickup_code = get_airport_code(pickup_city) or (pickup_city.strip().upper() if pickup_city else None)
-    dropoff_code = get_airport_code(dropoff_city) or (dropoff_city.strip().upper() if dropoff_city else None)
+    Returns None when results_list is missing/empty. Non-200 replies raise
+    requests.HTTPError so they are never cached.
+    """
+    headers, search_params = car_search_request(
+        pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time
+    )
 
-    if not pickup_code or len(pickup_code) != 3:
-        return f"Sorry, I couldn't map **{pickup_city}** to a supported airport code. Try a major city (e.g., New York, Chicago).", {}
+    parser = CarResultsParser()
+    with providers.stream(
+        "priceline", "GET", CAR_API_URL, headers=headers, params=search_params, deadline=deadline
+    ) as res:
+        if res.status_code != 200:
+            raise requests.HTTPError(f"Priceline returned {res.status_code}", response=res)
 
-    if not dropoff_code or len(dropoff_code) != 3:
-        return f"Sorry, I couldn't map **{dropoff_city}** to a supported airport code. Try a major city (e.g., New York, Chicago).", {}
+        # Stream results_list entry by entry straight into CarOffer records
+        for chunk in providers.iter_body(res, CAR_MAX_RESPONSE_BYTES):
+            parser.feed(chunk)
+            if parser.done:
+                break
+        cars = parser.close()
+    providers.observe_parse("priceline", parser.seconds)
 
-    # 2) Normalize dates & times (MM/DD/YYYY for this endpoint)
-    pickup_date = normalize_date_mmddyyyy(params.get("pick_up"))
-    dropoff_date = normalize_date_mmddyyyy(params.get("drop_off_date"))
-    pickup_time = normalize_time(params.get("car_pickup_time"))
-    dropoff_time = normalize_time(params.get("car_dropoff_time"))
+    return with_airports(cars, pickup_code, dropoff_code)
 
-    if not pickup_date or not dropoff_date:
-        return "Sorry — I’m missing the pick-up or drop-off date. What dates do you want?", {}
 
-    # 3) Call Priceline Com Provider API
+def car_search_request(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time):
+    """-> (headers, query) for one resultsRequest call"""
     search_params = {
         "pickup_date": pickup_date,
         "dropoff_date": dropoff_date,
@@ -613,7 +967,7 @@ def handle_car_rental_options(params):
         "dropoff_airport_code": dropoff_code,
         "currency": "USD",
         "drivers_age": "25",
-        "limit": "50",
+        "limit": str(query_plan.CAR_LIMIT),
         "sort_order": "PRICE",
     }
 
@@ -622,99 +976,126 @@ def handle_car_rental_options(params):
         "x-rapidapi-host": CAR_API_HOST,
         "accept": "application/json",
     }
+    return headers, search_params
+
+
+def with_airports(cars, pickup_code, dropoff_code):
+    """Fill pick-up/drop-off locations the payload left out"""
+    if cars is None:
+        return None
+
+    for car in cars:
+        car.pickup = car.pickup or pickup_code
+        car.dropoff = car.dropoff or dropoff_code
+    return cars
+
 
+def search_cars(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time, deadline=None):
+    """Cached car search (stale-while-revalidate on airports/dates/times)"""
+    key = (pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time)
+    cars = car_cache.get(key, lambda: fetch_cars(*key))
+    if cars is None:
+        cars = fetch_once("cars", car_cache, key, lambda: fetch_cars(*key, deadline=deadline))
+    return cars
+
+
+def cached_cars(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time):
+    """Last good cars for this search, however old (circuit-open fallback)"""
+    return car_cache.last_good((pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time))
+
+
+def car_query(params):
+    """Session params -> (search kwargs, None) or (None, reply explaining what's wrong).
+
+    May call Geoapify for towns outside the gazetteer.
+    """
+    pickup_city = params.get("pick_up_city") or params.get("pick_up_City")
+    dropoff_city = params.get("drop_off_city") or pickup_city  # allow same dropoff
+
+    # 1) Convert city -> airport code (required by this API)
+    pickup_code = resolve_rental_airport(pickup_city)
+    dropoff_code = resolve_rental_airport(dropoff_city)
+
+    if not pickup_code or len(pickup_code) != 3:
+        return None, f"Sorry, I couldn't map **{pickup_city}** to a supported airport code. Try a major city (e.g., New York, Chicago)."
+
+    if not dropoff_code or len(dropoff_code) != 3:
+        return None, f"Sorry, I couldn't map **{dropoff_city}** to a supported airport code. Try a major city (e.g., New York, Chicago)."
+
+    # 2) Normalize dates & times (MM/DD/YYYY for this endpoint)
+    pickup_date = normalize_date_mmddyyyy(params.get("pick_up"))
+    dropoff_date = normalize_date_mmddyyyy(params.get("drop_off_date"))
+    pickup_time = normalize_time(params.get("car_pickup_time"))
+    dropoff_time = normalize_time(params.get("car_dropoff_time"))
+
+    if not pickup_date or not dropoff_date:
+        return None, "Sorry — I’m missing the pick-up or drop-off date. What dates do you want?"
+
+    return {
+        "pickup_code": pickup_code,
+        "dropoff_code": dropoff_code,
+        "pickup_date": pickup_date,
+        "dropoff_date": dropoff_date,
+        "pickup_time": pickup_time,
+        "dropoff_time": dropoff_time,
+    }, None
+
+
+def handle_car_rental_options(params, deadline=None):
+    query, problem = car_query(params)
+    if problem:
+        return problem, {}
+
+    # 3) Call Priceline Com Provider API (cached per search)
     try:
-        res = requests.get(CAR_API_URL, headers=headers, params=search_params, timeout=30)
+        done, cars = run_search("cars", search_cars, query, deadline)
+    except ProviderUnavailable as e:
+        cars = cached_cars(**query)
+        if cars is None:
+            return f"Car search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(car_options_reply(query, cars))
+    except requests.HTTPError as e:
+        return f"Car search failed ({e.response.status_code}). Try again.", {}
     except Exception as e:
         return f"Car search failed (network). {e}", {}
+    if not done:
+        return searching_reply("cars", cached_cars(**query), lambda cars: car_options_reply(query, cars))
 
-    if res.status_code != 200:
-        return f"Car search failed ({res.status_code}). Try again.", {}
+    return car_options_reply(query, cars)
 
-    data = res.json()
 
-    # 4) Parse results_list object -> list
-    root = data.get("getCarResultsRequest", {})
-    results = root.get("results", {})
-    results_list = results.get("results_list", {}) or {}
+def car_options_reply(query, cars):
+    """Searched cars -> (reply, {"car_options_ref": handle})"""
+    pickup_date, dropoff_date = query["pickup_date"], query["dropoff_date"]
 
-    if not isinstance(results_list, dict) or len(results_list) == 0:
+    if cars is None:
         return "No rental cars available for those dates/airport. Try different dates or a different city.", {}
 
-    # Convert dict results_list -> list of dicts with key
-    cars = []
-    for k, v in results_list.items():
-        if isinstance(v, dict):
-            vv = dict(v)
-            vv["_result_key"] = k
-            cars.append(vv)
-
     if not cars:
         return "No rental cars found. Try different dates or cities.", {}
 
-    # Sort by TOTAL trip price (best UX)
-    def total_price(x):
-        try:
-            return float((((x.get("price_details") or {}).get("base") or {}).get("total_price")) or 1e18)
-        except:
-            return 1e18
-
-    cars.sort(key=total_price)
-
-    # Take top 3
-    top3 = cars[:3]
+    # Best 3 by TOTAL trip price (best UX)
+    top3 = top_k(cars, 3, CAR_WEIGHTS)
 
     reply = "🚗 **Best Car Rental Options:**\n\n"
-    details = {}
 
     for idx, car in enumerate(top3, start=1):
-        car_info = car.get("car", {}) if isinstance(car.get("car"), dict) else {}
-        vendor = (car.get("partner", {}) or {}).get("name", "Unknown vendor")
-
-        car_type = car_info.get("example", "Car")
-        car_class = car_info.get("description", "")
-        img = None
-
-        images = car_info.get("images") if isinstance(car_info.get("images"), dict) else {}
-        img = images.get("SIZE268X144") or images.get("SIZE335X180") or car_info.get("imageURL")
-
-        base_price = ((car.get("price_details") or {}).get("base") or {}) if isinstance(car.get("price_details"), dict) else {}
-        per_day = base_price.get("price", "N/A")
-        total = base_price.get("total_price", "N/A")
-        symbol = base_price.get("symbol", "$")
-
-        pickup_loc = (car.get("pickup", {}) or {}).get("location", pickup_code)
-        dropoff_loc = (car.get("dropoff", {}) or {}).get("location", dropoff_code)
+        symbol = car.symbol
 
         reply += (
             f"🚗 **Option {idx}**\n"
-            f"• Vendor: {vendor}\n"
-            f"• Car: {car_type}" + (f" ({car_class})\n" if car_class else "\n") +
-            f"• Price: {symbol}{per_day}/day  |  Total: {symbol}{total}\n"
-            f"• Pick-Up: {pickup_loc}\n"
-            f"• Drop-Off: {dropoff_loc}\n\n"
+            f"• Vendor: {car.vendor}\n"
+            f"• Car: {car.example}" + (f" ({car.description})\n" if car.description else "\n") +
+            f"• Price: {symbol}{car.price}/day  |  Total: {symbol}{car.total_price}\n"
+            f"• Pick-Up: {car.pickup}\n"
+            f"• Drop-Off: {car.dropoff}\n\n"
         )
 
-        # Store option details for next steps (keeps your flow intact)
-        base = f"car_opt_{idx}"
-        details[f"{base}_vendor"] = vendor
-        details[f"{base}_type"] = car_type
-        details[f"{base}_class"] = car_class
-        details[f"{base}_price"] = per_day
-        details[f"{base}_total"] = total
-        details[f"{base}_pickup"] = pickup_loc
-        details[f"{base}_dropoff"] = dropoff_loc
-        details[f"{base}_image"] = img
-        details[f"{base}_result_key"] = car.get("_result_key")
-        details[f"{base}_bundle"] = car.get("postpaid_contract_bundle")
-
-        # Also store dates so your existing select handler shows them
-        details[f"{base}_pickup_date"] = pickup_date
-        details[f"{base}_dropoff_date"] = dropoff_date
-
     reply += "Choose a car: **1, 2, or 3** or retry car rental search."
 
-    return reply, details
+    # Store option details server-side for the select turn
+    options = [car.to_option(pickup_date, dropoff_date) for car in top3]
+    return reply, {"car_options_ref": option_store.put(options)}
 
 
 
@@ -724,21 +1105,23 @@ def handle_car_rental_options(params):
 # ============================================================
 def handle_select_car(params):
     n = int(params.get("number"))
-    base = f"car_opt_{n}"
+    option = selected_option(params, "car_options_ref", "car_opt", n)
+    if option is None:
+        return {}, OPTIONS_EXPIRED
 
     mapped = {
-        "selected_car_vendor": params.get(f"{base}_vendor"),
-        "selected_car_type": params.get(f"{base}_type"),
-        "selected_car_class": params.get(f"{base}_class"),
-        "selected_car_price": params.get(f"{base}_price"),          # per day
-        "selected_car_total": params.get(f"{base}_total"),          # total trip
-        "selected_car_pickup": params.get(f"{base}_pickup"),
-        "selected_car_dropoff": params.get(f"{base}_dropoff"),
-        "selected_car_pickup_date": params.get(f"{base}_pickup_date"),
-        "selected_car_dropoff_date": params.get(f"{base}_dropoff_date"),
-        "selected_car_image": params.get(f"{base}_image"),
-        "selected_car_result_key": params.get(f"{base}_result_key"),
-        "selected_car_bundle": params.get(f"{base}_bundle"),
+        "selected_car_vendor": option.get("vendor"),
+        "selected_car_type": option.get("type"),
+        "selected_car_class": option.get("class"),
+        "selected_car_price": option.get("price"),          # per day
+        "selected_car_total": option.get("total"),          # total trip
+        "selected_car_pickup": option.get("pickup"),
+        "selected_car_dropoff": option.get("dropoff"),
+        "selected_car_pickup_date": option.get("pickup_date"),
+        "selected_car_dropoff_date": option.get("dropoff_date"),
+        "selected_car_image": option.get("image"),
+        "selected_car_result_key": option.get("result_key"),
+        "selected_car_bundle": option.get("bundle"),
     }
 
     preview = f"""
@@ -811,160 +1194,346 @@ def handle_car_booking_confirmation(params):
 
 
 # ============================================================
-# ⭐⭐ WEBHOOK ROUTER ⭐⭐
+# 🧳 TRIP PACKAGE (flights + hotels + cars in one turn)
 # ============================================================
+# The three searches run side by side under the turn's deadline, so a whole
+# trip costs the slowest search instead of the sum of all three. A search
+# that misses the deadline keeps running in the background, so asking again
+# a moment later picks it up (or answers from cache).
+trip_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRIP_PACKAGE_WORKERS", "24")),
+    thread_name_prefix="trip-package",
+)
+
+# (part, icon, handler)
+TRIP_PARTS = (
+    ("flights", "✈️", handle_flight_options),
+    ("hotels", "🏨", handle_hotel_options),
+    ("cars", "🚗", handle_car_rental_options),
+)
+
+
+def trip_part_params(params):
+    """Combined trip params -> {part: params in the shape its handler expects}.
+
+    Uses departure_city / destination_city / departure_date / return_date
+    (+ budget, flight_class); any part-specific key already in the session
+    (hotel_city, check_in, pick_up_city, ...) wins.
+    """
+    origin = params.get("departure_city")
+    destination = params.get("destination_city") or params.get("destination-city")
+    start = params.get("departure_date")
+    end = params.get("return_date")
+
+    return {
+        "flights": {**params, "departure_city": origin, "destination_city": destination},
+        "hotels": {
+            **params,
+            "hotel_city": params.get("hotel_city") or destination,
+            "check_in": params.get("check_in") or start,
+            "check_out": params.get("check_out") or end,
+        },
+        "cars": {
+            **params,
+            "pick_up_city": params.get("pick_up_city") or destination,
+            "pick_up": params.get("pick_up") or start,
+            "drop_off_date": params.get("drop_off_date") or end,
+        },
+    }
 
-@app.post("/webhook")
-def webhook():
-    req = request.get_json()
-    tag = req.get("fulfillmentInfo", {}).get("tag", "").strip()
-    params = req.get("sessionInfo", {}).get("parameters", {})
 
-    # -------------------- FLIGHT --------------------
-    if tag == "Flight_Options":
-        reply, details = handle_flight_options(params)
-        return jsonify({
-            "fulfillment_response": {"messages": [{"text": {"text": [reply]}}]},
-            "sessionInfo": {"parameters": details}
-        })
+def trip_package_reply(outcomes):
+    """[(part, icon, (reply, details) or None if still running)] -> merged (reply, details)"""
+    sections = ["🧳 **Your Trip Package**"]
+    details = {}
 
-    if tag == "Select_Flight_Details":
-        mapped, preview = handle_select_flight(params)
-        return jsonify({
-            "sessionInfo": {"parameters": mapped},
-            "fulfillment_response": {"messages": [{"text": {"text": [preview]}}]}
-        })
+    for part, icon, result in outcomes:
+        if result is None:
+            sections.append(still_searching(part, icon))
+            continue
+        reply, part_details = result
+        sections.append(reply)
+        details.update(part_details)
 
-    if tag == "Booking_Confirmation":
-        reply = handle_booking_confirmation(params)
-        return jsonify({
-            "fulfillment_response": {"messages": [{"text": {"text": [reply]}}]}
-        })
+    return "\n\n".join(sections), details
 
-    # -------------------- HOTELS --------------------
-    if tag == "Hotel_Options":
-        reply, details = handle_hotel_options(params)
-
-        rich_cards = []
-        for i in range(1, 4):
-            img = details.get(f"hotel_opt_{i}_image")
-            if img:
-                rich_cards.append({
-                    "type": "info",
-                    "title": f"Option {i}: {details.get(f'hotel_opt_{i}_name')}",
-                    "subtitle": f"${details.get(f'hotel_opt_{i}_price')}",
-                    "image": {
-                        "imageUri": img,
-                        "accessibilityText": "Hotel image"
-                    }
-                })
-
-        messages = [{"text": {"text": [reply]}}]
-
-        if rich_cards:
-            messages.append({
-                "payload": {
-                    "richContent": [rich_cards]
-                }
-            })
 
-        return jsonify({
-            "fulfillment_response": {"messages": messages},
-            "sessionInfo": {"parameters": details}
-        })
+def handle_trip_package(params, deadline=None):
+    deadline = deadline or Deadline()
+    part_params = trip_part_params(params)
+    futures = {
+        part: trip_pool.submit(handler, part_params[part], deadline)
+        for part, _, handler in TRIP_PARTS
+    }
+    wait(futures.values(), timeout=deadline.remaining())
+
+    outcomes = []
+    for part, icon, _ in TRIP_PARTS:
+        fut = futures[part]
+        if not fut.done():
+            outcomes.append((part, icon, None))
+            continue
+        try:
+            outcomes.append((part, icon, fut.result()))
+        except Exception as e:
+            print(f"Trip package {part} search failed:", e)
+            outcomes.append((part, icon, (f"{icon} {part.capitalize()} search failed. {e}", {})))
+
+    return trip_package_reply(outcomes)
+
+
+# ============================================================
+# 🔮 SPECULATIVE HOTEL / CAR PREFETCH
+# ============================================================
+# Point the end-of-session route's webhook at this tag to drop the
+# session's queued prefetches
+SESSION_END_TAG = "End_Session"
+
+# The user has picked a flight: search the destination for the same dates
+PREFETCH_AFTER = ("Select_Flight_Details", "Booking_Confirmation")
+# A new flight search or the end of the session: the old plan is gone
+PREFETCH_CANCEL_ON = ("Flight_Options", "Trip_Package", SESSION_END_TAG)
+
+# part -> (provider, query builder, search, session params that identify the search)
+PREFETCH_SEARCHES = {
+    "hotels": ("booking", hotel_query, search_hotels, ("hotel_city", "check_in", "check_out", "budget")),
+    "cars": ("priceline", car_query, search_cars,
+             ("pick_up_city", "drop_off_city", "pick_up", "drop_off_date", "car_pickup_time", "car_dropoff_time")),
+}
+
+
+# Hotel pages are cached per budget ceiling, so a hotel prefetch made
+# before the user gave a budget (the flight turns usually don't carry one)
+# would search for a ceiling the later Hotel_Options turn never asks for.
+# Hotels are only prefetched once the session has a budget; the cost is no
+# head start for the first hotel search of budget-less sessions.
+PREFETCH_NEEDS = {"hotels": ("budget",)}
+
+
+def prefetch_search(part, params):
+    """Background half of a hotel/car turn: fills the result caches, replies to nobody"""
+    _, build_query, search, _ = PREFETCH_SEARCHES[part]
+    query, problem = build_query(params)  # may geocode, so not on the request path
+    if query is not None:
+        search(**query)
+
+
+def prefetch_for_turn(session, tag, params, details):
+    """Queue hotel and car searches at the destination once a flight is picked.
+
+    Uses the Trip_Package mapping (destination city, departure and return
+    dates), so the later Hotel_Options / Car_Rental_Options turns ask for
+    the same cache keys.
+    """
+    if tag in PREFETCH_CANCEL_ON:
+        prefetcher.cancel(session)
+        return
+    if tag not in PREFETCH_AFTER or not prefetcher.enabled:
+        return
+
+    part_params = trip_part_params({**params, **details})
+    for part, (provider, _, _, fields) in PREFETCH_SEARCHES.items():
+        if providers.breakers[provider].state != "closed":
+            continue  # don't speculate against a provider that is already failing
+        p = part_params[part]
+        if query_plan.QUERY_PUSHDOWN and not all(p.get(f) for f in PREFETCH_NEEDS.get(part, ())):
+            continue
+        key = tuple(str(p.get(f)) for f in fields)
+        prefetcher.submit(session, part, key, lambda part=part, p=p: prefetch_search(part, p))
+
+
+
+
+# ============================================================
+# ⭐⭐ WEBHOOK ROUTER ⭐⭐
+# ============================================================
+
+def text_message(text):
+    return {"text": {"text": [text]}}
 
-    if tag == "Select_Hotel_Details":
-        mapped, preview = handle_select_hotel(params)
 
-        messages = [{"text": {"text": [preview]}}]
+def image_card(url, alt):
+    return {"type": "image", "rawUrl": url, "accessibilityText": alt}
 
-        img = mapped.get("selected_hotel_image")
+
+def hotel_option_cards(details):
+    rich_cards = []
+    options = option_store.get(details.get("hotel_options_ref")) or []
+    for i, option in enumerate(options, start=1):
+        img = images.card_url(option.get("image"))
         if img:
-            messages.append({
-                "payload": {
-                    "richContent": [[
-                        {
-                            "type": "image",
-                            "rawUrl": img,
-                            "accessibilityText": "Selected hotel"
-                        }
-                    ]]
+            rich_cards.append({
+                "type": "info",
+                "title": f"Option {i}: {option.get('name')}",
+                "subtitle": f"${option.get('price')}",
+                "image": {
+                    "imageUri": img,
+                    "accessibilityText": "Hotel image"
                 }
             })
+    return rich_cards
 
-        return jsonify({
-            "sessionInfo": {"parameters": mapped},
-            "fulfillment_response": {"messages": messages}
-        })
 
-    if tag == "Hotel_Booking_Confirmation":
-        reply = handle_hotel_booking_confirmation(params)
-        return jsonify({
-            "fulfillment_response": {"messages": [{"text": {"text": [reply]}}]}
-        })
+def car_option_cards(details):
+    rich_cards = []
+    options = option_store.get(details.get("car_options_ref")) or []
+    for i, option in enumerate(options, start=1):
+        img = images.card_url(option.get("image"))
+        if img:
+            rich_cards.append(image_card(img, f"Car option {i}"))
+    return rich_cards
 
-    # -------------------- CAR RENTAL --------------------
-    if tag == "Car_Rental_Options":
-        reply, details = handle_car_rental_options(params)
 
-        rich_cards = []
-        for i in range(1, 4):
-            img = details.get(f"car_opt_{i}_image")
-            if img:
-                rich_cards.append({
-                    "type": "image",
-                    "rawUrl": img,
-                    "accessibilityText": f"Car option {i}"
-                })
+def trip_package_cards(details):
+    return hotel_option_cards(details) + car_option_cards(details)
 
-        messages = [{"text": {"text": [reply]}}]
 
-        if rich_cards:
-            messages.append({
-                "payload": {
-                    "richContent": [rich_cards]
-                }
-            })
+# tag -> handler(params, deadline) returning (reply, session params)
+OPTION_HANDLERS = {
+    "Flight_Options": handle_flight_options,
+    "Hotel_Options": handle_hotel_options,
+    "Car_Rental_Options": handle_car_rental_options,
+    "Trip_Package": handle_trip_package,
+}
+OPTION_CARDS = {
+    "Hotel_Options": hotel_option_cards,
+    "Car_Rental_Options": car_option_cards,
+    "Trip_Package": trip_package_cards,
+}
+
+# tag -> (handler(params) returning (mapped, preview), image param, image alt text)
+SELECT_HANDLERS = {
+    "Select_Flight_Details": (handle_select_flight, None, None),
+    "Select_Hotel_Details": (handle_select_hotel, "selected_hotel_image", "Selected hotel"),
+    "Select_Car_Details": (handle_select_car, "selected_car_image", "Selected rental car"),
+}
+
+# tag -> handler(params) returning the summary text
+CONFIRM_HANDLERS = {
+    "Booking_Confirmation": handle_booking_confirmation,
+    "Hotel_Booking_Confirmation": handle_hotel_booking_confirmation,
+    "Car_Booking_Confirmation": handle_car_booking_confirmation,
+}
+
+
+WEBHOOK_SECONDS = metrics.Histogram(
+    "tripsage_webhook_seconds", "Webhook handling time by tag", ("tag",)
+)
+
 
-        return jsonify({
-            "fulfillment_response": {"messages": messages},
-            "sessionInfo": {"parameters": details}
+def observe_webhook(tag, seconds):
+    # Unknown tags share one series so a typo can't create unbounded labels
+    known = tag in OPTION_HANDLERS or tag in SELECT_HANDLERS or tag in CONFIRM_HANDLERS or tag == SESSION_END_TAG
+    WEBHOOK_SECONDS.observe((tag if known else "other",), seconds)
+
+
+def webhook_request(req):
+    """Dialogflow CX webhook request -> (tag, session params)"""
+    tag = req.get("fulfillmentInfo", {}).get("tag", "").strip()
+    params = req.get("sessionInfo", {}).get("parameters", {})
+    return tag, params
+
+
+def after_webhook(req, tag, params, body):
+    """Work a turn triggers once its reply is ready (prefetching)"""
+    session = req.get("sessionInfo", {}).get("session")
+    details = (body.get("sessionInfo") or {}).get("parameters") or {}
+    prefetch_for_turn(session, tag, params, details)
+
+
+def options_response(tag, reply, details):
+    messages = [text_message(reply)]
+
+    cards = OPTION_CARDS.get(tag)
+    rich_cards = cards(details) if cards else []
+    if rich_cards:
+        messages.append({
+            "payload": {
+                "richContent": [rich_cards]
+            }
         })
 
-    if tag == "Select_Car_Details":
-        mapped, preview = handle_select_car(params)
+    return {
+        "fulfillment_response": {"messages": messages},
+        "sessionInfo": {"parameters": details}
+    }
+
 
-        messages = [{"text": {"text": [preview]}}]
+def dispatch(tag, params, deadline=None):
+    """Tag + session params -> Dialogflow CX webhook response body.
 
-        img = mapped.get("selected_car_image")
+    Shared by the Flask route below and the ASGI app in asgi.py. Searches
+    answer by `deadline` (default: WEBHOOK_TIMEOUT from now).
+    """
+    if tag in OPTION_HANDLERS:
+        reply, details = OPTION_HANDLERS[tag](params, deadline)
+        return options_response(tag, reply, details)
+
+    if tag in SELECT_HANDLERS:
+        handler, image_param, alt = SELECT_HANDLERS[tag]
+        mapped, preview = handler(params)
+
+        messages = [text_message(preview)]
+
+        img = images.card_url(mapped.get(image_param)) if image_param else None
         if img:
             messages.append({
                 "payload": {
-                    "richContent": [[
-                        {
-                            "type": "image",
-                            "rawUrl": img,
-                            "accessibilityText": "Selected rental car"
-                        }
-                    ]]
+                    "richContent": [[image_card(img, alt)]]
                 }
             })
 
-        return jsonify({
+        return {
             "sessionInfo": {"parameters": mapped},
             "fulfillment_response": {"messages": messages}
-        })
+        }
 
-    if tag == "Car_Booking_Confirmation":
-        reply = handle_car_booking_confirmation(params)
-        return jsonify({
-            "fulfillment_response": {"messages": [{"text": {"text": [reply]}}]}
-        })
+    if tag in CONFIRM_HANDLERS:
+        reply = CONFIRM_HANDLERS[tag](params)
+        return {
+            "fulfillment_response": {"messages": [text_message(reply)]}
+        }
+
+    if tag == SESSION_END_TAG:
+        return {"fulfillment_response": {"messages": []}}
 
     # fallback
-    return jsonify({
-        "fulfillment_response": {"messages": [{"text": {"text": ["No handler matched this request."]}}]}
-    })
+    return {
+        "fulfillment_response": {"messages": [text_message("No handler matched this request.")]}
+    }
+
+
+def capture_render(tag, params):
+    """Confirmation summaries print the traveller's details: captures re-render them from redacted params"""
+    if tag in CONFIRM_HANDLERS:
+        return dispatch(tag, params)
+    return None
+
+
+traffic.render = capture_render
+
+
+@app.post("/webhook")
+def webhook():
+    deadline = Deadline()  # Dialogflow's timeout clock started when the request arrived
+    start = time.perf_counter()
+    req = request.get_json()
+    tag, params = webhook_request(req)
+    parsed = time.perf_counter()
+    try:
+        body = dispatch(tag, params, deadline)
+        dispatched = time.perf_counter()
+        res = jsonify(body)
+        if traffic.enabled:
+            done = time.perf_counter()
+            traffic.record(req, body, {
+                "parse": parsed - start, "dispatch": dispatched - parsed,
+                "serialize": done - dispatched, "total": done - start,
+            })
+        after_webhook(req, tag, params, body)
+        return res
+    finally:
+        observe_webhook(tag, time.perf_counter() - start)
 
 
 
@@ -972,16 +1541,9 @@ def webhook():
 # ============================================================
 # ⭐ SIMPLE STREAMLIT CHAT ENDPOINT (NOT FOR DIALOGFLOW)
 # ============================================================
-@app.post("/chat")
-def chat_ui():
-    """
-    This endpoint is ONLY for Streamlit UI.
-    It expects: { "query": "hello" }
-    It returns: { "reply": "..." }
-    """
-
-    req = request.get_json()
-    user_msg = req.get("query", "").lower()
+def chat_reply(query):
+    """Keyword reply for the Streamlit UI"""
+    user_msg = (query or "").lower()
 
     # ==== SUPER BASIC LOGIC (OPTIONAL) ====
     # Instead of writing logic, we call your DF webhook pipeline 1:1.
@@ -995,19 +1557,100 @@ def chat_ui():
 
     # For now: simple “intelligence”
     if "flight" in user_msg:
-        reply = "Sure! I can help with flights. Tell me departure city, destination city, and date."
+        return "Sure! I can help with flights. Tell me departure city, destination city, and date."
     elif "hotel" in user_msg:
-        reply = "Okay! I need the hotel city, check-in, and check-out dates."
+        return "Okay! I need the hotel city, check-in, and check-out dates."
     elif "car" in user_msg:
-        reply = "Let me help with car rentals. What's your pick-up and drop-off city?"
+        return "Let me help with car rentals. What's your pick-up and drop-off city?"
     else:
-        reply = "I’m here to help with flights, hotels, and car rentals! Ask me anything."
+        return "I’m here to help with flights, hotels, and car rentals! Ask me anything."
+
+
+@app.post("/chat")
+def chat_ui():
+    """
+    This endpoint is ONLY for Streamlit UI.
+    It expects: { "query": "hello" }
+    It returns: { "reply": "..." }
+    """
+
+    req = request.get_json()
+    return jsonify({"reply": chat_reply(req.get("query", ""))})
+
+
+# ============================================================
+# PROVIDER STATS
+# ============================================================
+def stats_snapshot():
+    return {
+        "providers": providers.stats(),
+        "circuits": providers.breaker_stats(),
+        "caches": {
+            "flights": flight_cache.stats(),
+            "hotels": hotel_cache.stats(),
+            "cars": car_cache.stats(),
+        },
+        "geocode": geocoder.stats(),
+        "options": option_store.stats(),
+        "searches": searches.stats(),
+        "coalesced": inflight.stats(),
+        "prefetch": prefetcher.stats(),
+        "images": images.stats(),
+        "capture": traffic.stats(),
+    }
+
+
+@app.get("/stats")
+def provider_stats():
+    return jsonify(stats_snapshot())
+
 
-    return jsonify({"reply": reply})
+@app.get("/img/<key>")
+def image_proxy(key):
+    status, headers, body = images.load(key, request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers)
+
+
+# ============================================================
+# PROMETHEUS METRICS
+# ============================================================
+def cache_metrics():
+    """Cache counters for /metrics, read from the caches' own stats"""
+    caches = {
+        "flights": flight_cache.stats(),
+        "hotels": hotel_cache.stats(),
+        "cars": car_cache.stats(),
+        "geocode": geocoder.stats()["memory"],
+    }
+    lookups = []
+    ratios = []
+    for name, s in caches.items():
+        for result in ("hits", "stale_hits", "misses"):
+            if result in s:
+                lookups.append(({"cache": name, "result": result}, s[result]))
+        ratios.append(({"cache": name}, s["hit_rate"]))
+
+    yield "tripsage_cache_lookups_total", "counter", "Result cache lookups by outcome", lookups
+    yield "tripsage_cache_hit_ratio", "gauge", "Share of lookups answered from cache", ratios
+
+
+metrics.register_collector(cache_metrics)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 # ============================================================
 # START SERVER
 # ============================================================
+# Fetch the first token now and keep renewing it off the request path
+if AMADEUS_API_KEY and AMADEUS_API_SECRET:
+    amadeus_tokens.start()
+
 if __name__ == "__main__":
+    # Only when serving: importing app (tests, bench.py) opens no connections
+    if os.getenv("HTTP_WARMUP", "1") == "1":
+        providers.warm_up()
     app.run(port=8080, host="0.0.0.0")
\ No newline at end of file
@@ -0,0 +1,561 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import requests
+
+import metrics
+import providers
+import query_plan
+from app import (
+    CAR_API_URL, CAR_MAX_RESPONSE_BYTES, FLIGHT_URL, HOTEL_MAX_PAGES,
+    HOTEL_PAGE_DEADLINE, HOTEL_PAGE_PARALLELISM, HOTEL_PAGE_SIZE, HOTEL_URL,
+    TRIP_PARTS,
+    affordable_count, after_webhook, amadeus_tokens, cached_cars, cached_flight_offers,
+    cached_hotels, car_cache, car_options_reply, car_query, car_search_request,
+    chat_reply, dispatch, fetch_cars, fetch_hotels, flight_cache,
+    flight_offers_from_payload, flight_options_reply, flight_query,
+    flight_search_query, hotel_cache, hotel_options_reply, hotel_query, images,
+    hotel_search_request, hotels_from_payload, options_response, possibly_stale,
+    observe_webhook, remember_any_budget, searching_reply, stats_snapshot, still_searching, traffic,
+    trip_package_reply, trip_part_params,
+    webhook_request, with_airports,
+)
+from car_parser import CarResultsParser
+from circuit import ProviderUnavailable
+from deadline import Deadline
+from singleflight import AsyncSingleFlight
+
+
+# ============================================================
+# ASYNC (ASGI) SERVING MODE
+# ============================================================
+# Same routes, handlers and response bodies as the Flask app, served on
+# one event loop:
+#
+#     uvicorn asgi:app --host 0.0.0.0 --port 8080
+#
+# Only the provider round-trips differ: they go through httpx async
+# clients (providers.arequest / astream), so a slow Amadeus, Booking or
+# Priceline call parks a coroutine instead of a thread. Parameter parsing,
+# caches, ranking and reply text are the functions from app.py. Background
+# stale-cache refreshes still use the blocking fetchers on the cache pool.
+
+# Late hotel pages and trip-package parts keep running after the reply;
+# hold references here
+_background = set()
+
+
+def _forget(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print("Background search failed:", task.exception())
+
+
+async def amadeus_token():
+    return amadeus_tokens.peek() or await asyncio.to_thread(amadeus_tokens.get)
+
+
+class AsyncBackgroundSearches:
+    """deadline.BackgroundSearches for coroutines: one task per search key"""
+
+    def __init__(self):
+        self._pending = {}  # key -> Task
+        self.started = 0
+        self.joined = 0
+        self.timed_out = 0
+
+    async def run(self, key, search, deadline):
+        """-> (True, result), or (False, None) if still running at the reply deadline"""
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(search())
+            self._pending[key] = task
+            self.started += 1
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.joined += 1
+
+        try:
+            return True, await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return False, None
+
+    def _finished(self, key, task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if not task.cancelled():
+            task.exception()  # retrieved by whoever awaited it; don't warn on the rest
+
+    def stats(self):
+        return {
+            "in_flight": len(self._pending),
+            "started": self.started,
+            "joined": self.joined,
+            "timed_out": self.timed_out,
+        }
+
+
+searches = AsyncBackgroundSearches()
+
+
+inflight = AsyncSingleFlight()
+
+
+async def fetch_once_async(part, cache, key, fetch):
+    """Async fetch_once(): fetch is a coroutine function"""
+    async def run():
+        value = await fetch()
+        if value is not None:
+            cache.set(key, value)
+        return value
+
+    return await inflight.do((part, key), run)
+
+
+async def run_search_async(part, search, query, deadline=None):
+    """Async run_search(): search(**query) under the turn's deadline -> (done, result)"""
+    deadline = deadline or Deadline()
+    key = (part, tuple(sorted(query.items())))
+    return await searches.run(key, lambda: search(**query, deadline=deadline), deadline)
+
+
+# ============================================================
+# FLIGHTS
+# ============================================================
+async def search_flight_offers_async(origin, destination, date, cabin, currency="USD", max_results=None,
+                                     non_stop=False, deadline=None):
+    key = (origin, destination, date, cabin, currency, max_results, non_stop)
+    offers = flight_cache.get(key)
+    if offers is not None:
+        return offers
+
+    return await fetch_once_async(
+        "flights", flight_cache, key,
+        lambda: fetch_flight_offers_async(origin, destination, date, cabin, currency, max_results, non_stop, deadline),
+    )
+
+
+async def fetch_flight_offers_async(origin, destination, date, cabin, currency="USD", max_results=None,
+                                    non_stop=False, deadline=None):
+    token = await amadeus_token()
+    query = flight_search_query(origin, destination, date, cabin, currency, max_results, non_stop)
+
+    res = await providers.aget(
+        "amadeus", FLIGHT_URL, headers={"Authorization": f"Bearer {token}"}, params=query,
+        deadline=deadline,
+    )
+
+    # Token revoked/expired early -> fetch a fresh one and retry once
+    if res.status_code == 401:
+        amadeus_tokens.invalidate(token)
+        token = await amadeus_token()
+        res = await providers.aget(
+            "amadeus", FLIGHT_URL, headers={"Authorization": f"Bearer {token}"}, params=query,
+            deadline=deadline,
+        )
+
+    if res.status_code != 200:
+        raise requests.HTTPError(f"Amadeus returned {res.status_code}", response=res)
+
+    return flight_offers_from_payload(providers.json_body("amadeus", res))
+
+
+async def handle_flight_options_async(params, deadline=None):
+    query, missing = flight_query(params)
+    if missing:
+        return missing, {}
+
+    try:
+        done, offers = await run_search_async("flights", search_flight_offers_async, query, deadline)
+    except ProviderUnavailable as e:
+        offers = cached_flight_offers(**query)
+        if offers is None:
+            return f"Flight search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(await asyncio.to_thread(flight_options_reply, params, offers))
+    except requests.HTTPError as e:
+        return f"Flight search failed ({e.response.status_code}). Try again.", {}
+    except (requests.RequestException, httpx.HTTPError) as e:
+        return f"Flight search failed (network). {e}", {}
+    except Exception as e:
+        return f"Flight search failed. {e}", {}
+    if not done:
+        return await asyncio.to_thread(
+            searching_reply, "flights", cached_flight_offers(**query), lambda offers: flight_options_reply(params, offers)
+        )
+
+    return await asyncio.to_thread(flight_options_reply, params, offers)
+
+
+# ============================================================
+# HOTELS
+# ============================================================
+async def fetch_hotels_async(dest_id, checkin, checkout, guests="2", rooms="1", offset=0,
+                             filters=query_plan.NO_HOTEL_FILTERS, deadline=None):
+    headers, query = hotel_search_request(dest_id, checkin, checkout, guests, rooms, offset, filters)
+    res = await providers.aget("booking", HOTEL_URL, headers=headers, params=query, deadline=deadline)
+    hotels = hotels_from_payload(providers.json_body("booking", res))
+    remember_any_budget((dest_id, checkin, checkout, guests, rooms, offset), hotels)
+    return hotels
+
+
+async def hotel_page_async(dest_id, checkin, checkout, guests="2", rooms="1", offset=0,
+                           filters=query_plan.NO_HOTEL_FILTERS, deadline=None):
+    key = (dest_id, checkin, checkout, guests, rooms, offset, filters)
+    page = hotel_cache.get(
+        key, lambda: fetch_hotels(dest_id, checkin, checkout, guests, rooms, offset, filters)
+    )
+    if page is None:
+        page = await fetch_once_async(
+            "hotels", hotel_cache, key,
+            lambda: fetch_hotels_async(dest_id, checkin, checkout, guests, rooms, offset, filters, deadline),
+        )
+    return page
+
+
+async def search_hotels_async(dest_id, checkin, checkout, budget=None, k=3, guests="2", rooms="1", deadline=None):
+    """Async search_hotels(): same paging rules, pages fetched as tasks"""
+    filters = query_plan.hotel_filters(checkin, checkout, budget)
+    first = await hotel_page_async(dest_id, checkin, checkout, guests, rooms, 0, filters, deadline)
+    if first is None or budget is None:
+        return first
+
+    found = affordable_count(first, budget)
+    if found >= k or len(first) < HOTEL_PAGE_SIZE:
+        return first
+
+    pages = {0: first}
+    pending = {}
+    next_page = 1
+    paging_ends = time.monotonic() + HOTEL_PAGE_DEADLINE
+
+    while found < k:
+        while len(pending) < HOTEL_PAGE_PARALLELISM and next_page < HOTEL_MAX_PAGES:
+            task = asyncio.ensure_future(hotel_page_async(
+                dest_id, checkin, checkout, guests, rooms, next_page * HOTEL_PAGE_SIZE, filters, deadline
+            ))
+            pending[task] = next_page
+            next_page += 1
+
+        remaining = paging_ends - time.monotonic()
+        if deadline is not None:
+            remaining = min(remaining, deadline.remaining())
+        if not pending or remaining <= 0:
+            break
+
+        finished, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not finished:
+            break
+
+        for task in finished:
+            n = pending.pop(task)
+            try:
+                page = task.result()
+            except Exception as e:
+                print("Hotel page error:", e)
+                page = None
+
+            if page:
+                pages[n] = page
+                found += affordable_count(page, budget)
+            # Short or empty page -> nothing after it, stop scheduling more
+            if not page or len(page) < HOTEL_PAGE_SIZE:
+                next_page = HOTEL_MAX_PAGES
+
+    # Late pages keep running in the background and still land in the cache
+    for task in pending:
+        _background.add(task)
+        task.add_done_callback(_forget)
+
+    return [h for n in sorted(pages) for h in pages[n]]
+
+
+async def handle_hotel_options_async(params, deadline=None):
+    query, problem = hotel_query(params)
+    if problem:
+        return problem, {}
+
+    try:
+        done, candidates = await run_search_async("hotels", search_hotels_async, query, deadline)
+    except ProviderUnavailable as e:
+        candidates = cached_hotels(**query)
+        if candidates is None:
+            return f"Hotel search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(await asyncio.to_thread(hotel_options_reply, query, candidates))
+    except (requests.RequestException, httpx.HTTPError) as e:
+        return f"Hotel search failed (network). {e}", {}
+    except Exception as e:
+        print("Hotel search failed:", repr(e))
+        return f"Hotel search failed. {e}", {}
+    if not done:
+        return await asyncio.to_thread(
+            searching_reply, "hotels", cached_hotels(**query), lambda hotels: hotel_options_reply(query, hotels)
+        )
+
+    return await asyncio.to_thread(hotel_options_reply, query, candidates)
+
+
+# ============================================================
+# CARS
+# ============================================================
+async def fetch_cars_async(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time, deadline=None):
+    headers, search_params = car_search_request(
+        pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time
+    )
+
+    parser = CarResultsParser()
+    async with providers.astream(
+        "priceline", "GET", CAR_API_URL, headers=headers, params=search_params, deadline=deadline
+    ) as res:
+        if res.status_code != 200:
+            raise requests.HTTPError(f"Priceline returned {res.status_code}", response=res)
+
+        # Stream results_list entry by entry straight into CarOffer records
+        async for chunk in providers.aiter_body(res, CAR_MAX_RESPONSE_BYTES):
+            parser.feed(chunk)
+            if parser.done:
+                break
+        cars = parser.close()
+    providers.observe_parse("priceline", parser.seconds)
+
+    return with_airports(cars, pickup_code, dropoff_code)
+
+
+async def search_cars_async(pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time, deadline=None):
+    args = (pickup_code, dropoff_code, pickup_date, dropoff_date, pickup_time, dropoff_time)
+    cars = car_cache.get(args, lambda: fetch_cars(*args))
+    if cars is None:
+        cars = await fetch_once_async("cars", car_cache, args, lambda: fetch_cars_async(*args, deadline=deadline))
+    return cars
+
+
+async def handle_car_rental_options_async(params, deadline=None):
+    # Airport resolution may geocode an unknown town (SQLite + Geoapify)
+    query, problem = await asyncio.to_thread(car_query, params)
+    if problem:
+        return problem, {}
+
+    try:
+        done, cars = await run_search_async("cars", search_cars_async, query, deadline)
+    except ProviderUnavailable as e:
+        cars = cached_cars(**query)
+        if cars is None:
+            return f"Car search is unavailable right now ({e}). Please try again in a minute.", {}
+        return possibly_stale(await asyncio.to_thread(car_options_reply, query, cars))
+    except requests.HTTPError as e:
+        return f"Car search failed ({e.response.status_code}). Try again.", {}
+    except Exception as e:
+        return f"Car search failed (network). {e}", {}
+    if not done:
+        return await asyncio.to_thread(
+            searching_reply, "cars", cached_cars(**query), lambda cars: car_options_reply(query, cars)
+        )
+
+    return await asyncio.to_thread(car_options_reply, query, cars)
+
+
+# ============================================================
+# TRIP PACKAGE
+# ============================================================
+async def handle_trip_package_async(params, deadline=None):
+    deadline = deadline or Deadline()
+    part_params = trip_part_params(params)
+    tasks = {
+        part: asyncio.ensure_future(ASYNC_PART_HANDLERS[part](part_params[part], deadline))
+        for part, _, _ in TRIP_PARTS
+    }
+    await asyncio.wait(tasks.values(), timeout=deadline.remaining())
+
+    outcomes = []
+    for part, icon, _ in TRIP_PARTS:
+        task = tasks[part]
+        if not task.done():
+            # Let it finish in the background; its result lands in the cache
+            _background.add(task)
+            task.add_done_callback(_forget)
+            outcomes.append((part, icon, None))
+            continue
+        try:
+            outcomes.append((part, icon, task.result()))
+        except Exception as e:
+            print(f"Trip package {part} search failed:", e)
+            outcomes.append((part, icon, (f"{icon} {part.capitalize()} search failed. {e}", {})))
+
+    return trip_package_reply(outcomes)
+
+
+# ============================================================
+# ROUTER
+# ============================================================
+ASYNC_PART_HANDLERS = {
+    "flights": handle_flight_options_async,
+    "hotels": handle_hotel_options_async,
+    "cars": handle_car_rental_options_async,
+}
+
+ASYNC_OPTION_HANDLERS = {
+    "Flight_Options": handle_flight_options_async,
+    "Hotel_Options": handle_hotel_options_async,
+    "Car_Rental_Options": handle_car_rental_options_async,
+    "Trip_Package": handle_trip_package_async,
+}
+
+
+async def dispatch_async(tag, params, deadline=None):
+    """Async dispatch(): searches are awaited; the option store (SQLite) is
+    read and written on worker threads, off the event loop"""
+    handler = ASYNC_OPTION_HANDLERS.get(tag)
+    if handler is None:
+        return await asyncio.to_thread(dispatch, tag, params)
+
+    reply, details = await handler(params, deadline)
+    return await asyncio.to_thread(options_response, tag, reply, details)
+
+
+async def webhook(req):
+    deadline = Deadline()
+    start = time.perf_counter()
+    tag, params = webhook_request(req)
+    parsed = time.perf_counter()
+    try:
+        body = await dispatch_async(tag, params, deadline)
+        if traffic.enabled:
+            done = time.perf_counter()
+            # The body is serialized after this returns, so there is no "serialize" stage here
+            traffic.record(req, body, {"parse": parsed - start, "dispatch": done - parsed, "total": done - start})
+        after_webhook(req, tag, params, body)
+        return body
+    finally:
+        observe_webhook(tag, time.perf_counter() - start)
+
+
+async def chat(req):
+    return {"reply": chat_reply(req.get("query", ""))}
+
+
+async def stats(req):
+    return {**stats_snapshot(), "searches": searches.stats(), "coalesced": inflight.stats()}
+
+
+async def prometheus_metrics(req):
+    return metrics.render()
+
+
+ROUTES = {
+    ("POST", "/webhook"): webhook,
+    ("POST", "/chat"): chat,
+    ("GET", "/stats"): stats,
+    ("GET", "/metrics"): prometheus_metrics,
+}
+
+
+# ============================================================
+# ASGI PLUMBING
+# ============================================================
+async def read_json(receive):
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return json.loads(body or b"null")
+
+
+async def send_text(send, status, text):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload):
+    # Same compact, key-sorted encoding as Flask's jsonify
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_image(send, scope):
+    """GET /img/<key> through the image proxy (disk reads and fetches off the loop)"""
+    key = scope["path"][len("/img/"):]
+    etag = dict(scope.get("headers") or []).get(b"if-none-match", b"").decode("latin-1")
+    status, headers, body = await asyncio.to_thread(images.load, key, etag)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+        + [(b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if os.getenv("HTTP_WARMUP", "1") == "1":
+                task = asyncio.ensure_future(providers.awarm_up())
+                _background.add(task)
+                task.add_done_callback(_forget)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await providers.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    if scope["method"] == "GET" and scope["path"].startswith("/img/"):
+        await send_image(send, scope)
+        return
+
+    route = ROUTES.get((scope["method"], scope["path"]))
+    if route is None:
+        known = any(path == scope["path"] for _, path in ROUTES)
+        await send_json(send, 405 if known else 404, {"error": "method not allowed" if known else "not found"})
+        return
+
+    req = None
+    if scope["method"] == "POST":
+        try:
+            req = await read_json(receive)
+        except ValueError:
+            req = None
+        if not isinstance(req, dict):
+            await send_json(send, 400, {"error": "expected a JSON object"})
+            return
+
+    try:
+        payload = await route(req)
+    except Exception as e:
+        print("Request failed:", e)
+        await send_json(send, 500, {"error": "internal error"})
+        return
+
+    if isinstance(payload, str):
+        await send_text(send, 200, payload)
+    else:
+        await send_json(send, 200, payload)
@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+# Offline: no Amadeus token refresh on import
+os.environ["AMADEUS_API_KEY"] = ""
+os.environ["AMADEUS_API_SECRET"] = ""
+
+import app
+from car_parser import parse_cars
+from offers import FlightOffer
+from simulator import CARS_FIXTURE, HOTELS_FIXTURE, synthetic_flight_offers
+
+
+# ============================================================
+# OFFLINE MICROBENCHMARKS
+# ============================================================
+# Times the pure-Python hot paths of a webhook turn against the checked-in
+# payloads, with no network involved:
+#
+#     python bench.py                   # compare against bench_baseline.json
+#     python bench.py --save            # record a new baseline
+#     python bench.py -k car --threshold 0.5
+#
+# Each benchmark reports the best per-call time over several rounds, and
+# the peak and retained bytes of one call under tracemalloc (measured in a
+# separate pass so tracing doesn't skew the timings).
+#
+# Absolute timings only mean something on the machine that took them, so
+# the gate compares "relative" cost instead: each benchmark's time divided
+# by the time of a fixed calibration loop measured just before it in the
+# same process (median over the rounds). A run exits with status 1 when
+# any benchmark's relative cost or peak allocation is more than
+# --threshold (default 25%) over the baseline.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+# Allocation changes smaller than this are noise, whatever the ratio
+_ALLOC_SLACK = 4096
+
+CHUNK_SIZE = 64 * 1024
+FLIGHT_OFFERS = 250
+
+
+def load_fixtures():
+    with open(CARS_FIXTURE, "rb") as f:
+        car_body = f.read()
+    with open(HOTELS_FIXTURE, encoding="utf-8") as f:
+        hotel_payload = json.load(f)
+
+    flight_payload = synthetic_flight_offers(FLIGHT_OFFERS)
+    return {
+        "car_chunks": [car_body[i:i + CHUNK_SIZE] for i in range(0, len(car_body), CHUNK_SIZE)],
+        "cars": app.with_airports(parse_cars(car_body), "JFK", "JFK"),
+        "hotel_payload": hotel_payload,
+        "hotels": app.hotels_from_payload(hotel_payload),
+        "flight_payload": flight_payload,
+        "flights": app.flight_offers_from_payload(flight_payload),
+    }
+
+
+# Fixed pure-Python workload every benchmark is measured against
+_CALIBRATION_ROWS = [{"id": i, "name": f"offer {i}", "price": i * 1.5, "tags": ["a", "b"]} for i in range(200)]
+
+
+def calibration():
+    rows = json.loads(json.dumps(_CALIBRATION_ROWS))
+    return sorted(rows, key=lambda r: -r["price"])[:3]
+
+
+class _KeepNothingStore:
+    """option_store stand-in for the timed calls: reads go to the real
+    store, puts are dropped, so reply benchmarks time ranking and
+    formatting rather than store inserts (and don't fill the store)"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def put(self, options):
+        return None
+
+    def get(self, ref):
+        return self._store.get(ref)
+
+
+def benchmarks(fx):
+    """name -> zero-argument callable"""
+    car_query = {"pickup_date": "05/01/2026", "dropoff_date": "05/04/2026"}
+    hotel_query = {"checkin": "2026-05-01", "checkout": "2026-05-04", "budget": 1000000}
+    layover_params = {"layover_city": "Frankfurt"}
+
+    _, hotel_details = app.hotel_options_reply(hotel_query, fx["hotels"])
+    _, car_details = app.car_options_reply(car_query, fx["cars"])
+    trip_details = {**hotel_details, **car_details}
+    hotel_body = app.options_response("Hotel_Options", "reply", hotel_details)
+
+    def layover_scan():
+        flights = fx["flights"]
+        return sum(1 for code in ("FRA", "CDG", "LHR", "DXB") for o in flights if app.offer_has_layover_city(o, code))
+
+    def jsonify_response():
+        with app.app.app_context():
+            return app.jsonify(hotel_body).get_data()
+
+    return {
+        "car_parse": lambda: parse_cars(fx["car_chunks"]),
+        "car_rank_format": lambda: app.car_options_reply(car_query, fx["cars"]),
+        "hotel_parse": lambda: app.hotels_from_payload(fx["hotel_payload"]),
+        "hotel_filter_rank": lambda: app.hotel_options_reply(hotel_query, fx["hotels"]),
+        "flight_parse": lambda: [FlightOffer.from_amadeus(o) for o in fx["flight_payload"]["data"]],
+        "flight_layover_scan": layover_scan,
+        "flight_layover_reply": lambda: app.flight_options_reply(layover_params, fx["flights"]),
+        "rich_cards_trip": lambda: app.options_response("Trip_Package", "reply", trip_details),
+        "jsonify_hotel_response": jsonify_response,
+    }
+
+
+# ============================================================
+# MEASUREMENT
+# ============================================================
+def _timer(fn, min_round):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return timer, max(1, int(number * min_round / 0.2))
+
+
+def time_per_call(fn, rounds=15, min_round=0.1):
+    """(best, median) seconds per call of fn, and its median cost relative
+    to the calibration loop.
+
+    Each round times the calibration loop right before fn, so a ratio is
+    taken under the same machine load.
+    """
+    timer, number = _timer(fn, min_round)
+    calib, calib_number = _timer(calibration, min_round / 2)
+    per_call, ratios = [], []
+    for _ in range(rounds):
+        base = calib.timeit(calib_number) / calib_number
+        t = timer.timeit(number) / number
+        per_call.append(t)
+        ratios.append(t / base)
+    return min(per_call), statistics.median(per_call), statistics.median(ratios)
+
+
+def allocations(fn):
+    """(peak bytes, retained bytes) of one warm call under tracemalloc"""
+    fn()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before, current - before
+
+
+def run(selected=None):
+    fx = load_fixtures()
+    results = {}
+    store = app.option_store
+    benches = benchmarks(fx)
+    app.option_store = _KeepNothingStore(store)
+    try:
+        for name, fn in benches.items():
+            if selected and not any(k in name for k in selected):
+                continue
+            best, median, relative = time_per_call(fn)
+            peak, retained = allocations(fn)
+            results[name] = {
+                "best_us": round(best * 1e6, 2),
+                "median_us": round(median * 1e6, 2),
+                "relative": round(relative, 4),
+                "peak_bytes": peak,
+                "retained_bytes": retained,
+            }
+    finally:
+        app.option_store = store
+    return results
+
+
+def regressions(results, baseline, threshold):
+    found = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if "relative" in base and r["relative"] > base["relative"] * (1 + threshold):
+            found.append(f"{name}: {r['relative']}x calibration vs baseline {base['relative']}x")
+        if r["peak_bytes"] > base["peak_bytes"] * (1 + threshold) + _ALLOC_SLACK:
+            found.append(f"{name}: peak {r['peak_bytes']} B vs baseline {base['peak_bytes']} B")
+    return found
+
+
+def print_table(results, baseline):
+    print(f"{'benchmark':<24} {'best us':>10} {'median us':>10} {'relative':>9} "
+          f"{'peak KiB':>9} {'kept KiB':>9} {'vs base':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        change = f"{(r['relative'] / base['relative'] - 1) * 100:+.0f}%" if base and base.get("relative") else "-"
+        print(f"{name:<24} {r['best_us']:>10.1f} {r['median_us']:>10.1f} {r['relative']:>9.3f} "
+              f"{r['peak_bytes'] / 1024:>9.1f} {r['retained_bytes'] / 1024:>9.1f} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the webhook hot paths")
+    parser.add_argument("-k", action="append", dest="selected", help="only benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    results = run(args.selected)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    found = regressions(results, baseline, args.threshold)
+    if found:
+        print(f"\nREGRESSION (more than {args.threshold:.0%} over baseline):", file=sys.stderr)
+        for line in found:
+            print("  " + line, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
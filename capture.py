@@ -0,0 +1,201 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+
+
+# ============================================================
+# TRAFFIC CAPTURE CONFIG
+# ============================================================
+# Records webhook traffic (request, response, per-stage timings) to a
+# rotating JSONL file for replay (loadtest.py), cache warming and perf
+# analysis. Off unless TRAFFIC_CAPTURE_PATH is set. "{pid}" in the path is
+# replaced by the process id, so several workers don't share one file.
+#
+# The request path only appends to an in-memory queue; a background thread
+# redacts, serializes and writes records in batches. When the queue is
+# full, records are dropped (and counted) rather than slowing a reply.
+#
+# Sampling is per Dialogflow session, so a captured conversation is always
+# complete. Redacted fields are masked wherever they appear as parameters.
+# Replies that render them as text (the booking confirmation summaries) are
+# not scrubbed by value: `render(tag, params)` re-renders them from the
+# redacted parameters, and its body replaces the captured response.
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "1.0"))
+TRAFFIC_CAPTURE_REDACT = os.getenv(
+    "TRAFFIC_CAPTURE_REDACT",
+    "username,useremail,userdob,passenger2_name,passenger2_email,passenger2_dob",
+)
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "5"))
+TRAFFIC_CAPTURE_QUEUE = int(os.getenv("TRAFFIC_CAPTURE_QUEUE", "10000"))
+TRAFFIC_CAPTURE_BATCH = int(os.getenv("TRAFFIC_CAPTURE_BATCH", "256"))
+TRAFFIC_CAPTURE_FLUSH_SECONDS = float(os.getenv("TRAFFIC_CAPTURE_FLUSH_SECONDS", "1"))
+
+REDACTED = "[redacted]"
+
+
+def redact(value, fields):
+    """Copy of a JSON value with every key in `fields` masked"""
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if k in fields and v not in (None, "") else redact(v, fields)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v, fields) for v in value]
+    return value
+
+
+class TrafficCapture:
+    def __init__(self, path=TRAFFIC_CAPTURE_PATH, sample=TRAFFIC_CAPTURE_SAMPLE,
+                 redact_fields=TRAFFIC_CAPTURE_REDACT, max_bytes=TRAFFIC_CAPTURE_MAX_BYTES,
+                 backups=TRAFFIC_CAPTURE_BACKUPS, queue_size=TRAFFIC_CAPTURE_QUEUE,
+                 batch=TRAFFIC_CAPTURE_BATCH, flush_every=TRAFFIC_CAPTURE_FLUSH_SECONDS,
+                 render=None):
+        self.path = path.replace("{pid}", str(os.getpid())) if path else ""
+        self.enabled = bool(self.path) and sample > 0
+        self.sample = sample
+        self.fields = frozenset(f.strip() for f in redact_fields.split(",") if f.strip())
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch = batch
+        self.flush_every = flush_every
+        self.render = render  # (tag, redacted params) -> response body, or None to keep the reply
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._file = None
+        self._thread = None
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+
+    # ---------------- request path ----------------
+    def sampled(self, session):
+        if self.sample >= 1:
+            return True
+        if session:
+            return zlib.crc32(session.encode()) % 10000 < self.sample * 10000
+        return random.random() < self.sample
+
+    def record(self, req, response, timings):
+        """Queue one webhook exchange; never blocks"""
+        if not self.enabled:
+            return
+        session = ((req or {}).get("sessionInfo") or {}).get("session")
+        if not self.sampled(session):
+            return
+
+        self._start()
+        entry = {
+            "ts": time.time(),
+            "session": session,
+            "request": req,
+            "response": response,
+            "timings_ms": {k: round(v * 1000, 2) for k, v in timings.items()},
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.captured += 1
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    # ---------------- writer thread ----------------
+    def _serialize(self, entry):
+        entry["request"] = redact(entry["request"], self.fields)
+        entry["response"] = redact(entry["response"], self.fields)
+        if self.render is not None:
+            req = entry["request"] or {}
+            tag = ((req.get("fulfillmentInfo") or {}).get("tag") or "").strip()
+            params = (req.get("sessionInfo") or {}).get("parameters") or {}
+            body = self.render(tag, params)
+            if body is not None:
+                entry["response"] = redact(body, self.fields)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_every
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print("Traffic capture write failed:", e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        lines = []
+        for entry in batch:
+            try:
+                lines.append(self._serialize(entry))
+            except Exception as e:
+                print("Traffic capture skipped a record:", e)
+        data = "".join(lines).encode("utf-8")
+
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        with self._lock:
+            self.written += len(lines)
+            self.batches += 1
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        with self._lock:
+            self.rotations += 1
+
+    def flush(self):
+        """Wait until everything queued so far is on disk"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "captured": self.captured,
+                "dropped": self.dropped,
+                "written": self.written,
+                "batches": self.batches,
+                "rotations": self.rotations,
+                "queued": self._queue.qsize(),
+            }
@@ -0,0 +1,198 @@
+import codecs
+import json
+import re
+import time
+
+from offers import CarOffer
+
+
+# ============================================================
+# PRICELINE CAR RESULTS - STREAMING PARSER
+# ============================================================
+# The resultsRequest payload is ~1 MB, almost all of it inside
+# getCarResultsRequest.results.results_list (one object per car, each with
+# three copies of the price block, partner highlights, etc). Instead of
+# res.json() on the whole body, we feed socket chunks into a small buffer,
+# decode one results_list entry at a time as soon as it is complete,
+# project it down to a CarOffer and drop the rest. At any
+# moment we hold one entry plus one chunk, never the whole tree.
+
+RESULTS_PATH = ("getCarResultsRequest", "results", "results_list")
+
+_decoder = json.JSONDecoder()
+_WS = re.compile(r"[ \t\n\r]*")
+
+# Drop consumed text from the buffer once this much has piled up
+_COMPACT_AT = 64 * 1024
+
+
+class CarPayloadError(ValueError):
+    pass
+
+
+class _NeedMore(Exception):
+    """Value could not be decoded from the buffer yet.
+
+    Mid-stream this usually means the value continues in the next chunk;
+    at end of stream it means the payload is malformed.
+    """
+
+
+def _ws(s, i):
+    return _WS.match(s, i).end()
+
+
+def _char(s, i):
+    if i >= len(s):
+        raise _NeedMore()
+    return s[i]
+
+
+def _value(s, i):
+    """Decode the JSON value at i -> (value, end)"""
+    try:
+        return _decoder.raw_decode(s, i)
+    except json.JSONDecodeError as e:
+        raise _NeedMore(str(e))
+
+
+def _member_start(s, i, first):
+    """Position before an object member -> (key, value_index) or None at '}'"""
+    i = _ws(s, i)
+    ch = _char(s, i)
+    if ch == "}":
+        return None
+    if not first:
+        if ch != ",":
+            raise CarPayloadError(f"expected ',' or '}}' at offset {i}")
+        i = _ws(s, i + 1)
+
+    key, i = _value(s, i)
+    if not isinstance(key, str):
+        raise CarPayloadError(f"expected key at offset {i}")
+    i = _ws(s, i)
+    if _char(s, i) != ":":
+        raise CarPayloadError(f"expected ':' at offset {i}")
+    return key, _ws(s, i + 1)
+
+
+def _find(s, path):
+    """Index just inside the object at `path`, or None if it is absent"""
+    i = _ws(s, 0)
+    for name in path:
+        if _char(s, i) != "{":
+            return None
+        i += 1
+        first = True
+        while True:
+            member = _member_start(s, i, first)
+            if member is None:
+                return None
+            key, vi = member
+            first = False
+            if key == name:
+                i = vi
+                break
+            _, i = _value(s, vi)
+    if _char(s, i) != "{":
+        return None
+    return i + 1
+
+
+class CarResultsParser:
+    """Push-style parser: feed() body chunks as they arrive, then close().
+
+    Works the same whether chunks come from a blocking iterator or an
+    async stream. `done` turns True once results_list has been fully read
+    (or is known to be absent); later chunks are ignored. `seconds` is the
+    time spent parsing so far (excluding waits for the network).
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = None      # index just inside results_list, once found
+        self._first = True
+        self._missing = False
+        self.done = False
+        self.cars = []
+        self.seconds = 0.0
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        start = time.perf_counter()
+        text = chunk if isinstance(chunk, str) else self._utf8.decode(chunk)
+        if text:
+            self._buf += text
+            self._advance(eof=False)
+        self.seconds += time.perf_counter() - start
+
+    def close(self):
+        """End of body -> list of CarOffer, or None if results_list is missing/empty"""
+        if not self.done:
+            start = time.perf_counter()
+            self._buf += self._utf8.decode(b"", final=True)
+            self._advance(eof=True)
+            self.seconds += time.perf_counter() - start
+            if not self.done:
+                raise CarPayloadError("malformed results_list: unexpected end of body")
+        if self._missing:
+            return None
+        return self.cars or None
+
+    def _advance(self, eof):
+        # 1) Everything before results_list is small: buffer until we reach it
+        if self._pos is None:
+            try:
+                pos = _find(self._buf, RESULTS_PATH)
+            except _NeedMore as e:
+                if eof:
+                    raise CarPayloadError(f"malformed car payload: {e}")
+                return
+            if pos is None:
+                self._missing = self.done = True
+                return
+            self._pos = pos
+
+        # 2) Decode entries one by one, dropping consumed text as we go
+        buf, pos = self._buf, self._pos
+        while True:
+            try:
+                member = _member_start(buf, pos, self._first)
+                if member is None:
+                    self.done = True
+                    break
+                key, vi = member
+                raw, end = _value(buf, vi)
+            except _NeedMore as e:
+                if eof:
+                    raise CarPayloadError(f"malformed results_list: {e}")
+                break
+
+            if isinstance(raw, dict):
+                self.cars.append(CarOffer.from_priceline(key, raw))
+            self._first = False
+            pos = end
+            if pos > _COMPACT_AT:
+                buf = buf[pos:]
+                pos = 0
+
+        self._buf, self._pos = buf, pos
+
+
+def parse_cars(chunks):
+    """Stream a resultsRequest body -> list of CarOffer.
+
+    `chunks` is an iterable of bytes (e.g. res.iter_content()) or a single
+    bytes/str body. Returns None when results_list is missing or empty.
+    """
+    if isinstance(chunks, (bytes, bytearray, str)):
+        chunks = [chunks]
+
+    parser = CarResultsParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser.close()
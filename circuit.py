@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+# ============================================================
+# CIRCUIT BREAKER CONFIG
+# ============================================================
+# Calls from the last BREAKER_WINDOW seconds are judged together. Once at
+# least BREAKER_MIN_CALLS are in the window, the circuit opens when
+#   - BREAKER_ERROR_RATE of them failed (network error, 5xx or 429), or
+#   - BREAKER_SLOW_RATE of them took longer than BREAKER_SLOW_CALL_SECONDS.
+# After BREAKER_OPEN_SECONDS it lets BREAKER_HALF_OPEN_CALLS probe calls
+# through: a healthy probe closes it, a failed one opens it again.
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "8"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(requests.ConnectionError):
+    """Call refused before it was sent"""
+
+    def __init__(self, provider, message):
+        super().__init__(f"{provider} {message}")
+        self.provider = provider
+
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+
+class BulkheadFull(ProviderUnavailable):
+    pass
+
+
+# ============================================================
+# CIRCUIT BREAKER + BULKHEAD (one per provider)
+# ============================================================
+class CircuitBreaker:
+    """Fails fast for a provider that is erroring or too slow.
+
+    Every call is wrapped as
+
+        breaker.acquire(limit)     # raises CircuitOpen / BulkheadFull
+        try: ... send ...
+        finally: breaker.release(ok, seconds)
+
+    `limit` is the bulkhead: at most that many calls to the provider in
+    flight at once, so one stuck provider cannot tie up every worker.
+    """
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, slow_call=BREAKER_SLOW_CALL_SECONDS,
+                 slow_rate=BREAKER_SLOW_RATE, open_for=BREAKER_OPEN_SECONDS,
+                 half_open_calls=BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._opened_at = 0.0
+        self._in_flight = 0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+        self.bulkhead_rejected = 0
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_for:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, "circuit is open")
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, "circuit is half-open, probe in flight")
+                self._probes += 1
+
+            if self._in_flight >= limit:
+                self.bulkhead_rejected += 1
+                if self.state == HALF_OPEN:
+                    self._probes -= 1
+                raise BulkheadFull(self.name, f"has {self._in_flight} calls in flight")
+            self._in_flight += 1
+
+    def release(self, ok, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            slow = seconds >= self.slow_call
+
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+                if ok and not slow:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                return  # a call that started before the circuit opened
+
+            self._calls.append((now, not ok, slow))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failed = sum(1 for _, f, _ in self._calls if f)
+            slowed = sum(1 for _, _, s in self._calls if s)
+            if failed / total >= self.error_rate or slowed / total >= self.slow_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.opened += 1
+        print(f"Circuit opened for {self.name}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "in_flight": self._in_flight,
+                "window_calls": len(self._calls),
+                "window_failures": sum(1 for _, f, _ in self._calls if f),
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "bulkhead_rejected": self.bulkhead_rejected,
+            }
@@ -0,0 +1,15 @@
+import os
+
+# The live-API smoke scripts call the real providers at import time; run
+# them by hand (python test_amadeus.py). pytest only collects the offline
+# unit tests.
+collect_ignore = [
+    "test_amadeus.py",
+    "test_car_rental.py",
+    "test_car_rental_format.py",
+    "test_geocode.py",
+    "test_hotels.py",
+]
+
+# Tests that import app keep their option handles in memory
+os.environ.setdefault("OPTION_STORE_PATH", "")
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import requests
+
+
+# ============================================================
+# WEBHOOK DEADLINE BUDGET
+# ============================================================
+# Dialogflow CX drops a webhook call after WEBHOOK_TIMEOUT seconds (5 s by
+# default, configurable per webhook in the agent). Every turn gets one
+# Deadline with two horizons:
+#
+#   reply_at    WEBHOOK_TIMEOUT - WEBHOOK_REPLY_MARGIN after the request
+#               arrived: handlers stop waiting and answer with what they have
+#   give_up_at  SEARCH_GRACE seconds later: a search still running in the
+#               background is abandoned (provider timeouts are clamped to it)
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_REPLY_MARGIN = float(os.getenv("WEBHOOK_REPLY_MARGIN", "0.5"))
+SEARCH_GRACE = float(os.getenv("SEARCH_GRACE", "20"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "32"))
+
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+
+class Deadline:
+    def __init__(self, reply_in=None, grace=SEARCH_GRACE):
+        if reply_in is None:
+            reply_in = WEBHOOK_TIMEOUT - WEBHOOK_REPLY_MARGIN
+        self.reply_at = time.monotonic() + reply_in
+        self.give_up_at = self.reply_at + grace
+
+    def remaining(self):
+        """Seconds left before the reply is due"""
+        return max(0.0, self.reply_at - time.monotonic())
+
+    def budget(self):
+        """Seconds left before background work is abandoned"""
+        return max(0.0, self.give_up_at - time.monotonic())
+
+    def timeout(self, timeout):
+        """Clamp a requests-style timeout (float or (connect, read)) to the budget"""
+        left = self.budget()
+        if left <= 0:
+            raise DeadlineExceeded("search budget exhausted")
+        if timeout is None:
+            return left
+        if isinstance(timeout, tuple):
+            return tuple(min(t, left) for t in timeout)
+        return min(timeout, left)
+
+
+# ============================================================
+# SEARCHES THAT OUTLIVE THEIR TURN
+# ============================================================
+class BackgroundSearches:
+    """Runs searches on a worker pool, keyed by their query.
+
+    run() waits until the turn's reply deadline. A search that is still
+    going keeps running; a later turn with the same key joins it instead of
+    starting over, and once it finishes its result is in the result caches.
+    """
+
+    def __init__(self, workers=SEARCH_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._pending = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.started = 0
+        self.joined = 0
+        self.timed_out = 0
+
+    def run(self, key, search, deadline):
+        """-> (True, result), or (False, None) if still running at the reply deadline.
+
+        Exceptions from search() propagate to the caller.
+        """
+        with self._lock:
+            fut = self._pending.get(key)
+            created = fut is None
+            if created:
+                fut = self._pool.submit(search)
+                self._pending[key] = fut
+                self.started += 1
+            else:
+                self.joined += 1
+        if created:
+            fut.add_done_callback(lambda f: self._finished(key, f))
+
+        try:
+            return True, fut.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            with self._lock:
+                self.timed_out += 1
+            return False, None
+
+    def _finished(self, key, fut):
+        with self._lock:
+            if self._pending.get(key) is fut:
+                del self._pending[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._pending),
+                "started": self.started,
+                "joined": self.joined,
+                "timed_out": self.timed_out,
+            }
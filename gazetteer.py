@@ -0,0 +1,227 @@
+import bisect
+import json
+import os
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+
+# ============================================================
+# OFFLINE CITY GAZETTEER
+# ============================================================
+# One bundled table (gazetteer.json) answers every "which city did the
+# user mean" question: metro IATA for flights, rental airport for cars,
+# coordinates for ground searches and the Booking dest_id for hotels.
+#
+# Lookups go exact name/alias -> unique prefix -> trigram fuzzy match, so
+# "new-york", "NewYork", "san fran" and "Chicgo" all resolve without a
+# network call. The file is read once, on first use.
+#
+# Fuzzy matching only forgives typos: trigrams pick the candidates, and a
+# candidate is accepted only within a few edits of what was typed (one per
+# GAZETTEER_FUZZY_CHARS_PER_EDIT characters) and only when no other city
+# is as close. Names shorter than GAZETTEER_FUZZY_MIN_LENGTH, on either
+# side, are matched exactly (a short alias like "york" is one edit from
+# "Cork"), the first letter has to match, and a query can't carry words
+# the entry doesn't have ("Manchester NH"). Towns that merely look alike
+# ("Newark", "Bern", "Lome") return None and go to geocoding / the
+# nearest-airport search.
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json"),
+)
+GAZETTEER_FUZZY_MIN_SCORE = float(os.getenv("GAZETTEER_FUZZY_MIN_SCORE", "0.3"))
+GAZETTEER_FUZZY_CHARS_PER_EDIT = int(os.getenv("GAZETTEER_FUZZY_CHARS_PER_EDIT", "5"))
+GAZETTEER_FUZZY_MIN_LENGTH = int(os.getenv("GAZETTEER_FUZZY_MIN_LENGTH", "6"))
+
+# Trigram candidates checked by edit distance
+_FUZZY_CANDIDATES = 10
+
+# Shorter queries ("san", "new") are only matched exactly
+_MIN_PREFIX = 4
+
+
+def normalize(name):
+    """" Zürich,  " -> "zurich"; "St. Louis" -> "st louis" """
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = "".join(ch if ch.isalnum() else " " for ch in text)
+    return " ".join(text.split())
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (a swap counts once), or limit + 1 if larger"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+        prev2, prev = prev, row
+    return min(prev[-1], limit + 1)
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class Place:
+    __slots__ = ("name", "metro", "airport", "lat", "lon", "dest_id")
+
+    def __init__(self, name, metro=None, airport=None, lat=None, lon=None, dest_id=None):
+        self.name = name
+        self.metro = metro        # IATA city code (NYC, LON), if the city has one
+        self.airport = airport    # main rental-capable airport (JFK, LHR)
+        self.lat = lat
+        self.lon = lon
+        self.dest_id = dest_id    # Booking.com city dest_id
+
+    @property
+    def coords(self):
+        """"lat,lon" string, or None"""
+        if self.lat is None or self.lon is None:
+            return None
+        return f"{self.lat},{self.lon}"
+
+    def __repr__(self):
+        return f"Place({self.name!r}, metro={self.metro!r}, airport={self.airport!r})"
+
+
+class Gazetteer:
+    def __init__(self, rows):
+        self.places = []
+        self._exact = {}        # normalized name/alias (and its space-less form) -> Place
+        self._trigrams = {}     # trigram -> set of keys containing it
+        self._key_grams = {}    # key -> Counter of its trigrams
+
+        for name, aliases, metro, airport, lat, lon, dest_id in rows:
+            place = Place(name, metro, airport, lat, lon, dest_id)
+            self.places.append(place)
+            for alias in [name, *aliases]:
+                key = normalize(alias)
+                for k in {key, key.replace(" ", "")}:
+                    self._exact.setdefault(k, place)
+
+        self._keys = sorted(self._exact)
+        for key in self._keys:
+            grams = _trigrams(key)
+            self._key_grams[key] = grams
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(key)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        fields = data["fields"]
+        order = [fields.index(f) for f in ("name", "aliases", "metro", "airport", "lat", "lon", "dest_id")]
+        return cls([[row[i] for i in order] for row in data["cities"]])
+
+    def __len__(self):
+        return len(self.places)
+
+    # ---------------- lookups ----------------
+    def exact(self, name):
+        key = normalize(name)
+        return self._exact.get(key) or self._exact.get(key.replace(" ", ""))
+
+    def prefix(self, name):
+        """Place whose name starts with `name`, if exactly one does"""
+        key = normalize(name)
+        if len(key) < _MIN_PREFIX:
+            return None
+        found = set()
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key):
+            found.add(self._exact[self._keys[i]])
+            i += 1
+        return found.pop() if len(found) == 1 else None
+
+    def fuzzy(self, name, min_score=GAZETTEER_FUZZY_MIN_SCORE, chars_per_edit=GAZETTEER_FUZZY_CHARS_PER_EDIT,
+              min_length=GAZETTEER_FUZZY_MIN_LENGTH):
+        """Typo-sized match -> (Place, edits), or (None, None).
+
+        The best trigram (Dice) candidates are checked by edit distance; the
+        closest one wins if it is within len(name) // chars_per_edit edits
+        (at least one) and no other city is as close. Names shorter than
+        min_length, the query's or a candidate's, are never fuzzy-matched.
+        """
+        key = normalize(name)
+        compact = key.replace(" ", "")
+        if len(compact) < max(min_length, _MIN_PREFIX):
+            return None, None
+        words = len(key.split())
+
+        grams = _trigrams(key)
+        size = sum(grams.values())
+        shared = Counter()
+        for gram, n in grams.items():
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] += min(n, self._key_grams[candidate][gram])
+
+        scored = []
+        for candidate, common in shared.items():
+            score = 2 * common / (size + sum(self._key_grams[candidate].values()))
+            if score >= min_score:
+                scored.append((score, candidate))
+        scored.sort(reverse=True)
+
+        limit = max(1, len(key) // chars_per_edit)
+        best, best_edits = set(), limit + 1
+        for _, candidate in scored[:_FUZZY_CANDIDATES]:
+            if (len(candidate.replace(" ", "")) < min_length or candidate[0] != key[0]
+                    or len(candidate.split()) < words):
+                continue
+            edits = edit_distance(compact if " " not in candidate else key, candidate, limit)
+            if edits > limit:
+                continue
+            if edits < best_edits:
+                best, best_edits = {self._exact[candidate]}, edits
+            elif edits == best_edits:
+                best.add(self._exact[candidate])
+
+        # Nothing close enough, or two cities equally close
+        if len(best) != 1:
+            return None, None
+        return best.pop(), best_edits
+
+    def lookup(self, name):
+        """Free-text city -> Place, or None if nothing is close enough"""
+        return self.exact(name) or self.prefix(name) or self.fuzzy(name)[0]
+
+
+# ============================================================
+# SHARED INSTANCE (loaded on first use)
+# ============================================================
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_gazetteer():
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Gazetteer.load()
+    return _default
+
+
+@lru_cache(maxsize=4096)
+def _lookup(key):
+    return get_gazetteer().lookup(key)
+
+
+def lookup(name):
+    """City name as typed by the user -> Place, or None"""
+    key = normalize(name)
+    if not key:
+        return None
+    return _lookup(key)
@@ -0,0 +1,211 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import providers
+from result_cache import TTLCache
+
+load_dotenv()
+
+
+# ============================================================
+# CONFIG
+# ============================================================
+GEO_API_KEY = os.getenv("GEO_API_KEY")
+GEOAPIFY_URL = providers.url("geoapify", "/v1/geocode/search")
+
+GEOCODE_DB_PATH = os.getenv("GEOCODE_DB_PATH", "geocode_cache.sqlite3")
+GEOCODE_TTL = int(os.getenv("GEOCODE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "4096"))
+
+# Marks a remembered "no results" in the in-memory front
+_NOT_FOUND = ()
+
+
+def normalize_name(name):
+    """" New  York " -> "new york" """
+    return " ".join((name or "").lower().split())
+
+
+def geoapify_fetch(city_name):
+    """Live Geoapify lookup -> (lat, lon), or None when there are no results.
+
+    Network/HTTP errors raise so they are never cached as "not found".
+    """
+    params = {
+        "text": city_name,
+        "format": "json",
+        "apiKey": GEO_API_KEY
+    }
+    r = providers.get("geoapify", GEOAPIFY_URL, params=params)
+    r.raise_for_status()
+    data = providers.json_body("geoapify", r)
+
+    if "results" not in data or len(data["results"]) == 0:
+        return None
+
+    res = data["results"][0]
+    return float(res["lat"]), float(res["lon"])
+
+
+# ============================================================
+# PERSISTENT GEOCODE CACHE
+# ============================================================
+class GeocodeCache:
+    """City name -> (lat, lon), remembered across restarts and workers.
+
+    Lookups go memory LRU -> SQLite file -> `fetch`. "No results" answers
+    are cached too, for a shorter `negative_ttl`. Expired rows are
+    refetched; if that fetch fails the expired value is still served.
+    SQLite runs in WAL mode so several worker processes can share the file.
+    """
+
+    def __init__(self, path, fetch, ttl=GEOCODE_TTL, negative_ttl=GEOCODE_NEGATIVE_TTL,
+                 memory_size=GEOCODE_MEMORY_SIZE):
+        self.path = path
+        self._fetch = fetch
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.db_hits = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+        self._conn()  # create the schema up front
+
+    # ---------------- storage ----------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " name TEXT PRIMARY KEY,"
+                " lat REAL,"
+                " lon REAL,"
+                " fetched_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _read(self, name):
+        return self._conn().execute(
+            "SELECT lat, lon, fetched_at FROM geocode WHERE name = ?", (name,)
+        ).fetchone()
+
+    def _write(self, name, coords):
+        lat, lon = coords if coords else (None, None)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO geocode (name, lat, lon, fetched_at) VALUES (?, ?, ?, ?)",
+            (name, lat, lon, time.time()),
+        )
+        conn.commit()
+
+    def _remember(self, name, coords, age=0.0):
+        ttl = (self.ttl if coords else self.negative_ttl) - age
+        if ttl > 0:
+            self._memory.set(name, coords or _NOT_FOUND, ttl=ttl)
+
+    # ---------------- lookups ----------------
+    def lookup(self, city_name):
+        name = normalize_name(city_name)
+        if not name:
+            return None
+
+        hit = self._memory.get(name)
+        if hit is not None:
+            return hit or None
+
+        row = self._read(name)
+        stale = None
+        if row is not None:
+            lat, lon, fetched_at = row
+            coords = (lat, lon) if lat is not None else None
+            age = time.time() - fetched_at
+            if age < (self.ttl if coords else self.negative_ttl):
+                with self._lock:
+                    self.db_hits += 1
+                self._remember(name, coords, age)
+                return coords
+            stale = coords
+
+        return self.refresh(name, stale)
+
+    def refresh(self, city_name, stale=None):
+        """Fetch live and store; on failure fall back to `stale`"""
+        name = normalize_name(city_name)
+        with self._lock:
+            self.fetches += 1
+        try:
+            coords = self._fetch(name)
+        except Exception as e:
+            with self._lock:
+                self.fetch_errors += 1
+            print("Geoapify error:", e)
+            return stale
+
+        self._write(name, coords)
+        self._remember(name, coords)
+        return coords
+
+    def seed(self, names, force=False):
+        """Bulk pre-seed: look up every name, refetching all if force=True"""
+        found = missing = 0
+        for city in names:
+            name = normalize_name(city)
+            if not name:
+                continue
+            coords = self.refresh(name) if force else self.lookup(name)
+            if coords:
+                found += 1
+            else:
+                missing += 1
+        return found, missing
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory": self._memory.stats(),
+                "db_hits": self.db_hits,
+                "fetches": self.fetches,
+                "fetch_errors": self.fetch_errors,
+            }
+
+
+# ============================================================
+# CLI: python geocache.py seed cities.txt [--force]
+# ============================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geocode cache tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="pre-seed the cache from a file of city names (one per line)")
+    seed.add_argument("file", help="path to the city list, or - for stdin")
+    seed.add_argument("--force", action="store_true", help="refetch cities that are already cached")
+
+    args = parser.parse_args(argv)
+
+    cache = GeocodeCache(GEOCODE_DB_PATH, geoapify_fetch)
+    if args.file == "-":
+        names = sys.stdin.read().splitlines()
+    else:
+        with open(args.file, encoding="utf-8") as f:
+            names = f.read().splitlines()
+
+    found, missing = cache.seed(names, force=args.force)
+    print(f"Seeded {GEOCODE_DB_PATH}: {found} resolved, {missing} unresolved")
+
+
+if __name__ == "__main__":
+    main()
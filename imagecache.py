@@ -0,0 +1,421 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image
+except ImportError:  # pinned in requirements.txt; without it originals are served unchecked
+    Image = None
+
+from result_cache import TTLCache
+
+
+# ============================================================
+# IMAGE PROXY CONFIG
+# ============================================================
+# Hotel/car cards normally point chat clients at full-size Booking and
+# Priceline CDN images. With IMAGE_PROXY_BASE set to this app's public URL
+# (e.g. the ngrok URL), cards point at /img/<key> instead:
+#   - <key> is a hash of the image URL, registered when a search result
+#     is shown; the proxy only ever fetches URLs it registered itself,
+#   - only https URLs on the provider CDNs in IMAGE_ALLOWED_HOSTS (or
+#     their subdomains) are registered or fetched: image URLs also come
+#     back from the session parameters, so anything else is dropped from
+#     the card rather than fetched by the server,
+#   - images are fetched on a thread pool as soon as they are registered,
+#     checked to be real images (content type, size, Pillow decode) and
+#     stored by the SHA-256 of their content, so duplicates share a file,
+#   - with Pillow installed, a card-sized JPEG thumbnail is made once and
+#     served instead of the original,
+#   - responses carry long-lived Cache-Control and ETag headers,
+#   - URLs that turn out dead (4xx, not an image) are remembered and left
+#     out of later cards.
+# Per-URL metadata lives in a bounded in-memory LRU backed by SQLite
+# (<IMAGE_CACHE_DIR>/images.sqlite3). Building a card only touches memory;
+# the database is read and written by the fetch pool and the /img route.
+IMAGE_PROXY_BASE = os.getenv("IMAGE_PROXY_BASE", "").strip().rstrip("/")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_FETCH_WORKERS = int(os.getenv("IMAGE_FETCH_WORKERS", "8"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+IMAGE_CONNECT_TIMEOUT = float(os.getenv("IMAGE_CONNECT_TIMEOUT", "3"))
+IMAGE_READ_TIMEOUT = float(os.getenv("IMAGE_READ_TIMEOUT", "10"))
+IMAGE_THUMB_SIZE = os.getenv("IMAGE_THUMB_SIZE", "480x320")
+IMAGE_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE", str(30 * 24 * 3600)))
+IMAGE_DEAD_TTL = int(os.getenv("IMAGE_DEAD_TTL", "86400"))
+IMAGE_META_MEMORY_SIZE = int(os.getenv("IMAGE_META_MEMORY_SIZE", "10000"))
+IMAGE_META_MAX_ROWS = int(os.getenv("IMAGE_META_MAX_ROWS", "100000"))
+IMAGE_ALLOWED_HOSTS = os.getenv("IMAGE_ALLOWED_HOSTS", "bstatic.com,pclncdn.com")
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+# Disk usage is checked every this many stored images
+_PRUNE_EVERY = 64
+
+
+def _thumb_size(spec):
+    w, _, h = spec.lower().partition("x")
+    return int(w), int(h or w)
+
+
+def _host_list(spec):
+    return tuple(h.strip().lower().lstrip(".") for h in spec.split(",") if h.strip())
+
+
+def allowed_url(url, hosts):
+    """https URL on the default port of one of `hosts` or a subdomain"""
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except (TypeError, ValueError):
+        return False
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https" or port not in (None, 443) or not host:
+        return False
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageCache:
+    def __init__(self, base=IMAGE_PROXY_BASE, root=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES,
+                 workers=IMAGE_FETCH_WORKERS, thumb_size=IMAGE_THUMB_SIZE, allowed_hosts=IMAGE_ALLOWED_HOSTS):
+        self.base = base
+        self.enabled = bool(base)
+        self.allowed_hosts = _host_list(allowed_hosts)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumb_size = _thumb_size(thumb_size)
+        self._blobs = os.path.join(root, "blobs")
+        self._db_path = os.path.join(root, "images.sqlite3")
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=workers))
+        self._pending = {}  # key -> Future
+        self._meta = TTLCache(maxsize=IMAGE_META_MEMORY_SIZE, ttl=IMAGE_MAX_AGE)  # key -> meta dict
+        self._lock = threading.Lock()
+        self._stored = 0
+        self.counts = {"fetched": 0, "dead": 0, "failed": 0, "thumbnails": 0, "served": 0,
+                       "not_modified": 0, "bytes_in": 0, "bytes_out": 0, "pruned": 0, "rows_pruned": 0,
+                       "rejected": 0}
+        if self.enabled:
+            os.makedirs(self._blobs, exist_ok=True)
+            self._conn()  # create the schema up front
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    # ---------------- metadata ----------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " key TEXT PRIMARY KEY,"
+                " url TEXT NOT NULL,"
+                " sha TEXT,"
+                " type TEXT,"
+                " thumb INTEGER,"
+                " size INTEGER,"
+                " dead_until REAL,"
+                " why TEXT,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS images_updated ON images (updated_at)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _load_meta(self, key):
+        """Memory, then SQLite (not for the card path: see card_url)"""
+        meta = self._meta.get(key)
+        if meta is None:
+            meta = self._read_meta(key)
+            if meta is not None:
+                self._meta.set(key, meta)
+        return meta
+
+    def _read_meta(self, key):
+        row = self._conn().execute(
+            "SELECT url, sha, type, thumb, size, dead_until, why FROM images WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, sha, ctype, thumb, size, dead_until, why = row
+        if sha:
+            return {"url": url, "sha": sha, "type": ctype, "thumb": bool(thumb), "size": size}
+        return {"url": url, "dead_until": dead_until or 0, "why": why}
+
+    def _save_meta(self, key, meta):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO images (key, url, sha, type, thumb, size, dead_until, why, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, meta["url"], meta.get("sha"), meta.get("type"), int(bool(meta.get("thumb"))),
+             meta.get("size"), meta.get("dead_until"), meta.get("why"), time.time()),
+        )
+        conn.commit()
+        self._meta.set(key, meta)
+
+    def allowed(self, url):
+        return allowed_url(url, self.allowed_hosts)
+
+    def _is_dead(self, meta):
+        return bool(meta) and meta.get("dead_until", 0) > time.time()
+
+    # ---------------- cards (request path, memory only) ----------------
+    def card_url(self, url):
+        """URL to put in a card: the proxy URL, None for a known dead image
+        or one outside IMAGE_ALLOWED_HOSTS.
+
+        Unchanged when the proxy is off. Only the in-memory metadata is
+        consulted; an image the fetch pool later finds dead is dropped from
+        the cards after that.
+        """
+        if not url or not self.enabled:
+            return url
+        if not self.allowed(url):
+            self._count("rejected")
+            return None
+        key = self.key_for(url)
+        meta = self._meta.get(key)
+        if self._is_dead(meta):
+            return None
+        if meta is None or not meta.get("sha"):
+            self.warm([url])
+        return f"{self.base}/img/{key}"
+
+    def warm(self, urls):
+        """Register urls and start fetching the ones not known to be stored"""
+        if not self.enabled:
+            return
+        for url in urls:
+            if not url or not self.allowed(url):
+                continue
+            key = self.key_for(url)
+            meta = self._meta.get(key)
+            if meta is None:
+                meta = {"url": url}
+                self._meta.set(key, meta)
+            if meta.get("sha") or self._is_dead(meta):
+                continue
+            self._fetch_async(key, url)
+
+    def _fetch_async(self, key, url):
+        with self._lock:
+            fut = self._pending.get(key)
+            if fut is None:
+                fut = self._pending[key] = self._pool.submit(self._fetch, key, url)
+                fut.add_done_callback(lambda f: self._done(key, f))
+        return fut
+
+    def _done(self, key, fut):
+        with self._lock:
+            if self._pending.get(key) is fut:
+                del self._pending[key]
+
+    # ---------------- fetching (image pool) ----------------
+    def _fetch(self, key, url):
+        if not self.allowed(url):
+            self._count("rejected")
+            return None
+
+        # Stored (or found dead) by an earlier process?
+        meta = self._read_meta(key)
+        if meta and meta.get("sha") and self._has_blob(meta):
+            self._meta.set(key, meta)
+            return meta
+        if self._is_dead(meta):
+            self._meta.set(key, meta)
+            return None
+
+        try:
+            res = self._session.get(url, stream=True, allow_redirects=False,
+                                    timeout=(IMAGE_CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT))
+        except requests.RequestException as e:
+            self._count("failed")
+            print("Image fetch failed:", e)
+            return None
+
+        with res:
+            if 300 <= res.status_code < 500 and res.status_code != 429:
+                return self._dead(key, url, f"HTTP {res.status_code}")  # redirects aren't followed
+            if res.status_code != 200:
+                self._count("failed")  # 429 / 5xx: try again next time
+                return None
+            ctype = res.headers.get("content-type", "").split(";")[0].strip().lower()
+            if ctype not in IMAGE_TYPES:
+                return self._dead(key, url, f"content type {ctype or 'missing'}")
+
+            body = bytearray()
+            try:
+                for chunk in res.iter_content(64 * 1024):
+                    body += chunk
+                    if len(body) > IMAGE_MAX_BYTES:
+                        return self._dead(key, url, "too large")
+            except requests.RequestException as e:
+                self._count("failed")
+                print("Image fetch failed:", e)
+                return None
+
+        body = bytes(body)
+        thumb = self._thumbnail(body)
+        if thumb is False:
+            return self._dead(key, url, "not a decodable image")
+
+        sha = hashlib.sha256(body).hexdigest()
+        self._store(sha, body)
+        if thumb:
+            self._store(sha + ".thumb", thumb)
+        meta = {"url": url, "sha": sha, "type": ctype, "thumb": bool(thumb), "size": len(body)}
+        self._save_meta(key, meta)
+        with self._lock:
+            self.counts["fetched"] += 1
+            self.counts["bytes_in"] += len(body)
+        return meta
+
+    def _thumbnail(self, body):
+        """JPEG thumbnail bytes, None without Pillow (or if not smaller), False if undecodable"""
+        if Image is None:
+            return None
+        try:
+            with Image.open(io.BytesIO(body)) as im:
+                im.thumbnail(self.thumb_size)
+                if im.mode not in ("RGB", "L"):
+                    im = im.convert("RGB")
+                out = io.BytesIO()
+                im.save(out, "JPEG", quality=82, optimize=True, progressive=True)
+        except Exception:
+            return False
+        data = out.getvalue()
+        if len(data) >= len(body):
+            return None
+        self._count("thumbnails")
+        return data
+
+    def _dead(self, key, url, why):
+        print(f"Dropping image {url}: {why}")
+        self._save_meta(key, {"url": url, "dead_until": time.time() + IMAGE_DEAD_TTL, "why": why})
+        self._count("dead")
+        return None
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _store(self, name, data):
+        path = os.path.join(self._blobs, name)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        with self._lock:
+            self._stored += 1
+            prune = self._stored % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Delete least recently written blobs while over IMAGE_CACHE_MAX_BYTES,
+        and metadata rows past IMAGE_MAX_AGE / beyond IMAGE_META_MAX_ROWS"""
+        self._prune_rows()
+        files = []
+        for entry in os.scandir(self._blobs):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._count("pruned")
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
+
+    def _prune_rows(self):
+        now = time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            "DELETE FROM images WHERE updated_at < ? OR (sha IS NULL AND dead_until < ?)",
+            (now - IMAGE_MAX_AGE, now),
+        )
+        removed = cur.rowcount
+        (rows,) = conn.execute("SELECT COUNT(*) FROM images").fetchone()
+        if rows > IMAGE_META_MAX_ROWS:
+            cur = conn.execute(
+                "DELETE FROM images WHERE key IN (SELECT key FROM images ORDER BY updated_at LIMIT ?)",
+                (rows - IMAGE_META_MAX_ROWS,),
+            )
+            removed += cur.rowcount
+        conn.commit()
+        if removed:
+            self._count("rows_pruned", removed)
+
+    # ---------------- serving ----------------
+    def load(self, key, etag=None, wait=IMAGE_READ_TIMEOUT):
+        """/img/<key> -> (status, headers, body)"""
+        if len(key) != 32 or not all(c in "0123456789abcdef" for c in key):
+            return 404, {}, b""
+        meta = self._load_meta(key) if self.enabled else None
+        if meta is None or self._is_dead(meta) or not self.allowed(meta["url"]):
+            return 404, {}, b""
+
+        if not meta.get("sha") or not self._has_blob(meta):
+            try:
+                meta = self._fetch_async(key, meta["url"]).result(timeout=wait)
+            except FutureTimeout:
+                return 504, {}, b""
+            if not meta:
+                return 404, {}, b""
+
+        tag = f'"{meta["sha"][:32]}{"t" if meta.get("thumb") else ""}"'
+        headers = {
+            "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}, immutable",
+            "ETag": tag,
+        }
+        if etag and tag in etag:
+            self._count("not_modified")
+            return 304, headers, b""
+
+        name = meta["sha"] + (".thumb" if meta.get("thumb") else "")
+        try:
+            with open(os.path.join(self._blobs, name), "rb") as f:
+                body = f.read()
+        except OSError:
+            return 404, {}, b""
+        headers["Content-Type"] = "image/jpeg" if meta.get("thumb") else meta["type"]
+        with self._lock:
+            self.counts["served"] += 1
+            self.counts["bytes_out"] += len(body)
+        return 200, headers, body
+
+    def _has_blob(self, meta):
+        name = meta["sha"] + (".thumb" if meta.get("thumb") else "")
+        return os.path.exists(os.path.join(self._blobs, name))
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "thumbnails_available": Image is not None,
+                    "fetching": len(self._pending), "meta_in_memory": len(self._meta), **self.counts}
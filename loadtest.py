@@ -0,0 +1,416 @@
+import argparse
+import itertools
+import json
+import math
+import threading
+import time
+import uuid
+
+import requests
+
+
+# ============================================================
+# WEBHOOK LOAD REPLAY
+# ============================================================
+# Replays Dialogflow CX conversations from a JSONL traffic file against
+# /webhook and reports latency percentiles, throughput and error rates as
+# JSON, overall and per tag:
+#
+#     python loadtest.py traffic_sample.jsonl --concurrency 20 --duration 60 --out run.json
+#     python loadtest.py traffic_sample.jsonl --qps 50 --duration 60 --compare run.json
+#
+# Each line of the traffic file is one conversation:
+#
+#     {"name": "flight", "turns": [
+#         {"tag": "Flight_Options", "params": {"departure_city": "Paris", ...}},
+#         {"tag": "Select_Flight_Details", "params": {"selected_flight_id": 1}},
+#         {"tag": "Booking_Confirmation", "params": {"username": "...", ...}}]}
+#
+# A turn may also be a raw webhook request body ({"fulfillmentInfo": ...,
+# "sessionInfo": ...}), and a traffic capture log (capture.py) replays as
+# is: its records are regrouped into one conversation per session.
+#
+# Like Dialogflow, the harness keeps the session parameters: each turn adds
+# its own on top, and the parameters the webhook returns are merged back in
+# (null removes one), so select turns see the option handles written by the
+# search turn before them.
+#
+# --concurrency N runs N conversations back to back (closed loop).
+# --qps R paces requests to R per second (open loop). It starts with
+# --concurrency conversations and adds more, up to --max-concurrency,
+# whenever sends fall behind the schedule. The schedule is never trimmed:
+# latency is measured from the scheduled send time, so a backed-up server
+# shows up in the percentiles, and the report's "pacing" block gives the
+# achieved vs target rate and the late and missed sends.
+# Point the webhook at the provider simulator (simulator.py) to load-test
+# without spending API quota.
+
+DEFAULT_URL = "http://127.0.0.1:8080/webhook"
+
+# A send leaving this long after its scheduled time counts as late
+LATE_AFTER = 0.01
+
+
+def load_traffic(path):
+    conversations = []
+    captured = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            conv = json.loads(line)
+            if "request" in conv and "response" in conv:
+                captured.append(conv)  # traffic capture record (capture.py)
+                continue
+            if "turns" not in conv:
+                conv = {"turns": [conv]}  # a single raw request
+            conv.setdefault("name", f"line{line_no}")
+            conversations.append(conv)
+    conversations.extend(conversations_from_capture(captured))
+    if not conversations:
+        raise ValueError(f"no conversations in {path}")
+    return conversations
+
+
+def conversations_from_capture(records):
+    """Capture records -> conversations, one per Dialogflow session.
+
+    A captured request carries the whole session, including parameters the
+    webhook itself wrote on earlier turns (option handles, selections).
+    Those are left out of the turn so the replay carries its own.
+    """
+    sessions = {}
+    for i, rec in enumerate(sorted(records, key=lambda r: r.get("ts", 0))):
+        sessions.setdefault(rec.get("session") or f"capture{i}", []).append(rec)
+
+    conversations = []
+    for session, recs in sessions.items():
+        written = set()
+        turns = []
+        for rec in recs:
+            req = rec["request"] or {}
+            params = (req.get("sessionInfo") or {}).get("parameters") or {}
+            turns.append({
+                "tag": (req.get("fulfillmentInfo") or {}).get("tag", ""),
+                "params": {k: v for k, v in params.items() if k not in written},
+            })
+            written.update(((rec["response"] or {}).get("sessionInfo") or {}).get("parameters") or {})
+        conversations.append({"name": session, "turns": turns})
+    return conversations
+
+
+def turn_request(turn, session, session_id):
+    """Turn + carried session params -> (tag, webhook request body)"""
+    if "fulfillmentInfo" in turn:
+        tag = turn["fulfillmentInfo"].get("tag", "")
+        params = turn.get("sessionInfo", {}).get("parameters", {})
+    else:
+        tag = turn["tag"]
+        params = turn.get("params", {})
+    session.update(params)
+    body = {
+        "fulfillmentInfo": {"tag": tag},
+        "sessionInfo": {"session": session_id, "parameters": dict(session)},
+    }
+    return tag, body
+
+
+def merge_session(session, reply):
+    for key, value in ((reply.get("sessionInfo") or {}).get("parameters") or {}).items():
+        if value is None:
+            session.pop(key, None)
+        else:
+            session[key] = value
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values), max(1, math.ceil(q / 100 * len(sorted_values)))) - 1
+    return sorted_values[k]
+
+
+def latency_summary(seconds):
+    values = sorted(seconds)
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)),
+        "max_ms": ms(values[-1]),
+    }
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+class Pacer:
+    """Hands out send times R per second (open-loop --qps mode).
+
+    Slot i is due at start + i/R, however far behind the senders are: a
+    backlog is sent as fast as possible and keeps its scheduled times.
+    Sends due before `until` that were never handed out are missed.
+    """
+
+    def __init__(self, qps, until=None):
+        self.qps = qps
+        self.interval = 1.0 / qps
+        self.start = time.perf_counter()
+        self.until = until
+        self._issued = 0
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.sent_in_time = 0  # left before `until`
+        self.late = 0
+        self.max_lag = 0.0
+        self.last_sent = self.start
+
+    def slot(self):
+        with self._lock:
+            at = self.start + self._issued * self.interval
+            self._issued += 1
+        delay = at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        with self._lock:
+            self.sent += 1
+            if self.until is None or now < self.until:
+                self.sent_in_time += 1
+            if now - at > LATE_AFTER:
+                self.late += 1
+            self.max_lag = max(self.max_lag, now - at)
+            self.last_sent = max(self.last_sent, now)
+        return at
+
+    def backlog(self):
+        """Slots already due that no sender has asked for"""
+        with self._lock:
+            due = math.floor((time.perf_counter() - self.start) / self.interval) + 1
+            return max(0, due - self._issued)
+
+    def stats(self):
+        with self._lock:
+            if self.until is not None:
+                window = self.until - self.start
+                scheduled = math.floor(window / self.interval) + 1
+                missed = max(0, scheduled - min(self._issued, scheduled))
+                achieved = self.sent_in_time / window if window > 0 else 0.0
+            else:
+                window = self.last_sent - self.start
+                scheduled, missed = self._issued, 0
+                achieved = self.sent / window if window > 0 else 0.0
+            return {
+                "target_qps": self.qps,
+                "achieved_qps": round(achieved, 2),
+                "scheduled": scheduled,
+                "sent": self.sent,
+                "late": self.late,
+                "missed": missed,
+                "max_lag_ms": round(self.max_lag * 1000, 2),
+            }
+
+
+class LoadRun:
+    def __init__(self, url, conversations, concurrency=10, qps=None, duration=None,
+                 max_conversations=None, timeout=10, max_concurrency=1000):
+        self.url = url
+        self.conversations = conversations
+        self.concurrency = concurrency
+        self.max_concurrency = max(concurrency, max_concurrency)
+        self.pacer = None
+        self.qps = qps
+        self.duration = duration
+        self.max_conversations = max_conversations or (None if duration else len(conversations))
+        self.timeout = timeout
+
+        self._next_conv = itertools.count()
+        self._lock = threading.Lock()
+        self.samples = []  # (tag, seconds, error or None)
+        self.completed = 0
+        self.failed = 0
+        self.peak_concurrency = 0
+        self._exhausted = False
+
+    def _take(self):
+        i = next(self._next_conv)
+        if self.max_conversations is not None and i >= self.max_conversations:
+            self._exhausted = True
+            return None
+        if self.duration is not None and time.perf_counter() >= self._stop_at:
+            self._exhausted = True
+            return None
+        return self.conversations[i % len(self.conversations)]
+
+    def _send(self, http, tag, body):
+        sent_at = self.pacer.slot() if self.pacer else time.perf_counter()
+        error = None
+        reply = {}
+        try:
+            res = http.post(self.url, json=body, timeout=self.timeout)
+            if res.status_code != 200:
+                error = f"http_{res.status_code}"
+            else:
+                reply = res.json()
+                if "fulfillment_response" not in reply:
+                    error = "bad_reply"
+        except requests.Timeout:
+            error = "timeout"
+        except (requests.RequestException, ValueError) as e:
+            error = type(e).__name__
+        seconds = time.perf_counter() - sent_at
+        with self._lock:
+            self.samples.append((tag, seconds, error))
+        return reply, error
+
+    def _conversation(self, http, conv):
+        session = {}
+        session_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+        for turn in conv["turns"]:
+            tag, body = turn_request(turn, session, session_id)
+            reply, error = self._send(http, tag, body)
+            if error:
+                return False
+            merge_session(session, reply)
+        return True
+
+    def _worker(self):
+        http = requests.Session()
+        while True:
+            conv = self._take()
+            if conv is None:
+                return
+            ok = self._conversation(http, conv)
+            with self._lock:
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def run(self):
+        start = time.perf_counter()
+        self._stop_at = start + (self.duration or 0)
+        if self.qps:
+            self.pacer = Pacer(self.qps, until=self._stop_at if self.duration is not None else None)
+        workers = []
+
+        def add_worker():
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            workers.append(t)
+            self.peak_concurrency = max(self.peak_concurrency, sum(w.is_alive() for w in workers))
+
+        for _ in range(self.concurrency):
+            add_worker()
+        if self.pacer:
+            # Open loop: every conversation in flight is waiting on a reply
+            # while slots come due -> start another one
+            while any(t.is_alive() for t in workers):
+                if (self.pacer.backlog() > 1 and not self._exhausted
+                        and sum(t.is_alive() for t in workers) < self.max_concurrency):
+                    add_worker()
+                time.sleep(min(self.pacer.interval, 0.01))
+        for t in workers:
+            t.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        by_tag = {}
+        for tag, seconds, error in self.samples:
+            by_tag.setdefault(tag, []).append((seconds, error))
+
+        def block(rows):
+            errors = {}
+            for _, error in rows:
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+            n = len(rows)
+            failed = sum(errors.values())
+            return {
+                "requests": n,
+                "errors": failed,
+                "error_rate": round(failed / n, 4) if n else 0.0,
+                "error_kinds": errors,
+                "throughput_rps": round(n / elapsed, 2) if elapsed else 0.0,
+                **latency_summary([s for s, _ in rows]),
+            }
+
+        return {
+            "url": self.url,
+            "mode": "qps" if self.qps else "concurrency",
+            "target_qps": self.qps,
+            "concurrency": self.concurrency,
+            "peak_concurrency": self.peak_concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "conversations": {"completed": self.completed, "failed": self.failed},
+            "pacing": self.pacer.stats() if self.pacer else None,
+            **block([(s, e) for _, s, e in self.samples]),
+            "tags": {tag: block(rows) for tag, rows in sorted(by_tag.items())},
+        }
+
+
+# ============================================================
+# COMPARE
+# ============================================================
+COMPARED = ("throughput_rps", "error_rate", "p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(baseline, current):
+    """Per-metric (baseline, current, change %) for the run and each tag"""
+    def rows(label, a, b):
+        for key in COMPARED:
+            old, new = a.get(key), b.get(key)
+            change = round((new - old) / old * 100, 1) if old and new is not None else None
+            yield {"scope": label, "metric": key, "baseline": old, "current": new, "change_pct": change}
+
+    out = list(rows("all", baseline, current))
+    for tag in sorted(set(baseline.get("tags", {})) & set(current.get("tags", {}))):
+        out.extend(rows(tag, baseline["tags"][tag], current["tags"][tag]))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Dialogflow CX conversations against /webhook")
+    parser.add_argument("traffic", help="JSONL file, one conversation per line")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--concurrency", type=int, default=10, help="conversations in flight")
+    parser.add_argument("--max-concurrency", type=int, default=1000,
+                        help="--qps mode: conversations in flight may grow to this many to keep up")
+    parser.add_argument("--qps", type=float, help="target webhook requests per second (open loop)")
+    parser.add_argument("--duration", type=float, help="seconds to run, looping over the traffic file")
+    parser.add_argument("--conversations", type=int, help="stop after this many conversations")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout in seconds")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    run = LoadRun(args.url, load_traffic(args.traffic), concurrency=args.concurrency, qps=args.qps,
+                  duration=args.duration, max_conversations=args.conversations, timeout=args.timeout,
+                  max_concurrency=args.max_concurrency)
+    report = run.run()
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["compare"] = compare(json.load(f), report)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"{report['requests']} requests, {report['throughput_rps']} req/s, "
+              f"p50 {report['p50_ms']} ms, p99 {report['p99_ms']} ms, "
+              f"errors {report['error_rate']:.2%} -> {args.out}")
+        pacing = report["pacing"]
+        if pacing:
+            print(f"paced {pacing['achieved_qps']}/{pacing['target_qps']} req/s, "
+                  f"{pacing['late']} late, {pacing['missed']} missed")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import bisect
+import math
+import threading
+
+
+# ============================================================
+# PROMETHEUS TEXT METRICS (no client library needed)
+# ============================================================
+# Counters and histograms keyed by a tuple of label values. Recording is
+# one dict lookup and a few additions under a per-metric lock; all the
+# formatting happens in render(), when /metrics is scraped.
+#
+#     PROVIDER_SECONDS = Histogram("x_seconds", "help", ("provider", "phase"))
+#     PROVIDER_SECONDS.observe(("amadeus", "ttfb"), 0.42)
+#
+# Values that already live elsewhere (cache hit counters, ...) are exported
+# by a collector function instead of being counted twice.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_metrics = []
+_collectors = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # label values -> total
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _labels(self.labels, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, counts in sorted(series.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                running += n
+                yield self.name + "_bucket", _labels(self.labels + ("le",), key + (_number(bound),)), running
+            yield self.name + "_sum", _labels(self.labels, key), round(counts[-1], 6)
+            yield self.name + "_count", _labels(self.labels, key), running
+
+
+def register_collector(collect):
+    """collect() -> iterable of (name, kind, help, [(labels dict, value), ...])"""
+    _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+
+    for collect in _collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            print("Metrics collector failed:", e)
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,169 @@
+import re
+
+
+# ============================================================
+# NORMALIZED OFFER RECORDS
+# ============================================================
+# One small __slots__ record per provider result. Each class has a single
+# decoder from the provider payload and a single serializer, to_option(),
+# producing the plain dict the option store keeps and the select handlers
+# read back. Caches store these records, not raw provider JSON.
+#
+# `amount` (and `minutes` for flights) are the numeric sort keys, parsed
+# once at decode time so ranking never re-parses provider strings.
+
+_DURATION = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+
+
+def _amount(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def _minutes(iso_duration):
+    """Amadeus "PT7H25M" -> 445 (inf if missing)"""
+    m = _DURATION.fullmatch(iso_duration or "")
+    if not m or not any(m.groups()):
+        return float("inf")
+    return int(m.group(1) or 0) * 60 + int(m.group(2) or 0)
+
+
+class FlightOffer:
+    __slots__ = ("airline", "cabin", "price", "departure", "arrival", "stops", "amount", "minutes")
+
+    def __init__(self, airline, cabin, price, departure, arrival, stops=(), duration=None):
+        self.airline = airline
+        self.cabin = cabin
+        self.price = price
+        self.departure = departure
+        self.arrival = arrival
+        self.stops = tuple(stops)  # intermediate arrival IATA codes
+        self.amount = _amount(price)
+        self.minutes = _minutes(duration)
+
+    @classmethod
+    def from_amadeus(cls, offer):
+        """Amadeus flight-offer -> FlightOffer (None if the offer is malformed)"""
+        try:
+            itinerary = offer["itineraries"][0]
+            segments = itinerary["segments"]
+            price = offer["price"]["total"]
+            departure = segments[0]["departure"]["at"]
+            arrival = segments[0]["arrival"]["at"]
+            stops = [s["arrival"]["iataCode"] for s in segments[:-1]]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+        try:
+            cabin = offer["travelerPricings"][0]["fareDetailsBySegment"][0]["cabin"]
+        except (KeyError, IndexError, TypeError):
+            cabin = "Unknown"
+
+        airline = (offer.get("validatingAirlineCodes") or ["Unknown"])[0]
+        return cls(airline, cabin, price, departure, arrival, stops, itinerary.get("duration"))
+
+    def to_option(self):
+        return {
+            "airline": self.airline,
+            "class": self.cabin,
+            "price": self.price,
+            "departure": self.departure,
+            "arrival": self.arrival,
+        }
+
+
+class HotelOffer:
+    __slots__ = ("name", "rating", "price", "image", "amount")
+
+    def __init__(self, name, rating, price, image=None):
+        self.name = name
+        self.rating = rating
+        self.price = price
+        self.image = image
+        self.amount = _amount(price)
+
+    @classmethod
+    def from_booking(cls, h):
+        """Booking properties/list result -> HotelOffer"""
+        return cls(
+            h.get("hotel_name"),
+            h.get("review_score", 0),
+            h.get("min_total_price"),
+            # main key + safe fallbacks
+            h.get("main_photo_url")
+            or h.get("main_photo_url_original")
+            or h.get("max_photo_url")
+            or h.get("hotel_image_url"),
+        )
+
+    def to_option(self, checkin, checkout):
+        return {
+            "name": self.name,
+            "rating": self.rating,
+            "price": self.price,
+            "checkin": checkin,
+            "checkout": checkout,
+            "image": self.image,
+        }
+
+
+class CarOffer:
+    __slots__ = (
+        "result_key", "vendor", "example", "description", "image",
+        "price", "total_price", "symbol", "pickup", "dropoff", "bundle", "amount",
+    )
+
+    def __init__(self, result_key, vendor, example, description, image,
+                 price, total_price, symbol, pickup, dropoff, bundle):
+        self.result_key = result_key
+        self.vendor = vendor
+        self.example = example
+        self.description = description
+        self.image = image
+        self.price = price              # per day
+        self.total_price = total_price  # whole trip
+        self.symbol = symbol
+        self.pickup = pickup
+        self.dropoff = dropoff
+        self.bundle = bundle
+        self.amount = _amount(total_price)
+
+    @classmethod
+    def from_priceline(cls, key, raw):
+        """One Priceline results_list entry -> CarOffer"""
+        car = raw.get("car") if isinstance(raw.get("car"), dict) else {}
+        images = car.get("images") if isinstance(car.get("images"), dict) else {}
+        price_details = raw.get("price_details") if isinstance(raw.get("price_details"), dict) else {}
+        base = price_details.get("base") if isinstance(price_details.get("base"), dict) else {}
+
+        return cls(
+            key,
+            (raw.get("partner") or {}).get("name", "Unknown vendor"),
+            car.get("example", "Car"),
+            car.get("description", ""),
+            images.get("SIZE268X144") or images.get("SIZE335X180") or car.get("imageURL"),
+            base.get("price", "N/A"),
+            base.get("total_price", "N/A"),
+            base.get("symbol", "$"),
+            (raw.get("pickup") or {}).get("location"),
+            (raw.get("dropoff") or {}).get("location"),
+            raw.get("postpaid_contract_bundle"),
+        )
+
+    def to_option(self, pickup_date, dropoff_date):
+        return {
+            "vendor": self.vendor,
+            "type": self.example,
+            "class": self.description,
+            "price": self.price,
+            "total": self.total_price,
+            "pickup": self.pickup,
+            "dropoff": self.dropoff,
+            "image": self.image,
+            "result_key": self.result_key,
+            "bundle": self.bundle,
+            "pickup_date": pickup_date,
+            "dropoff_date": dropoff_date,
+        }
@@ -0,0 +1,113 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from result_cache import TTLCache
+
+
+# ============================================================
+# SERVER-SIDE OPTION STORE
+# ============================================================
+# A search turn stores its ranked options here and puts only a short
+# handle in the Dialogflow session (flight_options_ref, hotel_options_ref,
+# car_options_ref). The handle is a random token that only that session
+# ever sees, and the select turn resolves the chosen option from it, so
+# session parameters stay small on every later request and response.
+#
+# Options are written to a SQLite file (OPTION_STORE_PATH) shared by all
+# worker processes and kept across restarts, like the geocode cache, with
+# a memory LRU in front, for OPTION_STORE_TTL seconds. A select turn often
+# lands on a different worker than its search. An empty path keeps them in
+# this process only (tests).
+
+OPTION_STORE_PATH = os.getenv("OPTION_STORE_PATH", "option_store.sqlite3")
+OPTION_STORE_TTL = int(os.getenv("OPTION_STORE_TTL", "3600"))
+OPTION_STORE_SIZE = int(os.getenv("OPTION_STORE_SIZE", "10000"))
+
+# Expired SQLite rows are purged every this many writes
+_PURGE_EVERY = 256
+
+
+class OptionStore:
+    def __init__(self, path=OPTION_STORE_PATH, ttl=OPTION_STORE_TTL, memory_size=OPTION_STORE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.db_hits = 0
+        if self.path:
+            self._conn()  # create the schema up front
+
+    # ---------------- storage ----------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS options ("
+                " handle TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _write(self, handle, options):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO options (handle, payload, expires_at) VALUES (?, ?, ?)",
+            (handle, json.dumps(options, separators=(",", ":")), time.time() + self.ttl),
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % _PURGE_EVERY == 0
+        if purge:
+            conn.execute("DELETE FROM options WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+
+    def _read(self, handle):
+        row = self._conn().execute(
+            "SELECT payload, expires_at FROM options WHERE handle = ?", (handle,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1] - time.time()
+
+    # ---------------- API ----------------
+    def put(self, options):
+        """Store a ranked option list (list of plain dicts) -> handle"""
+        handle = secrets.token_urlsafe(9)
+        self._memory.set(handle, options)
+        if self.path:
+            self._write(handle, options)
+        return handle
+
+    def get(self, handle):
+        """Options stored under handle, or None if unknown/expired"""
+        if not handle or not isinstance(handle, str):
+            return None
+
+        options = self._memory.get(handle)
+        if options is not None or not self.path:
+            return options
+
+        found = self._read(handle)
+        if found is None:
+            return None
+        options, ttl_left = found
+        with self._lock:
+            self.db_hits += 1
+        self._memory.set(handle, options, ttl=ttl_left)
+        return options
+
+    def stats(self):
+        with self._lock:
+            return {"memory": self._memory.stats(), "db_hits": self.db_hits, "writes": self._writes}
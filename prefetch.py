@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+
+
+# ============================================================
+# SPECULATIVE PREFETCH CONFIG
+# ============================================================
+# Once a flight is picked, the next turns are usually a hotel and a car at
+# the destination for the same dates. Those searches are queued here and
+# run in the background, so the later Hotel_Options / Car_Rental_Options
+# turns find their results in the caches.
+#
+# Prefetches never compete with the user's own searches for long:
+#   - PREFETCH_WORKERS threads of their own (the turn pools are untouched),
+#   - a bounded queue; when it is full, new prefetches are simply skipped,
+#   - per-part quotas (PREFETCH_<PART>_PER_MINUTE, e.g. PREFETCH_HOTELS_PER_MINUTE)
+#     so speculation can't burn the provider's rate limit,
+#   - a queued prefetch older than PREFETCH_MAX_AGE seconds is dropped.
+# cancel(session) drops whatever that session still has queued (a call
+# already on the wire finishes and lands in the cache).
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_QUEUE = int(os.getenv("PREFETCH_QUEUE", "128"))
+PREFETCH_MAX_AGE = float(os.getenv("PREFETCH_MAX_AGE", "30"))
+PREFETCH_PER_MINUTE = int(os.getenv("PREFETCH_PER_MINUTE", "30"))
+
+
+def quota_for(part):
+    return int(os.getenv(f"PREFETCH_{part.upper()}_PER_MINUTE", str(PREFETCH_PER_MINUTE)))
+
+
+class RateQuota:
+    """Token bucket: `per_minute` tokens, refilled continuously"""
+
+    def __init__(self, per_minute):
+        self.capacity = max(0, per_minute)
+        self.tokens = float(self.capacity)
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Prefetcher:
+    def __init__(self, workers=PREFETCH_WORKERS, queue_size=PREFETCH_QUEUE,
+                 max_age=PREFETCH_MAX_AGE, enabled=PREFETCH_ENABLED):
+        self.enabled = enabled
+        self.workers = workers
+        self.max_age = max_age
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._quotas = {}       # part -> RateQuota
+        self._keys = set()      # (part, key) queued or running
+        self._sessions = {}     # session -> queued tasks
+        self._cancelled = set()  # sessions whose queued tasks are dropped
+        self.counts = {"queued": 0, "ran": 0, "failed": 0, "deduped": 0, "over_quota": 0,
+                       "queue_full": 0, "cancelled": 0, "expired": 0}
+
+    def submit(self, session, part, key, fn):
+        """Queue fn() as a low-priority prefetch -> True if it was queued"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if (part, key) in self._keys:
+                self.counts["deduped"] += 1
+                return False
+            quota = self._quotas.get(part)
+            if quota is None:
+                quota = self._quotas[part] = RateQuota(quota_for(part))
+            if not quota.take():
+                self.counts["over_quota"] += 1
+                return False
+            try:
+                self._queue.put_nowait((session, part, key, fn, time.monotonic()))
+            except queue.Full:
+                self.counts["queue_full"] += 1
+                return False
+            self._keys.add((part, key))
+            self._sessions[session] = self._sessions.get(session, 0) + 1
+            self._cancelled.discard(session)
+            self.counts["queued"] += 1
+        self._start()
+        return True
+
+    def cancel(self, session):
+        """Drop the prefetches `session` still has queued"""
+        with self._lock:
+            if self._sessions.get(session):
+                self._cancelled.add(session)
+
+    def _start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            session, part, key, fn, queued_at = self._queue.get()
+            with self._lock:
+                left = self._sessions[session] - 1
+                if left:
+                    self._sessions[session] = left
+                else:
+                    del self._sessions[session]
+                if session in self._cancelled:
+                    skip = "cancelled"
+                    if not left:
+                        self._cancelled.discard(session)
+                elif time.monotonic() - queued_at > self.max_age:
+                    skip = "expired"
+                else:
+                    skip = None
+                if skip:
+                    self.counts[skip] += 1
+                    self._keys.discard((part, key))
+                    continue
+
+            try:
+                fn()
+                outcome = "ran"
+            except Exception as e:
+                print(f"Prefetch {part} failed:", e)
+                outcome = "failed"
+            with self._lock:
+                self._keys.discard((part, key))
+                self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "pending": len(self._keys), **self.counts}
@@ -0,0 +1,522 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from dotenv import load_dotenv
+
+import metrics
+from circuit import CircuitBreaker
+
+load_dotenv()
+
+
+# ============================================================
+# POOL + TIMEOUT CONFIG
+# ============================================================
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+# ASGI mode: concurrent connections per provider on one event loop
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+# Bulkhead: calls in flight per provider beyond which new ones fail fast
+BREAKER_MAX_CONCURRENT = int(os.getenv("BREAKER_MAX_CONCURRENT", str(HTTP_POOL_MAXSIZE)))
+BREAKER_ASYNC_MAX_CONCURRENT = int(os.getenv("BREAKER_ASYNC_MAX_CONCURRENT", str(HTTP_ASYNC_MAX_CONNECTIONS)))
+
+CAR_API_HOST = os.getenv("CAR_API_HOST", "priceline-com-provider.p.rapidapi.com").strip()
+
+# Send every provider call to the local simulator instead (see simulator.py),
+# e.g. PROVIDER_SIMULATOR_URL=http://127.0.0.1:8090
+PROVIDER_SIMULATOR_URL = os.getenv("PROVIDER_SIMULATOR_URL", "").strip().rstrip("/")
+
+
+def _timeout(name, connect, read):
+    """(connect, read) timeout tuple, overridable per provider from .env"""
+    prefix = name.upper()
+    return (
+        float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", connect)),
+        float(os.getenv(f"{prefix}_READ_TIMEOUT", read)),
+    )
+
+
+# One entry per upstream host. "base" is what warm_up() connects to and
+# what url() builds endpoint URLs from.
+PROVIDERS = {
+    "amadeus": {
+        "base": PROVIDER_SIMULATOR_URL or "https://test.api.amadeus.com",
+        "timeout": _timeout("amadeus", 3.05, 15),
+    },
+    "booking": {
+        "base": PROVIDER_SIMULATOR_URL or "https://apidojo-booking-v1.p.rapidapi.com",
+        "timeout": _timeout("booking", 3.05, 15),
+    },
+    "priceline": {
+        "base": PROVIDER_SIMULATOR_URL or f"https://{CAR_API_HOST}",
+        "timeout": _timeout("priceline", 3.05, 30),
+    },
+    "geoapify": {
+        "base": PROVIDER_SIMULATOR_URL or "https://api.geoapify.com",
+        "timeout": _timeout("geoapify", 3.05, 5),
+    },
+}
+
+
+def url(provider, path):
+    """Endpoint URL on the provider's host: url("booking", "/properties/list")"""
+    return PROVIDERS[provider]["base"] + path
+
+
+# ============================================================
+# METRICS (exported on /metrics)
+# ============================================================
+# phase: connect (new TCP+TLS connection), ttfb (request sent -> response
+# headers), body (headers -> body read; for streamed bodies this includes
+# parsing done while reading), parse (JSON/stream parsing)
+PROVIDER_SECONDS = metrics.Histogram(
+    "tripsage_provider_seconds", "Provider call time by phase", ("provider", "phase")
+)
+PROVIDER_RESPONSES = metrics.Counter(
+    "tripsage_provider_responses_total", "Provider responses by HTTP status (error = no response)",
+    ("provider", "status"),
+)
+PROVIDER_RESPONSE_BYTES = metrics.Histogram(
+    "tripsage_provider_response_bytes", "Provider response body size", ("provider",),
+    buckets=metrics.SIZE_BUCKETS,
+)
+
+# Which provider the current thread is calling (labels connect timings)
+_calling = threading.local()
+
+
+def _observe_response(provider, status, ttfb, body=None, size=None):
+    PROVIDER_RESPONSES.inc((provider, str(status) if status is not None else "error"))
+    if ttfb is not None:
+        PROVIDER_SECONDS.observe((provider, "ttfb"), ttfb)
+    if body is not None:
+        PROVIDER_SECONDS.observe((provider, "body"), body)
+    if size is not None:
+        PROVIDER_RESPONSE_BYTES.observe((provider,), size)
+
+
+def observe_parse(provider, seconds):
+    PROVIDER_SECONDS.observe((provider, "parse"), seconds)
+
+
+class BadPayload(requests.RequestException):
+    """A provider reply that isn't the JSON it should be (HTML error or quota page)"""
+
+
+def json_body(provider, res):
+    """res.json(), timed as the provider's parse phase.
+
+    A body that isn't JSON raises BadPayload for both requests and httpx
+    responses, so the handlers' RequestException branches catch it in
+    either serving mode.
+    """
+    start = time.perf_counter()
+    try:
+        return res.json()
+    except ValueError as e:
+        raise BadPayload(f"{provider} returned a non-JSON reply (HTTP {res.status_code})") from e
+    finally:
+        observe_parse(provider, time.perf_counter() - start)
+
+
+# ============================================================
+# SESSIONS (one keep-alive pool per provider host)
+# ============================================================
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class _TimedConnect:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            provider = getattr(_calling, "provider", None) or "unknown"
+            PROVIDER_SECONDS.observe((provider, "connect"), time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report their connect time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def get_session(provider):
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = TimedAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+    return session
+
+
+# ============================================================
+# CIRCUIT BREAKERS (see circuit.py)
+# ============================================================
+breakers = {provider: CircuitBreaker(provider) for provider in PROVIDERS}
+
+
+def _healthy(status):
+    """Did the provider do its job? Network errors, 5xx and 429 count against it"""
+    return status is not None and status < 500 and status != 429
+
+
+def breaker_stats():
+    return {provider: b.stats() for provider, b in breakers.items()}
+
+
+# ============================================================
+# TIMING STATS
+# ============================================================
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(provider, elapsed_ms, status):
+    with _stats_lock:
+        s = _stats.get(provider)
+        if s is None:
+            s = _stats[provider] = {
+                "count": 0, "errors": 0, "total_ms": 0.0,
+                "max_ms": 0.0, "last_ms": 0.0, "last_status": None,
+            }
+        s["count"] += 1
+        s["total_ms"] += elapsed_ms
+        s["last_ms"] = elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+        s["last_status"] = status
+        if status is None or status >= 500:
+            s["errors"] += 1
+
+
+def stats():
+    """Snapshot of per-provider call counts and latencies (ms)"""
+    with _stats_lock:
+        out = {}
+        for provider, s in _stats.items():
+            row = dict(s)
+            row["avg_ms"] = round(s["total_ms"] / s["count"], 2) if s["count"] else 0.0
+            row["total_ms"] = round(s["total_ms"], 2)
+            row["max_ms"] = round(s["max_ms"], 2)
+            row["last_ms"] = round(s["last_ms"], 2)
+            out[provider] = row
+        return out
+
+
+# ============================================================
+# REQUESTS
+# ============================================================
+def request(provider, method, url, deadline=None, **kwargs):
+    """Send a request through the provider's pooled session.
+
+    Applies the provider's (connect, read) timeout unless one is passed
+    explicitly, clamped to `deadline` (a deadline.Deadline) when given.
+    Network errors propagate as requests exceptions; an open circuit or a
+    full bulkhead raises circuit.ProviderUnavailable without sending.
+    """
+    kwargs.setdefault("timeout", PROVIDERS[provider]["timeout"])
+    if deadline is not None:
+        kwargs["timeout"] = deadline.timeout(kwargs["timeout"])
+    session = get_session(provider)
+    breaker = breakers[provider]
+    breaker.acquire(BREAKER_MAX_CONCURRENT)
+    _calling.provider = provider
+
+    start = time.perf_counter()
+    status = None
+    res = None
+    try:
+        res = session.request(method, url, **kwargs)
+        status = res.status_code
+        return res
+    finally:
+        elapsed = time.perf_counter() - start
+        _calling.provider = None
+        breaker.release(_healthy(status), elapsed)
+        _record(provider, elapsed * 1000, status)
+        if res is None:
+            _observe_response(provider, None, None)
+        elif kwargs.get("stream"):
+            _observe_response(provider, status, elapsed)  # body is timed by stream()
+        else:
+            ttfb = min(res.elapsed.total_seconds(), elapsed)
+            _observe_response(provider, status, ttfb, elapsed - ttfb, len(res.content))
+
+
+@contextmanager
+def stream(provider, method, url, deadline=None, **kwargs):
+    """request(..., stream=True) as a context manager: read the body inside the block"""
+    res = request(provider, method, url, deadline=deadline, stream=True, **kwargs)
+    start = time.perf_counter()
+    try:
+        yield res
+    finally:
+        res.close()
+        PROVIDER_SECONDS.observe((provider, "body"), time.perf_counter() - start)
+        PROVIDER_RESPONSE_BYTES.observe((provider,), res.raw.tell() if res.raw is not None else 0)
+
+
+class ResponseTooLarge(requests.RequestException):
+    pass
+
+
+def iter_body(res, max_bytes, chunk_size=64 * 1024):
+    """Yield a streamed response body in chunks, refusing more than max_bytes.
+
+    Use with stream=True. Raises ResponseTooLarge (and closes the response)
+    as soon as the declared or received size goes over the limit.
+    """
+    declared = res.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        res.close()
+        raise ResponseTooLarge(f"response is {declared} bytes (limit {max_bytes})")
+
+    received = 0
+    for chunk in res.iter_content(chunk_size=chunk_size):
+        received += len(chunk)
+        if received > max_bytes:
+            res.close()
+            raise ResponseTooLarge(f"response exceeds {max_bytes} bytes")
+        yield chunk
+
+
+def get(provider, url, **kwargs):
+    return request(provider, "GET", url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    return request(provider, "POST", url, **kwargs)
+
+
+# ============================================================
+# WARM-UP (resolve DNS + open one pooled connection per host)
+# ============================================================
+def _warm_one(provider):
+    cfg = PROVIDERS[provider]
+    base = urlsplit(cfg["base"])
+    _calling.provider = provider
+    try:
+        socket.getaddrinfo(base.hostname, base.port or (443 if base.scheme == "https" else 80))
+        # Any response is fine: the point is the TCP+TLS handshake, after
+        # which the connection goes back into the pool for the first search.
+        get_session(provider).head(cfg["base"], timeout=cfg["timeout"], allow_redirects=False)
+    except Exception as e:
+        print(f"Warm-up failed for {provider}:", e)
+
+
+def warm_up(providers=None, background=True):
+    names = list(providers or PROVIDERS)
+    threads = [threading.Thread(target=_warm_one, args=(p,), daemon=True) for p in names]
+    for t in threads:
+        t.start()
+    if not background:
+        for t in threads:
+            t.join()
+    return threads
+
+
+# ============================================================
+# ASYNC CLIENTS (ASGI mode, see asgi.py)
+# ============================================================
+# Same providers, timeouts and stats as above, over one httpx.AsyncClient
+# per provider. Clients belong to the serving event loop, so they are only
+# created and used from that loop (no locking needed).
+_async_clients = {}
+
+
+def get_async_client(provider):
+    client = _async_clients.get(provider)
+    if client is None:
+        import httpx  # only the ASGI mode needs httpx
+
+        connect, read = PROVIDERS[provider]["timeout"]
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+        )
+        _async_clients[provider] = client
+    return client
+
+
+def _async_kwargs(provider, deadline, kwargs):
+    """requests-style kwargs -> httpx kwargs (None params/headers dropped, deadline applied)"""
+    for name in ("params", "headers"):
+        if kwargs.get(name):
+            kwargs[name] = {k: v for k, v in kwargs[name].items() if v is not None}
+    if deadline is not None:
+        import httpx
+
+        connect, read = deadline.timeout(kwargs.pop("timeout", PROVIDERS[provider]["timeout"]))
+        kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+    return kwargs
+
+
+def _traced(kwargs):
+    """Attach an httpcore trace hook -> (kwargs, marks); marks[event] = perf_counter()"""
+    marks = {}
+
+    async def trace(event, info):
+        marks[event] = time.perf_counter()
+
+    kwargs["extensions"] = {**kwargs.get("extensions", {}), "trace": trace}
+    return kwargs, marks
+
+
+def _headers_at(marks, default):
+    return marks.get("http11.receive_response_headers.complete") or marks.get(
+        "http2.receive_response_headers.complete", default
+    )
+
+
+def _observe_connect(provider, marks):
+    started = marks.get("connection.connect_tcp.started")
+    done = marks.get("connection.start_tls.complete") or marks.get("connection.connect_tcp.complete")
+    if started and done:
+        PROVIDER_SECONDS.observe((provider, "connect"), done - started)
+
+
+async def arequest(provider, method, url, deadline=None, **kwargs):
+    """Async request(): body is fully read before returning"""
+    client = get_async_client(provider)
+    kwargs, marks = _traced(_async_kwargs(provider, deadline, kwargs))
+    breaker = breakers[provider]
+    breaker.acquire(BREAKER_ASYNC_MAX_CONCURRENT)
+
+    start = time.perf_counter()
+    status = None
+    res = None
+    try:
+        res = await client.request(method, url, **kwargs)
+        status = res.status_code
+        return res
+    finally:
+        end = time.perf_counter()
+        elapsed = end - start
+        breaker.release(_healthy(status), elapsed)
+        _record(provider, elapsed * 1000, status)
+        _observe_connect(provider, marks)
+        if res is None:
+            _observe_response(provider, None, None)
+        else:
+            headers_at = _headers_at(marks, end)
+            _observe_response(provider, status, headers_at - start, end - headers_at, res.num_bytes_downloaded)
+
+
+@asynccontextmanager
+async def astream(provider, method, url, deadline=None, **kwargs):
+    """Async request(..., stream=True): read the body inside the block"""
+    client = get_async_client(provider)
+    kwargs, marks = _traced(_async_kwargs(provider, deadline, kwargs))
+    breaker = breakers[provider]
+    breaker.acquire(BREAKER_ASYNC_MAX_CONCURRENT)
+
+    start = time.perf_counter()
+    ctx = client.stream(method, url, **kwargs)
+    try:
+        res = await ctx.__aenter__()
+    except BaseException:
+        elapsed = time.perf_counter() - start
+        breaker.release(False, elapsed)
+        _record(provider, elapsed * 1000, None)
+        _observe_connect(provider, marks)
+        _observe_response(provider, None, None)
+        raise
+    headers_at = time.perf_counter()
+    elapsed = headers_at - start
+    breaker.release(_healthy(res.status_code), elapsed)
+    _record(provider, elapsed * 1000, res.status_code)
+    _observe_connect(provider, marks)
+    _observe_response(provider, res.status_code, elapsed)
+
+    try:
+        yield res
+    finally:
+        await ctx.__aexit__(None, None, None)
+        PROVIDER_SECONDS.observe((provider, "body"), time.perf_counter() - headers_at)
+        PROVIDER_RESPONSE_BYTES.observe((provider,), res.num_bytes_downloaded)
+
+
+async def aiter_body(res, max_bytes, chunk_size=64 * 1024):
+    """Async iter_body() for a response opened with astream()"""
+    declared = res.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        await res.aclose()
+        raise ResponseTooLarge(f"response is {declared} bytes (limit {max_bytes})")
+
+    received = 0
+    async for chunk in res.aiter_bytes(chunk_size):
+        received += len(chunk)
+        if received > max_bytes:
+            await res.aclose()
+            raise ResponseTooLarge(f"response exceeds {max_bytes} bytes")
+        yield chunk
+
+
+async def aget(provider, url, **kwargs):
+    return await arequest(provider, "GET", url, **kwargs)
+
+
+async def apost(provider, url, **kwargs):
+    return await arequest(provider, "POST", url, **kwargs)
+
+
+async def awarm_up(providers=None):
+    """Open one pooled connection per provider on the async clients"""
+    async def warm(provider):
+        try:
+            await get_async_client(provider).head(PROVIDERS[provider]["base"])
+        except Exception as e:
+            print(f"Async warm-up failed for {provider}:", e)
+
+    await asyncio.gather(*(warm(p) for p in (providers or PROVIDERS)))
+
+
+async def aclose():
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,90 @@
+import math
+import os
+from datetime import date
+
+from ranking import CAR_WEIGHTS, FLIGHT_WEIGHTS
+
+
+# ============================================================
+# PROVIDER QUERY PUSHDOWN
+# ============================================================
+# The searches used to fetch a broad result set and narrow it down here.
+# These plans move the constraints a turn already knows into the upstream
+# query instead, so less is transferred, parsed and cached per search:
+#   - Booking: results sorted by price (HOTEL_SORT) under a per-night
+#     price ceiling derived from the stay budget. The ceiling is rounded up
+#     to HOTEL_PRICE_STEP so nearby budgets share cache entries. The exact
+#     budget check stays local: Booking filters per night, the budget is
+#     for the whole stay.
+#   - Amadeus: nonStop=true when the user asked for a direct flight. While
+#     flights are ranked by price alone, at most FLIGHT_MAX_RESULTS offers
+#     (Amadeus returns the cheapest first); with stops/duration in the
+#     weights a pricier direct flight may win, so the provider default
+#     stays. A layover city can't be expressed upstream: those searches
+#     ask for FLIGHT_LAYOVER_MAX_RESULTS and filter locally.
+#   - Priceline: results come sorted by price, so while cars are ranked
+#     by price alone, CAR_RESULTS_LIMIT results are plenty for the top 3.
+# QUERY_PUSHDOWN=0 goes back to the broad queries.
+QUERY_PUSHDOWN = os.getenv("QUERY_PUSHDOWN", "1") == "1"
+FLIGHT_MAX_RESULTS = int(os.getenv("FLIGHT_MAX_RESULTS", "50"))
+FLIGHT_LAYOVER_MAX_RESULTS = int(os.getenv("FLIGHT_LAYOVER_MAX_RESULTS", "250"))
+HOTEL_SORT = os.getenv("HOTEL_SORT", "price")
+HOTEL_PRICE_STEP = int(os.getenv("HOTEL_PRICE_STEP", "50"))
+CAR_RESULTS_LIMIT = int(os.getenv("CAR_RESULTS_LIMIT", "10"))
+
+# What the queries asked for before pushdown
+CAR_RESULTS_MAX = 50
+
+# layover_city answers that mean "no layover at all"
+DIRECT_ANSWERS = {"direct", "nonstop", "non-stop", "non stop", "none", "no", "no layover", "no layovers"}
+
+# (order_by, per-night price ceiling): the broad Booking query
+NO_HOTEL_FILTERS = (None, None)
+
+
+def wants_direct(layover_city):
+    return isinstance(layover_city, str) and layover_city.strip().lower() in DIRECT_ANSWERS
+
+
+def price_only(weights):
+    return {name for name, w in weights.items() if w} <= {"price"}
+
+
+def flight_plan(layover_city=None, weights=FLIGHT_WEIGHTS):
+    """-> {"max_results": n or None, "non_stop": bool} for the Amadeus query"""
+    if not QUERY_PUSHDOWN:
+        return {"max_results": None, "non_stop": False}
+    if layover_city and not wants_direct(layover_city):
+        return {"max_results": FLIGHT_LAYOVER_MAX_RESULTS, "non_stop": False}
+    return {
+        "max_results": FLIGHT_MAX_RESULTS if price_only(weights) else None,
+        "non_stop": wants_direct(layover_city),
+    }
+
+
+def nights(checkin, checkout):
+    try:
+        return max(1, (date.fromisoformat(checkout) - date.fromisoformat(checkin)).days)
+    except (TypeError, ValueError):
+        return 1
+
+
+def hotel_filters(checkin, checkout, budget=None):
+    """-> (order_by, per-night price ceiling) for the Booking query"""
+    if not QUERY_PUSHDOWN:
+        return NO_HOTEL_FILTERS
+    ceiling = None
+    if budget is not None:
+        per_night = budget / nights(checkin, checkout)
+        ceiling = max(HOTEL_PRICE_STEP, math.ceil(per_night / HOTEL_PRICE_STEP) * HOTEL_PRICE_STEP)
+    return HOTEL_SORT or None, ceiling
+
+
+def car_results_limit(weights=CAR_WEIGHTS):
+    """Priceline `limit`: a short price-sorted list is enough for price-only ranking"""
+    if QUERY_PUSHDOWN and price_only(weights):
+        return min(CAR_RESULTS_LIMIT, CAR_RESULTS_MAX)
+    return CAR_RESULTS_MAX
+
+
+CAR_LIMIT = car_results_limit()
@@ -0,0 +1,99 @@
+import heapq
+import os
+
+INF = float("inf")
+
+
+# ============================================================
+# CRITERIA
+# ============================================================
+# name -> (getter, direction). direction +1: lower is better,
+# -1: higher is better. Getters read the numeric fields the offer records
+# precompute at decode time.
+CRITERIA = {
+    "price": (lambda o: o.amount, 1),
+    "rating": (lambda o: _number(getattr(o, "rating", None)), -1),
+    "stops": (lambda o: len(o.stops), 1),
+    "duration": (lambda o: o.minutes, 1),
+}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return INF
+
+
+def parse_weights(spec, default):
+    """"price:1,rating:0.5" -> {"price": 1.0, "rating": 0.5}"""
+    if not spec:
+        return dict(default)
+    weights = {}
+    for part in spec.split(","):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        if name in CRITERIA and value.strip():
+            weights[name] = float(value)
+    return weights or dict(default)
+
+
+# Per-vertical scoring profiles, overridable from .env
+FLIGHT_WEIGHTS = parse_weights(os.getenv("RANK_FLIGHT_WEIGHTS"), {"price": 1.0, "stops": 0.3, "duration": 0.2})
+HOTEL_WEIGHTS = parse_weights(os.getenv("RANK_HOTEL_WEIGHTS"), {"price": 1.0, "rating": 0.5})
+CAR_WEIGHTS = parse_weights(os.getenv("RANK_CAR_WEIGHTS"), {"price": 1.0})
+
+
+# ============================================================
+# TOP-K
+# ============================================================
+def top_k(offers, k, weights):
+    """Best k offers under `weights` (lower score wins), in O(n log k).
+
+    Each criterion is read once per offer and min-max normalized across the
+    candidates, so a weight means the same thing for $80 cars and $800
+    hotels. Missing values rank last for that criterion. Ties keep the
+    provider's order.
+    """
+    offers = list(offers)
+    if not offers or k <= 0:
+        return []
+
+    active = [(CRITERIA[name], w) for name, w in weights.items() if w and name in CRITERIA]
+    if not active:
+        return offers[:k]
+
+    # Single criterion: the raw value already orders correctly
+    if len(active) == 1:
+        (getter, direction), _ = active[0]
+        decorated = []
+        for i, o in enumerate(offers):
+            v = getter(o)
+            decorated.append((v == INF, direction * v if v != INF else 0.0, i, o))
+        return [o for _, _, _, o in heapq.nsmallest(k, decorated)]
+
+    columns = []
+    for (getter, direction), weight in active:
+        values = [getter(o) for o in offers]
+        finite = [v for v in values if v != INF]
+        lo, hi = (min(finite), max(finite)) if finite else (0.0, 0.0)
+        span = hi - lo
+        normalized = []
+        for v in values:
+            if v == INF:
+                normalized.append(1.0)
+            elif span == 0:
+                normalized.append(0.0)
+            elif direction > 0:
+                normalized.append((v - lo) / span)
+            else:
+                normalized.append((hi - v) / span)
+        columns.append((weight, normalized))
+
+    scores = [0.0] * len(offers)
+    for weight, normalized in columns:
+        for i, v in enumerate(normalized):
+            scores[i] += weight * v
+
+    decorated = ((scores[i], i, o) for i, o in enumerate(offers))
+    return [o for _, _, o in heapq.nsmallest(k, decorated)]
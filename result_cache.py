@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ============================================================
+# TTL + LRU CACHE
+# ============================================================
+class TTLCache:
+    """Bounded in-process cache: entries expire after `ttl` seconds and the
+    least recently used entry is evicted once `maxsize` is reached.
+
+    `last_good` (another TTLCache, usually with a much longer ttl) keeps a
+    copy of every value set, for when the provider is down.
+    """
+
+    def __init__(self, maxsize=512, ttl=300, last_good=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._last_good = last_good
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        if self._last_good is not None:
+            self._last_good.set(key, value)
+
+    def last_good(self, key):
+        """Most recent value stored for key, even if expired here (None if unknown)"""
+        return self._last_good.get(key) if self._last_good is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self._last_good is not None:
+            self._last_good.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ============================================================
+# STALE-WHILE-REVALIDATE CACHE
+# ============================================================
+_refresh_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CACHE_REFRESH_WORKERS", "4")),
+    thread_name_prefix="cache-refresh",
+)
+
+
+class SWRCache:
+    """Two-threshold cache for slow searches.
+
+    age < fresh_ttl          -> answer from cache
+    fresh_ttl <= age < stale -> answer from cache, refresh in the background
+    older / missing          -> call fetch() inline and store the result
+
+    fetch() returning None means "nothing usable" and is never cached.
+    `last_good` works as in TTLCache.
+    """
+
+    def __init__(self, maxsize=256, fresh_ttl=300, stale_ttl=1800, last_good=None):
+        self.maxsize = maxsize
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self._last_good = last_good
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def get(self, key, refresh):
+        """Cached value (fresh or stale), or None on a miss.
+
+        A stale hit schedules refresh() in the background (once per key).
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                stored_at, value = item
+                age = now - stored_at
+                if age < self.fresh_ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if age < self.stale_ttl:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        _refresh_pool.submit(self._refresh, key, refresh)
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def get_or_fetch(self, key, fetch):
+        value = self.get(key, fetch)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        if self._last_good is not None:
+            self._last_good.set(key, value)
+
+    def last_good(self, key):
+        """Most recent value stored for key, even past stale_ttl (None if unknown)"""
+        return self._last_good.get(key) if self._last_good is not None else None
+
+    def _refresh(self, key, fetch):
+        try:
+            value = fetch()
+            if value is not None:
+                self.set(key, value)
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            print("Background cache refresh failed:", e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self._last_good is not None:
+            self._last_good.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import json
+import math
+import mmap
+import os
+import random
+import zlib
+from urllib.parse import parse_qs
+
+import gazetteer
+import query_plan
+
+
+# ============================================================
+# LOCAL PROVIDER SIMULATOR
+# ============================================================
+# Stands in for the four upstream APIs so load tests and benchmarks don't
+# spend RapidAPI / Amadeus quota:
+#
+#     python simulator.py --port 8090 [--config simulator.json]
+#     PROVIDER_SIMULATOR_URL=http://127.0.0.1:8090 python app.py
+#
+# Hotels and cars are served from the recorded payloads
+# (hotels_full_response.json, cars_full_response.json). Each file is
+# memory-mapped once at startup and streamed from the map, never re-read
+# per request. Flight offers are generated once from a fixed seed.
+# Geocoding answers from the bundled gazetteer.
+#
+# Per endpoint, the config file sets the latency distribution, the error
+# rate and the payload size (number of results), e.g.
+#
+#     {"hotels": {"latency": {"dist": "lognormal", "median_ms": 600, "p99_ms": 3000},
+#                 "error_rate": 0.02, "error_status": 503, "results": 20, "pages": 5},
+#      "cars":   {"latency": {"dist": "uniform", "min_ms": 200, "max_ms": 900}, "results": 50}}
+#
+# Latency distributions: fixed (ms), uniform (min_ms, max_ms), lognormal
+# (median_ms, p99_ms).
+#
+# The pushed-down query parameters (query_plan.py) are honored like the
+# real APIs do: Amadeus `max` / `nonStop`, Booking `order_by=price` and
+# `categories_filter=price::min-max` (per night), Priceline `limit` and
+# `sort_order=PRICE`. Each distinct filtered payload is built once.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOTELS_FIXTURE = os.path.join(BASE_DIR, "hotels_full_response.json")
+CARS_FIXTURE = os.path.join(BASE_DIR, "cars_full_response.json")
+
+CHUNK_SIZE = 64 * 1024
+HOTEL_PAGE_SIZE = 20
+# Filtered payloads kept per endpoint before the oldest are dropped
+MAX_VARIANTS = 256
+
+DEFAULTS = {
+    "token": {"latency": {"dist": "fixed", "ms": 20}},
+    "flights": {"latency": {"dist": "lognormal", "median_ms": 700, "p99_ms": 3000}, "results": 20},
+    "hotels": {"latency": {"dist": "lognormal", "median_ms": 500, "p99_ms": 2500}, "pages": 5},
+    "cars": {"latency": {"dist": "lognormal", "median_ms": 900, "p99_ms": 4000}},
+    "geocode": {"latency": {"dist": "fixed", "ms": 50}},
+}
+
+# z-score of the 99th percentile of a standard normal
+_Z99 = 2.3263
+
+
+def load_config(path=None):
+    config = {name: dict(values) for name, values in DEFAULTS.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for name, values in json.load(f).items():
+                config.setdefault(name, {}).update(values)
+    return config
+
+
+def sample_latency(spec, rng=random):
+    """Latency spec -> seconds to wait"""
+    spec = spec or {}
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        ms = spec.get("ms", 0)
+    elif dist == "uniform":
+        ms = rng.uniform(spec.get("min_ms", 0), spec.get("max_ms", 0))
+    elif dist == "lognormal":
+        median = spec.get("median_ms", 500)
+        p99 = max(spec.get("p99_ms", median), median)
+        sigma = math.log(p99 / median) / _Z99 if median > 0 else 0
+        ms = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0
+    else:
+        raise ValueError(f"unknown latency distribution: {dist}")
+    return max(0.0, ms) / 1000
+
+
+# ============================================================
+# FIXTURES (built once at startup)
+# ============================================================
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _resized(items, n):
+    """First n items, repeating the list when n is larger"""
+    if n is None or not items:
+        return items
+    return [items[i % len(items)] for i in range(n)]
+
+
+class Fixtures:
+    def __init__(self, config):
+        self.hotels = _map(HOTELS_FIXTURE)
+        self.cars = _map(CARS_FIXTURE)
+
+        # A size override builds one resized payload up front; the request
+        # path still only slices a read-only buffer
+        hotel_results = config["hotels"].get("results")
+        if hotel_results is not None:
+            data = json.loads(self.hotels[:])
+            data["result"] = _resized(data.get("result", []), hotel_results)
+            self.hotels = json.dumps(data).encode()
+
+        car_results = config["cars"].get("results")
+        if car_results is not None:
+            data = json.loads(self.cars[:])
+            results = data["getCarResultsRequest"]["results"]
+            entries = list(results["results_list"].items())
+            results["results_list"] = {
+                f"{key}_{i}" if i >= len(entries) else key: entry
+                for i, (key, entry) in enumerate(_resized(entries, car_results))
+            }
+            self.cars = json.dumps(data).encode()
+
+        self.empty_hotels = json.dumps({"result": []}).encode()
+        self.flights = json.dumps(synthetic_flight_offers(config["flights"].get("results", 20))).encode()
+        self.token = json.dumps({"access_token": "simulator-token", "expires_in": 1799}).encode()
+        self._parsed = {}
+        self._variants = {}
+
+    def variant(self, endpoint, key, build):
+        """Encoded payload for a filtered query: build(parsed full payload), once per key"""
+        variants = self._variants.setdefault(endpoint, {})
+        body = variants.get(key)
+        if body is None:
+            if endpoint not in self._parsed:
+                self._parsed[endpoint] = json.loads(getattr(self, endpoint)[:])
+            if len(variants) >= MAX_VARIANTS:
+                del variants[next(iter(variants))]
+            body = variants[key] = json.dumps(build(self._parsed[endpoint])).encode()
+        return body
+
+
+def _arg(query, name, default=None):
+    return (query.get(name) or [default])[0]
+
+
+def flights_filtered(payload, max_results, non_stop):
+    offers = payload["data"]
+    if non_stop:
+        offers = [o for o in offers if all(len(it["segments"]) == 1 for it in o["itineraries"])]
+    return {**payload, "data": offers[:max_results]}
+
+
+def hotels_filtered(payload, by_price, price_max, nights):
+    """Booking's price filter is per night; min_total_price is for the stay"""
+    hotels = payload.get("result", [])
+    if price_max is not None:
+        hotels = [h for h in hotels if (h.get("min_total_price") or 0) / nights <= price_max]
+    if by_price:
+        hotels = sorted(hotels, key=lambda h: h.get("min_total_price") or float("inf"))
+    return {**payload, "result": hotels}
+
+
+def _car_total(entry):
+    try:
+        return float(entry["price_details"]["base"]["total_price"])
+    except (KeyError, TypeError, ValueError):
+        return float("inf")
+
+
+def cars_filtered(payload, limit, by_price):
+    request = payload["getCarResultsRequest"]
+    results = request["results"]
+    entries = list(results["results_list"].items())
+    if by_price:
+        entries.sort(key=lambda kv: _car_total(kv[1]))
+    results = {**results, "results_list": dict(entries[:limit])}
+    return {**payload, "getCarResultsRequest": {**request, "results": results}}
+
+
+def synthetic_flight_offers(n, seed=7):
+    """Amadeus-shaped flight-offers payload with n offers"""
+    rng = random.Random(seed)
+    airlines = ["AF", "BA", "DL", "LH", "UA", "AA", "KL", "EK"]
+    hubs = ["CDG", "LHR", "FRA", "AMS", "ATL", "ORD", "DXB"]
+    offers = []
+    for i in range(n):
+        stops = rng.choice([0, 0, 1, 1, 2])
+        hours = 6 + stops * 3 + rng.randint(0, 4)
+        segments = [
+            {"departure": {"at": "2026-01-01T08:00:00"}, "arrival": {"iataCode": hub, "at": "2026-01-01T11:00:00"}}
+            for hub in rng.sample(hubs, stops)
+        ]
+        segments.append({"departure": {"at": "2026-01-01T12:00:00"}, "arrival": {"iataCode": "DST", "at": "2026-01-01T20:00:00"}})
+        offers.append({
+            "id": str(i + 1),
+            "price": {"total": f"{rng.uniform(150, 1400):.2f}", "currency": "USD"},
+            "validatingAirlineCodes": [rng.choice(airlines)],
+            "itineraries": [{"duration": f"PT{hours}H{rng.choice([0, 15, 30, 45])}M", "segments": segments}],
+            "travelerPricings": [{"fareDetailsBySegment": [{"cabin": "ECONOMY"}]}],
+        })
+    return {"data": offers}
+
+
+def geocode_payload(text):
+    place = gazetteer.lookup(text)
+    if place is not None and place.lat is not None:
+        lat, lon = place.lat, place.lon
+    else:
+        # Unknown town: stable made-up coordinates
+        h = zlib.crc32((text or "").lower().encode())
+        lat, lon = (h % 12000) / 100 - 60, (h // 12000 % 36000) / 100 - 180
+    return json.dumps({"results": [{"lat": lat, "lon": lon}]}).encode()
+
+
+# ============================================================
+# ASGI APP
+# ============================================================
+ROUTES = {
+    "/v1/security/oauth2/token": "token",
+    "/v2/shopping/flight-offers": "flights",
+    "/properties/list": "hotels",
+    "/v2/cars/resultsRequest": "cars",
+    "/v1/geocode/search": "geocode",
+}
+
+
+class Simulator:
+    def __init__(self, config, seed=None):
+        self.config = config
+        self.fixtures = Fixtures(config)
+        self.rng = random.Random(seed)
+        self.served = {name: 0 for name in ROUTES.values()}
+        self.errors = {name: 0 for name in ROUTES.values()}
+
+    def body_for(self, endpoint, query):
+        f = self.fixtures
+        if endpoint == "token":
+            return f.token
+        if endpoint == "flights":
+            max_results = int(_arg(query, "max", 250))
+            non_stop = _arg(query, "nonStop") == "true"
+            return f.variant("flights", (max_results, non_stop),
+                             lambda p: flights_filtered(p, max_results, non_stop))
+        if endpoint == "hotels":
+            offset = int(_arg(query, "offset", "0") or 0)
+            pages = self.config["hotels"].get("pages", 1)
+            if offset >= pages * HOTEL_PAGE_SIZE:
+                return f.empty_hotels
+            by_price = _arg(query, "order_by") == "price"
+            price = _arg(query, "categories_filter", "")
+            price_max = float(price.rpartition("-")[2]) if price.startswith("price::") else None
+            if not by_price and price_max is None:
+                return f.hotels
+            nights = query_plan.nights(_arg(query, "arrival_date"), _arg(query, "departure_date"))
+            return f.variant("hotels", (by_price, price_max, nights),
+                             lambda p: hotels_filtered(p, by_price, price_max, nights))
+        if endpoint == "cars":
+            limit = _arg(query, "limit")
+            by_price = _arg(query, "sort_order") == "PRICE"
+            if limit is None and not by_price:
+                return f.cars
+            limit = int(limit) if limit else None
+            return f.variant("cars", (limit, by_price), lambda p: cars_filtered(p, limit, by_price))
+        return geocode_payload((query.get("text") or [""])[0])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        endpoint = ROUTES.get(scope["path"])
+        if scope["method"] == "HEAD" or endpoint is None:
+            # warm-up HEADs and unknown paths
+            await self.respond(send, 200 if endpoint or scope["path"] == "/" else 404, b"")
+            return
+
+        spec = self.config.get(endpoint, {})
+        await asyncio.sleep(sample_latency(spec.get("latency"), self.rng))
+
+        self.served[endpoint] += 1
+        if self.rng.random() < spec.get("error_rate", 0):
+            self.errors[endpoint] += 1
+            status = spec.get("error_status", 500)
+            await self.respond(send, status, json.dumps({"message": "simulated error", "status": status}).encode())
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        await self.respond(send, 200, self.body_for(endpoint, query))
+
+    async def respond(self, send, status, body):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        # Large payloads go out in chunks, like a real upstream
+        for start in range(0, len(body), CHUNK_SIZE):
+            await send({
+                "type": "http.response.body",
+                "body": bytes(body[start:start + CHUNK_SIZE]),
+                "more_body": start + CHUNK_SIZE < len(body),
+            })
+        if not body:
+            await send({"type": "http.response.body", "body": b""})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Amadeus, Booking, Priceline and Geoapify APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--config", help="JSON file with per-endpoint latency / error_rate / results settings")
+    parser.add_argument("--seed", type=int, help="seed for latencies and errors (reproducible runs)")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    app = Simulator(load_config(args.config), seed=args.seed)
+    print(f"Provider simulator on http://{args.host}:{args.port} "
+          f"(set PROVIDER_SIMULATOR_URL=http://{args.host}:{args.port} for app.py)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
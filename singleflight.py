@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+# ============================================================
+# SINGLE-FLIGHT (coalesce identical upstream calls)
+# ============================================================
+# While a fetch for a key is running, later callers with the same key
+# wait for it and share its result (or its exception) instead of sending
+# their own identical request. Upstream load then grows with the number
+# of distinct queries, not with the number of users asking at once.
+# Nothing is remembered after the call finishes; that is the caches' job.
+
+
+class SingleFlight:
+    """Thread version: the first caller runs fn() inline, the rest wait"""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
+
+
+class AsyncSingleFlight:
+    """Coroutine version (ASGI mode): one task per key, awaited by everyone"""
+
+    def __init__(self):
+        self._calls = {}  # key -> Task
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.shared += 1
+        # A caller that gives up must not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # raised to the awaiting callers; don't warn on the rest
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
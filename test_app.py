@@ -0,0 +1,49 @@
+import pytest
+import requests
+
+import app
+
+
+def reply_text(body):
+    return body["fulfillment_response"]["messages"][0]["text"]["text"][0]
+
+
+def test_select_with_an_expired_handle_asks_to_search_again():
+    for tag, params in [
+        ("Select_Flight_Details", {"selected_flight_id": 1, "flight_options_ref": "expired"}),
+        ("Select_Hotel_Details", {"number": 2, "hotel_options_ref": "expired"}),
+        ("Select_Car_Details", {"number": 1}),
+    ]:
+        body = app.dispatch(tag, params)
+        assert reply_text(body) == app.OPTIONS_EXPIRED
+        assert body["sessionInfo"]["parameters"] == {}
+
+
+def test_select_resolves_the_stored_option():
+    ref = app.option_store.put([{"airline": "AF", "class": "ECONOMY", "price": "120"}])
+    body = app.dispatch("Select_Flight_Details", {"selected_flight_id": 1, "flight_options_ref": ref})
+    assert body["sessionInfo"]["parameters"]["selected_flight_airline"] == "AF"
+
+
+def test_legacy_flat_options_still_resolve():
+    body = app.dispatch("Select_Car_Details", {"number": 1, "car_opt_1_vendor": "Hertz"})
+    assert body["sessionInfo"]["parameters"]["selected_car_vendor"] == "Hertz"
+
+
+
+@pytest.mark.parametrize("payload", [b'{"result": "unavailable"}', b'{"result": [["not", "a", "hotel"]]}', b"null"])
+def test_malformed_hotel_payload_gets_the_fallback_reply(monkeypatch, payload):
+    def booking_reply(*args, **kwargs):
+        res = requests.Response()
+        res.status_code = 200
+        res._content = payload
+        return res
+
+    monkeypatch.setattr(app.providers, "get", booking_reply)
+    app.hotel_cache.clear()
+    app.hotel_any_budget.clear()
+    params = {"hotel_city": "Paris", "check_in": "2031-05-01", "check_out": "2031-05-03"}
+
+    reply, details = app.handle_hotel_options(params)
+    assert reply.startswith("Hotel search failed.")
+    assert details == {}
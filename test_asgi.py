@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+import app
+import asgi
+
+
+class RecordingStore:
+    """option_store stand-in that notes which thread reads and writes it"""
+
+    def __init__(self, store):
+        self.store = store
+        self.threads = []
+
+    def get(self, handle):
+        self.threads.append(threading.current_thread())
+        return self.store.get(handle)
+
+    def put(self, options):
+        self.threads.append(threading.current_thread())
+        return self.store.put(options)
+
+
+def test_option_store_is_used_off_the_event_loop(monkeypatch):
+    store = RecordingStore(app.option_store)
+    monkeypatch.setattr(app, "option_store", store)
+    ref = store.store.put([{"airline": "AF", "class": "ECONOMY", "price": "120"}])
+
+    async def turns():
+        select = await asgi.dispatch_async("Select_Flight_Details", {"selected_flight_id": 1, "flight_options_ref": ref})
+        cards = await asgi.dispatch_async("Hotel_Options", {})  # missing details: reply only, no search
+        return select, cards, threading.current_thread()
+
+    select, _, loop_thread = asyncio.run(turns())
+    assert select["sessionInfo"]["parameters"]["selected_flight_airline"] == "AF"
+    assert store.threads and loop_thread not in store.threads
@@ -0,0 +1,61 @@
+import json
+
+import app
+from capture import REDACTED, TrafficCapture, redact
+
+FIELDS = frozenset({"username", "useremail"})
+
+
+def webhook_req(tag, params):
+    return {
+        "fulfillmentInfo": {"tag": tag},
+        "sessionInfo": {"session": "projects/p/sessions/s1", "parameters": params},
+    }
+
+
+def summary(tag, params):
+    if tag != "Booking_Confirmation":
+        return None
+    text = f"• Name: {params.get('username')}\n• Email: {params.get('useremail')}\n"
+    return {"fulfillment_response": {"messages": [{"text": {"text": [text]}}]}}
+
+
+def captured(tmp_path, req, response, render=summary):
+    traffic = TrafficCapture(path=str(tmp_path / "capture.jsonl"), redact_fields="username,useremail", render=render)
+    traffic.record(req, response, {"total": 0.01})
+    traffic.flush()
+    return json.loads((tmp_path / "capture.jsonl").read_text(encoding="utf-8"))
+
+
+def test_redact_masks_fields_at_any_depth():
+    value = {"username": "Jo", "trip": [{"useremail": "jo@x.io", "city": "Jo"}], "userdob": ""}
+    assert redact(value, FIELDS | {"userdob"}) == {
+        "username": REDACTED,
+        "trip": [{"useremail": REDACTED, "city": "Jo"}],
+        "userdob": "",
+    }
+
+
+def test_short_name_is_redacted_in_the_confirmation_summary(tmp_path):
+    params = {"username": "Jo", "useremail": "jo@x.io"}
+    entry = captured(tmp_path, webhook_req("Booking_Confirmation", params), summary("Booking_Confirmation", params))
+
+    text = entry["response"]["fulfillment_response"]["messages"][0]["text"]["text"][0]
+    assert text == f"• Name: {REDACTED}\n• Email: {REDACTED}\n"
+    assert entry["request"]["sessionInfo"]["parameters"] == {"username": REDACTED, "useremail": REDACTED}
+
+
+def test_other_replies_are_kept(tmp_path):
+    params = {"username": "Jo", "destination_city": "Jo"}
+    response = {"fulfillment_response": {"messages": [{"text": {"text": ["Flights to Jo"]}}]}}
+    entry = captured(tmp_path, webhook_req("Flight_Options", params), response)
+
+    assert entry["response"] == response
+    assert entry["request"]["sessionInfo"]["parameters"]["destination_city"] == "Jo"
+
+
+def test_app_renders_confirmations_only():
+    params = {"username": REDACTED, "selected_hotel_name": "Ritz"}
+    body = app.capture_render("Hotel_Booking_Confirmation", params)
+    assert f"• Name: {REDACTED}" in body["fulfillment_response"]["messages"][0]["text"]["text"][0]
+    assert app.capture_render("Hotel_Options", params) is None
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from car_parser import CarPayloadError, CarResultsParser, parse_cars
+
+
+def car(vendor, total):
+    return {
+        "partner": {"name": vendor},
+        "car": {"example": "Toyota Corolla", "description": "Compact", "images": {"SIZE268X144": "img"}},
+        "price_details": {"base": {"price": "40", "total_price": total, "symbol": "$"}},
+        "pickup": {"location": "LAX"},
+        "dropoff": {"location": "LAX"},
+    }
+
+
+def body(results_list, **extra):
+    payload = {"getCarResultsRequest": {"results": {"results_list": results_list, **extra}}}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+PAYLOAD = body({"r1": car("Hertz", "120"), "r2": car("Avis – Düsseldorf", "99.5")}, count=2)
+
+
+def test_whole_body():
+    cars = parse_cars(PAYLOAD)
+    assert [(c.result_key, c.vendor, c.amount) for c in cars] == [
+        ("r1", "Hertz", 120.0),
+        ("r2", "Avis – Düsseldorf", 99.5),
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64])
+def test_any_chunking_gives_the_same_cars(size):
+    chunks = [PAYLOAD[i:i + size] for i in range(0, len(PAYLOAD), size)]
+    cars = parse_cars(chunks)
+    assert [c.vendor for c in cars] == ["Hertz", "Avis – Düsseldorf"]
+
+
+def test_stops_reading_after_results_list():
+    parser = CarResultsParser()
+    parser.feed(body({"r1": car("Hertz", "120")}))
+    assert parser.done
+    parser.feed(b"garbage that is never parsed")
+    assert [c.vendor for c in parser.close()] == ["Hertz"]
+
+
+@pytest.mark.parametrize("payload", [
+    b'{"getCarResultsRequest": {"error": "no cars"}}',
+    body({}),
+])
+def test_missing_or_empty_results(payload):
+    assert parse_cars(payload) is None
+
+
+@pytest.mark.parametrize("payload", [
+    PAYLOAD[:-20],
+    b'{"getCarResultsRequest": {"results": {"results_list": {"r1" 1}}}}',
+])
+def test_malformed_body(payload):
+    with pytest.raises(CarPayloadError):
+        parse_cars(payload)
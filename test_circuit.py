@@ -0,0 +1,108 @@
+import pytest
+import requests
+
+import circuit
+from circuit import BulkheadFull, CircuitBreaker, CircuitOpen
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def breaker(**kw):
+    kw = {"window": 60, "min_calls": 4, "error_rate": 0.5, "slow_call": 5, "slow_rate": 0.8,
+          "open_for": 30, "half_open_calls": 1, **kw}
+    return CircuitBreaker("test", **kw)
+
+
+def call(b, ok=True, seconds=0.1, limit=10):
+    b.acquire(limit)
+    b.release(ok, seconds)
+
+
+def test_stays_closed_below_min_calls(clock):
+    b = breaker()
+    for _ in range(3):
+        call(b, ok=False)
+    assert b.state == circuit.CLOSED
+
+
+def test_opens_on_error_rate_and_rejects(clock):
+    b = breaker()
+    call(b), call(b), call(b, ok=False), call(b, ok=False)
+    assert b.state == circuit.OPEN
+    with pytest.raises(CircuitOpen) as e:
+        b.acquire(10)
+    assert isinstance(e.value, requests.ConnectionError)
+    assert b.stats()["rejected"] == 1
+
+
+def test_opens_on_slow_calls(clock):
+    b = breaker()
+    for _ in range(4):
+        call(b, seconds=6)
+    assert b.state == circuit.OPEN
+
+
+def test_old_calls_leave_the_window(clock):
+    b = breaker()
+    for _ in range(3):
+        call(b, ok=False)
+    clock[0] += 61
+    call(b), call(b), call(b), call(b, ok=False)
+    assert b.state == circuit.CLOSED
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    b = breaker()
+    for _ in range(4):
+        call(b, ok=False)
+    clock[0] += 31
+
+    b.acquire(10)  # the probe
+    assert b.state == circuit.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        b.acquire(10)  # only one probe at a time
+    b.release(False, 0.1)
+    assert b.state == circuit.OPEN and b.opened == 2
+
+    clock[0] += 31
+    call(b)
+    assert b.state == circuit.CLOSED
+    assert b.stats()["window_calls"] == 0
+
+
+def test_slow_probe_reopens(clock):
+    b = breaker()
+    for _ in range(4):
+        call(b, ok=False)
+    clock[0] += 31
+    call(b, seconds=6)
+    assert b.state == circuit.OPEN
+
+
+def test_bulkhead_limits_calls_in_flight(clock):
+    b = breaker()
+    b.acquire(2)
+    b.acquire(2)
+    with pytest.raises(BulkheadFull):
+        b.acquire(2)
+    b.release(True, 0.1)
+    b.acquire(2)
+    assert b.stats()["in_flight"] == 2
+    assert b.stats()["bulkhead_rejected"] == 1
+
+
+def test_bulkhead_rejection_frees_the_probe(clock):
+    b = breaker()
+    b.acquire(1)  # a call still in flight when the circuit opens
+    for _ in range(4):
+        call(b, ok=False)
+    clock[0] += 31
+    with pytest.raises(BulkheadFull):
+        b.acquire(1)
+    b.acquire(2)  # the probe slot is free again
+    assert b.state == circuit.HALF_OPEN
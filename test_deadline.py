@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+import requests
+
+from deadline import BackgroundSearches, Deadline, DeadlineExceeded
+
+
+def test_timeout_is_clamped_to_the_budget():
+    d = Deadline(reply_in=1, grace=2)
+    assert 2.9 < d.budget() <= 3
+    assert d.timeout(10) <= 3
+    assert d.timeout(0.5) == 0.5
+    connect, read = d.timeout((0.5, 30))
+    assert connect == 0.5 and read <= 3
+    assert 2.9 < d.timeout(None) <= 3
+
+
+def test_exhausted_budget_raises_a_requests_timeout():
+    d = Deadline(reply_in=0, grace=0)
+    assert d.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded) as e:
+        d.timeout(5)
+    assert isinstance(e.value, requests.Timeout)
+
+
+def test_search_outlives_its_turn_and_is_joined():
+    searches = BackgroundSearches(workers=2)
+    release = threading.Event()
+    calls = []
+
+    def search():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    assert searches.run("k", search, Deadline(reply_in=0.05)) == (False, None)
+    assert searches.stats()["in_flight"] == 1
+    release.set()
+    assert searches.run("k", search, Deadline(reply_in=5)) == (True, "result")
+    assert len(calls) == 1
+    assert searches.stats()["joined"] == 1
+
+
+def test_search_errors_reach_the_caller():
+    searches = BackgroundSearches(workers=1)
+
+    def search():
+        raise requests.ConnectionError("down")
+
+    with pytest.raises(requests.ConnectionError):
+        searches.run("k", search, Deadline(reply_in=5))
+    assert searches.stats()["in_flight"] == 0
@@ -0,0 +1,68 @@
+import pytest
+
+import gazetteer
+from gazetteer import Gazetteer, edit_distance, normalize
+
+
+@pytest.fixture(scope="module")
+def gaz():
+    return gazetteer.get_gazetteer()
+
+
+@pytest.mark.parametrize("typed, city", [
+    ("Barcelna", "barcelona"),
+    ("San Fransisco", "san francisco"),
+    ("Los Angelos", "los angeles"),
+    ("Chicgo", "chicago"),
+])
+def test_typos_resolve(gaz, typed, city):
+    assert gaz.lookup(typed).name == city
+
+
+@pytest.mark.parametrize("typed", [
+    "Newark", "Yorkshire", "Bern", "Paris Texas",
+    "Cork", "Lome", "Nome", "Rhome", "Bari", "Port", "Vice", "Manchester NH",
+])
+def test_lookalike_towns_are_not_matched(gaz, typed):
+    assert gaz.lookup(typed) is None
+
+
+def test_exact_and_prefix(gaz):
+    assert gaz.lookup("NewYork").metro == "NYC"
+    assert gaz.lookup("new-york").metro == "NYC"
+    assert gaz.lookup("san fran").name == "san francisco"
+    assert gaz.lookup("Tokio").name == "tokyo"
+
+
+def test_equally_close_cities_are_ambiguous():
+    gaz = Gazetteer([
+        ("cordoba", [], "ODB", "ODB", None, None, None),
+        ("cordova", [], "CDV", "CDV", None, None, None),
+    ])
+    assert gaz.fuzzy("cordoxa") == (None, None)
+    assert gaz.fuzzy("corrdoba")[0].name == "cordoba"
+
+
+def test_short_names_are_exact_only(gaz):
+    assert gaz.fuzzy("Rme") == (None, None)
+    assert gaz.fuzzy("Sydny") == (None, None)
+    assert gaz.fuzzy("Yorkk") == (None, None)  # short alias of new york
+
+
+def test_first_letter_and_extra_words_must_match():
+    gaz = Gazetteer([("manchester", [], "MAN", "MAN", None, None, None)])
+    assert gaz.fuzzy("manchestr")[0].name == "manchester"
+    assert gaz.fuzzy("nanchester") == (None, None)
+    assert gaz.fuzzy("manchester nh") == (None, None)
+
+
+def test_edit_distance():
+    assert edit_distance("tokio", "tokyo", 1) == 1
+    assert edit_distance("berlni", "berlin", 1) == 1  # swapped letters
+    assert edit_distance("bern", "berlin", 1) == 2
+    assert edit_distance("newark", "newyork", 3) == 2
+
+
+def test_normalize():
+    assert normalize(" Zürich,  ") == "zurich"
+    assert normalize("St. Louis") == "st louis"
@@ -0,0 +1,52 @@
+import pytest
+
+from imagecache import ImageCache, allowed_url
+
+HOSTS = ("bstatic.com", "pclncdn.com")
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    cache = ImageCache(base="https://bot.example", root=str(tmp_path), allowed_hosts="bstatic.com,pclncdn.com")
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("fetched a URL outside the allowlist")
+
+    monkeypatch.setattr(cache._session, "get", no_network)
+    return cache
+
+
+@pytest.mark.parametrize("url", [
+    "http://169.254.169.254/latest/meta-data/iam/security-credentials/",
+    "https://169.254.169.254/latest/meta-data/",
+    "http://cf.bstatic.com/xdata/images/hotel/1.jpg",
+    "https://cf.bstatic.com.evil.example/1.jpg",
+    "https://cf.bstatic.com@169.254.169.254/1.jpg",
+    "https://cf.bstatic.com:8443/1.jpg",
+    "https://notbstatic.com/1.jpg",
+    "file:///etc/passwd",
+])
+def test_urls_outside_the_allowlist_are_never_fetched(images, url):
+    assert not allowed_url(url, HOSTS)
+    assert images.card_url(url) is None
+    images.warm([url])
+    key = images.key_for(url)
+    assert images._fetch(key, url) is None
+    assert images._meta.get(key) is None
+    assert images.load(key)[0] == 404
+    assert images.stats()["rejected"] == 2
+
+
+def test_provider_cdn_urls_are_proxied(images, monkeypatch):
+    queued = []
+    monkeypatch.setattr(images, "_fetch_async", lambda key, url: queued.append(url))
+    url = "https://cf.bstatic.com/xdata/images/hotel/max500/1.jpg"
+
+    assert images.card_url(url) == f"https://bot.example/img/{images.key_for(url)}"
+    assert queued == [url]
+    assert allowed_url("https://s1.pclncdn.com/rc/car.png", HOSTS)
+
+
+def test_proxy_off_leaves_urls_alone(tmp_path):
+    cache = ImageCache(base="", root=str(tmp_path))
+    assert cache.card_url("http://169.254.169.254/x") == "http://169.254.169.254/x"
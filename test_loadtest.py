@@ -0,0 +1,35 @@
+import time
+
+import loadtest
+
+
+def test_pacer_keeps_the_whole_backlog():
+    pacer = loadtest.Pacer(qps=1000)
+    time.sleep(0.1)  # ~100 slots come due with nobody sending
+
+    slots = [pacer.slot() for _ in range(50)]
+
+    assert slots == [pacer.start + i * pacer.interval for i in range(50)]
+    stats = pacer.stats()
+    assert stats["sent"] == 50
+    assert stats["late"] >= 40
+    assert stats["max_lag_ms"] >= 50
+
+
+def test_pacer_counts_missed_sends():
+    pacer = loadtest.Pacer(qps=100, until=time.perf_counter() + 0.1)
+    pacer.slot()
+    time.sleep(0.15)
+
+    stats = pacer.stats()
+    assert stats["scheduled"] >= 10
+    assert stats["missed"] == stats["scheduled"] - 1
+    assert stats["achieved_qps"] < stats["target_qps"]
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([7], 99) == 7
+    assert loadtest.percentile([], 50) is None
@@ -0,0 +1,45 @@
+import time
+
+from option_store import OptionStore
+
+OPTIONS = [{"airline": "AF", "price": "120.50"}, {"airline": "LH", "price": "130"}]
+
+
+def test_put_and_get():
+    store = OptionStore(path="", ttl=60)
+    handle = store.put(OPTIONS)
+    assert isinstance(handle, str) and len(handle) == 12
+    assert store.get(handle) == OPTIONS
+    assert store.put(OPTIONS) != handle
+
+
+def test_unknown_or_bad_handles():
+    store = OptionStore(path="", ttl=60)
+    for handle in (None, "", 42, "nope"):
+        assert store.get(handle) is None
+
+
+def test_expired_handle(monkeypatch):
+    store = OptionStore(path="", ttl=1)
+    handle = store.put(OPTIONS)
+    later = time.monotonic() + 2
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert store.get(handle) is None
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "options.sqlite3")
+    handle = OptionStore(path=path, ttl=60).put(OPTIONS)
+
+    other = OptionStore(path=path, ttl=60)
+    assert other.get(handle) == OPTIONS
+    assert other.get(handle) == OPTIONS
+    assert other.stats()["db_hits"] == 1
+
+
+def test_sqlite_rows_expire(tmp_path, monkeypatch):
+    path = str(tmp_path / "options.sqlite3")
+    handle = OptionStore(path=path, ttl=1).put(OPTIONS)
+    later = time.time() + 2
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert OptionStore(path=path, ttl=1).get(handle) is None
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import httpx
+import pytest
+import requests
+
+import providers
+
+
+def requests_response(body, status=502):
+    res = requests.Response()
+    res.status_code = status
+    res._content = body
+    return res
+
+
+@pytest.mark.parametrize("res", [
+    requests_response(b"<html>Bad gateway</html>"),
+    httpx.Response(502, content=b"<html>Bad gateway</html>"),
+])
+def test_non_json_reply_is_a_request_exception(res):
+    with pytest.raises(providers.BadPayload) as e:
+        providers.json_body("booking", res)
+    assert isinstance(e.value, requests.RequestException)
+    assert "HTTP 502" in str(e.value)
+
+
+def test_json_reply():
+    assert providers.json_body("booking", httpx.Response(200, json={"result": []})) == {"result": []}
+
+
+@pytest.mark.parametrize("base, port", [
+    ("https://booking-com.p.rapidapi.com", 443),
+    ("http://127.0.0.1:8090/booking", 8090),
+    ("http://simulator.local/booking", 80),
+])
+def test_warm_up_resolves_the_port_of_the_base_url(monkeypatch, base, port):
+    resolved = []
+    monkeypatch.setitem(providers.PROVIDERS, "booking", {**providers.PROVIDERS["booking"], "base": base})
+    monkeypatch.setattr(providers.socket, "getaddrinfo", lambda host, p: resolved.append((host, p)))
+    monkeypatch.setattr(providers.get_session("booking"), "head", lambda *a, **kw: None)
+
+    providers.warm_up(["booking"], background=False)
+    assert resolved == [(providers.urlsplit(base).hostname, port)]
+
+
+def test_importing_app_opens_no_connections():
+    code = (
+        "import providers\n"
+        "def refuse(*a, **kw): raise AssertionError('warm-up at import')\n"
+        "providers.warm_up = refuse\n"
+        "import app\n"
+    )
+    env = {**os.environ, "AMADEUS_API_KEY": "", "AMADEUS_API_SECRET": "", "OPTION_STORE_PATH": ""}
+    env.pop("HTTP_WARMUP", None)
+    proc = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          env=env, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,33 @@
+import query_plan
+from query_plan import car_results_limit, flight_plan, hotel_filters, nights
+
+
+def test_flight_max_only_for_price_only_ranking():
+    assert flight_plan(None, {"price": 1.0}) == {"max_results": query_plan.FLIGHT_MAX_RESULTS, "non_stop": False}
+    assert flight_plan(None, {"price": 1.0, "stops": 0.3, "duration": 0.2}) == {"max_results": None, "non_stop": False}
+    assert flight_plan(None, {"price": 1.0, "stops": 0})["max_results"] == query_plan.FLIGHT_MAX_RESULTS
+
+
+def test_flight_direct_and_layover():
+    mixed = {"price": 1.0, "stops": 0.3}
+    assert flight_plan("direct", mixed) == {"max_results": None, "non_stop": True}
+    assert flight_plan(" Non-Stop ", {"price": 1.0})["non_stop"] is True
+    assert flight_plan("Frankfurt", mixed) == {"max_results": query_plan.FLIGHT_LAYOVER_MAX_RESULTS, "non_stop": False}
+
+
+def test_car_limit():
+    assert car_results_limit({"price": 1.0}) == query_plan.CAR_RESULTS_LIMIT
+    assert car_results_limit({"price": 1.0, "rating": 0.5}) == query_plan.CAR_RESULTS_MAX
+
+
+def test_nights():
+    assert nights("2026-05-01", "2026-05-04") == 3
+    assert nights("2026-05-04", "2026-05-04") == 1
+    assert nights(None, "bad") == 1
+
+
+def test_hotel_price_ceiling_rounds_up_per_night():
+    order_by, ceiling = hotel_filters("2026-05-01", "2026-05-04", 400)
+    assert order_by == query_plan.HOTEL_SORT
+    assert ceiling == 150
+    assert hotel_filters("2026-05-01", "2026-05-04", None)[1] is None
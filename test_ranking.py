@@ -0,0 +1,49 @@
+from offers import FlightOffer, HotelOffer
+from ranking import parse_weights, top_k
+
+
+def flight(price, stops=(), duration="PT2H"):
+    return FlightOffer("XX", "ECONOMY", price, "d", "a", stops, duration)
+
+
+def test_empty_and_zero_k():
+    assert top_k([], 3, {"price": 1}) == []
+    assert top_k([flight("10")], 0, {"price": 1}) == []
+
+
+def test_single_criterion_ties_keep_provider_order():
+    offers = [flight("20"), flight("10"), flight("10"), flight("30")]
+    assert top_k(offers, 3, {"price": 1}) == [offers[1], offers[2], offers[0]]
+
+
+def test_missing_values_rank_last():
+    offers = [flight("N/A"), flight("50"), flight(None), flight("40")]
+    assert top_k(offers, 4, {"price": 1}) == [offers[3], offers[1], offers[0], offers[2]]
+
+
+def test_higher_rating_wins():
+    hotels = [HotelOffer("a", "7.1", "100"), HotelOffer("b", "9.0", "100"), HotelOffer("c", None, "100")]
+    assert top_k(hotels, 3, {"rating": 1}) == [hotels[1], hotels[0], hotels[2]]
+
+
+def test_weights_trade_price_against_stops():
+    cheap_two_stops = flight("100", stops=("FRA", "IST"))
+    direct = flight("120")
+    assert top_k([cheap_two_stops, direct], 1, {"price": 1}) == [cheap_two_stops]
+    assert top_k([cheap_two_stops, direct], 1, {"price": 1, "stops": 2}) == [direct]
+
+
+def test_equal_values_do_not_divide_by_zero():
+    offers = [flight("10"), flight("10")]
+    assert top_k(offers, 2, {"price": 1, "duration": 1}) == offers
+
+
+def test_no_active_weights_keeps_provider_order():
+    offers = [flight("30"), flight("10")]
+    assert top_k(offers, 1, {"price": 0, "bogus": 1}) == [offers[0]]
+
+
+def test_parse_weights():
+    assert parse_weights("price:1, Rating:0.5", {"price": 1.0}) == {"price": 1.0, "rating": 0.5}
+    assert parse_weights("bogus:1,price:", {"price": 1.0}) == {"price": 1.0}
+    assert parse_weights("", {"stops": 2.0}) == {"stops": 2.0}